@@ -0,0 +1,24 @@
+from django.db import models
+
+
+class CacheEntry(models.Model):
+    """
+    Persistent cache tier shared by all worker processes.
+    Entries are grouped by namespace (e.g. "llm") and expire at `expires_at`.
+    """
+    namespace = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    value = models.JSONField(default=dict)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['namespace', 'key']
+        indexes = [
+            models.Index(fields=['namespace', 'expires_at']),
+        ]
+        verbose_name_plural = "Cache Entries"
+
+    def __str__(self):
+        return f"{self.namespace}:{self.key}"
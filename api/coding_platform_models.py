@@ -74,6 +74,47 @@ class LeetCodeAnalysisHistory(models.Model):
         return f"{self.employee_identifier} - {self.analyzed_at.strftime('%Y-%m-%d %H:%M')}"
 
 
+class LeetCodeLatestSnapshot(models.Model):
+    """
+    Denormalized copy of the newest LeetCodeAnalysisHistory row per (company, employee_identifier).
+    Written in the same transaction as the snapshot (employee_sync_service.record_snapshot), so
+    read paths look up an employee's latest stats by key instead of sorting their history.
+    Rebuild with `python manage.py rebuild_latest_snapshots`.
+    """
+    company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='leetcode_latest_snapshots')
+    employee_identifier = models.CharField(max_length=255)
+    history = models.OneToOneField(LeetCodeAnalysisHistory, on_delete=models.CASCADE, related_name='latest_snapshot')
+
+    # Copied from the history row
+    analyzed_at = models.DateTimeField()
+    total_solved = models.IntegerField(default=0)
+    easy_solved = models.IntegerField(default=0)
+    medium_solved = models.IntegerField(default=0)
+    hard_solved = models.IntegerField(default=0)
+    problem_solving_score = models.IntegerField(default=0)
+    ranking = models.IntegerField(default=0)
+    acceptance_rate = models.FloatField(default=0.0)
+    current_streak = models.IntegerField(default=0)
+    max_streak = models.IntegerField(default=0)
+    activity_status = models.CharField(max_length=20, blank=True, null=True)
+
+    class Meta:
+        unique_together = ['company', 'employee_identifier']
+        indexes = [
+            models.Index(fields=['company', '-analyzed_at']),
+        ]
+
+    # Columns copied from LeetCodeAnalysisHistory
+    COPIED_FIELDS = (
+        'analyzed_at', 'total_solved', 'easy_solved', 'medium_solved', 'hard_solved',
+        'problem_solving_score', 'ranking', 'acceptance_rate', 'current_streak', 'max_streak',
+        'activity_status',
+    )
+
+    def __str__(self):
+        return f"{self.employee_identifier} (latest {self.analyzed_at.strftime('%Y-%m-%d %H:%M')})"
+
+
 class Employee(models.Model):
     """
     Manages employee profiles for companies to track problem-solving progress.
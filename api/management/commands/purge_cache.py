@@ -0,0 +1,36 @@
+"""
+Management command to purge expired (and over-cap) rows from the persistent cache tier.
+Each worker also purges in the background; this is for cron or after a deploy.
+
+Usage:
+    python manage.py purge_cache
+    python manage.py purge_cache --namespace leetcode
+    python manage.py purge_cache --namespace leetcode:lease
+"""
+from django.core.management.base import BaseCommand
+from api.services.cache import purge_persistent_caches
+
+# Import the services so their caches register themselves with the purger
+from api.services.leetcode_service import LeetCodeService  # noqa: F401
+from api.services.hackerrank_service import HackerRankService  # noqa: F401
+from api.services.recommendation_service import llm_cache  # noqa: F401
+
+
+class Command(BaseCommand):
+    help = 'Purge expired entries from the persistent upstream/LLM cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--namespace',
+            type=str,
+            help='Purge only one cache namespace (e.g. leetcode, hackerrank, llm, leetcode:lease)',
+        )
+
+    def handle(self, *args, **options):
+        removed = purge_persistent_caches(options.get('namespace'))
+        if not removed:
+            self.stdout.write(self.style.WARNING('No matching caches.'))
+            return
+        for namespace, count in removed.items():
+            self.stdout.write(f'{namespace}: {count} entries removed')
+        self.stdout.write(self.style.SUCCESS('Cache purge completed'))
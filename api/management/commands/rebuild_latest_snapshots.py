@@ -0,0 +1,27 @@
+"""
+Management command to rebuild the per-employee latest-snapshot table (LeetCodeLatestSnapshot)
+from LeetCodeAnalysisHistory. Snapshots keep it up to date as they are written; run this after
+editing or deleting history rows directly, or to repair it.
+
+Usage:
+    python manage.py rebuild_latest_snapshots
+    python manage.py rebuild_latest_snapshots --company-id <id>
+"""
+from django.core.management.base import BaseCommand
+
+from api.services.employee_sync_service import rebuild_latest_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the latest LeetCode snapshot per employee from analysis history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company-id',
+            type=str,
+            help='Rebuild only the rows of a specific company',
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_latest_snapshots(options.get('company_id'))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} latest snapshot(s)'))
@@ -6,13 +6,14 @@ Usage:
     python manage.py sync_employee_profiles
     python manage.py sync_employee_profiles --company-id <uuid>
     python manage.py sync_employee_profiles --employee-id <uuid>
+    python manage.py sync_employee_profiles --incremental
 """
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta
-from api.coding_platform_models import Employee, LeetCodeAnalysisHistory
+from api.coding_platform_models import Employee
 from api.services.leetcode_service import LeetCodeService
-from api.services.coding_profile_analysis_service import CodingProfileAnalysisService
+from api.services.employee_sync_service import has_new_activity, latest_snapshot, mark_synced, record_snapshot
+from concurrent.futures import wait
 import logging
 
 logger = logging.getLogger(__name__)
@@ -37,11 +38,29 @@ class Command(BaseCommand):
             action='store_true',
             help='Force sync even if not due yet',
         )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Bypass the LeetCode profile cache and always fetch from upstream',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Probe recent activity first and only refetch/rescore employees whose stats changed',
+        )
+        parser.add_argument(
+            '--wait-for-ai',
+            action='store_true',
+            help='Generate AI recommendations inline while fetching instead of in the background',
+        )
 
     def handle(self, *args, **options):
         company_id = options.get('company_id')
         employee_id = options.get('employee_id')
         force = options.get('force', False)
+        wait_for_ai = options.get('wait_for_ai', False)
+        no_cache = options.get('no_cache', False)
+        incremental = options.get('incremental', False)
         
         # Build query
         employees = Employee.objects.filter(is_active=True, auto_sync_enabled=True)
@@ -63,17 +82,49 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('No employees to sync.'))
             return
         
+        upstream = LeetCodeService.upstream_status()
+        if not LeetCodeService.upstream_available():
+            self.stdout.write(self.style.ERROR(
+                f'LeetCode circuit breaker is open (retry in {upstream["retry_in_seconds"]}s). Skipping sync.'
+            ))
+            return
+        
         self.stdout.write(f'Syncing {total} employee(s)...')
         
         successful = 0
         failed = 0
+        unchanged = 0
+        ai_jobs = []
+        employees = list(employees)
+        
+        if incremental:
+            # Cheap probe (solved/submission totals only) for everyone; idle employees just get
+            # their schedule bumped and skip the full fetch
+            probes = LeetCodeService.get_many_user_stats(
+                [employee.leetcode_username for employee in employees],
+                fetch_profile='standard', force_refresh=no_cache
+            )
+            changed = []
+            for employee in employees:
+                if has_new_activity(latest_snapshot(employee), probes.get(employee.leetcode_username)):
+                    changed.append(employee)
+                else:
+                    mark_synced(employee)
+                    unchanged += 1
+            self.stdout.write(f'{unchanged} unchanged since last snapshot, {len(changed)} to refresh')
+            employees = changed
+        
+        # Fetch everyone up front in batched GraphQL requests
+        stats_by_username = LeetCodeService.get_many_user_stats(
+            [employee.leetcode_username for employee in employees], 'Mid-Level',
+            wait_for_ai=wait_for_ai, force_refresh=no_cache
+        )
         
         for employee in employees:
             try:
                 self.stdout.write(f'Syncing {employee.name} ({employee.leetcode_username})...')
                 
-                # Fetch stats
-                stats_result = LeetCodeService.get_user_stats(employee.leetcode_username, 'Mid-Level')
+                stats_result = stats_by_username.get(employee.leetcode_username)
                 
                 if not stats_result or 'error' in stats_result:
                     error_msg = stats_result.get('error', 'Failed to fetch stats') if stats_result else 'Failed to fetch stats'
@@ -81,62 +132,10 @@ class Command(BaseCommand):
                     failed += 1
                     continue
                 
-                # Create analysis history record
-                LeetCodeAnalysisHistory.objects.create(
-                    company=employee.company,
-                    employee_identifier=employee.leetcode_username,
-                    leetcode_username=employee.leetcode_username,
-                    leetcode_url=employee.leetcode_url,
-                    total_solved=stats_result.get('total_solved', 0),
-                    easy_solved=stats_result.get('easy_solved', 0),
-                    medium_solved=stats_result.get('medium_solved', 0),
-                    hard_solved=stats_result.get('hard_solved', 0),
-                    problem_solving_score=stats_result.get('problem_solving_score', 0),
-                    ranking=stats_result.get('ranking', 0),
-                    acceptance_rate=stats_result.get('acceptance_rate', 0),
-                    current_streak=stats_result.get('current_streak', 0),
-                    max_streak=stats_result.get('max_streak', 0),
-                    activity_status=stats_result.get('activity_status', 'Unknown'),
-                    full_stats=stats_result,
-                    analysis_data=stats_result.get('analysis', {}),
-                )
-                
-                # Update employee last_synced and next_sync
-                employee.last_synced = timezone.now()
-                if employee.sync_frequency == 'daily':
-                    employee.next_sync = timezone.now() + timedelta(days=1)
-                elif employee.sync_frequency == 'weekly':
-                    employee.next_sync = timezone.now() + timedelta(weeks=1)
-                elif employee.sync_frequency == 'monthly':
-                    employee.next_sync = timezone.now() + timedelta(days=30)
-                employee.save()
-                
-                # Update goals
-                from api.coding_platform_models import EmployeeGoal
-                goals = EmployeeGoal.objects.filter(employee=employee, is_active=True)
-                for goal in goals:
-                    if goal.metric_type == 'total_solved':
-                        goal.current_value = stats_result.get('total_solved', 0)
-                    elif goal.metric_type == 'easy_solved':
-                        goal.current_value = stats_result.get('easy_solved', 0)
-                    elif goal.metric_type == 'medium_solved':
-                        goal.current_value = stats_result.get('medium_solved', 0)
-                    elif goal.metric_type == 'hard_solved':
-                        goal.current_value = stats_result.get('hard_solved', 0)
-                    elif goal.metric_type == 'problem_solving_score':
-                        goal.current_value = stats_result.get('problem_solving_score', 0)
-                    elif goal.metric_type == 'acceptance_rate':
-                        goal.current_value = stats_result.get('acceptance_rate', 0)
-                    elif goal.metric_type == 'current_streak':
-                        goal.current_value = stats_result.get('current_streak', 0)
-                    elif goal.metric_type == 'ranking':
-                        goal.current_value = stats_result.get('ranking', 0)
-                    
-                    # Check if goal achieved
-                    if goal.is_achieved and not goal.achieved_at:
-                        goal.achieved_at = timezone.now()
-                    
-                    goal.save()
+                # Save the snapshot and update the employee's schedule and goals
+                _, _, ai_job = record_snapshot(employee, stats_result)
+                if ai_job:
+                    ai_jobs.append(ai_job)
                 
                 self.stdout.write(self.style.SUCCESS(f'  Success: {stats_result.get("total_solved", 0)} problems solved'))
                 successful += 1
@@ -146,7 +145,17 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f'  Error: {str(e)}'))
                 failed += 1
         
+        # Let queued AI recommendations finish before the process exits
+        if ai_jobs:
+            self.stdout.write(f'Waiting for {len(ai_jobs)} AI recommendation job(s)...')
+            wait(ai_jobs)
+        
         # Summary
         self.stdout.write('')
         self.stdout.write(self.style.SUCCESS(f'Completed: {successful} successful, {failed} failed'))
+        if incremental:
+            self.stdout.write(f'Unchanged (last_synced bumped only): {unchanged}')
+        upstream = LeetCodeService.upstream_status()
+        if upstream:
+            self.stdout.write(f'LeetCode upstream: {upstream["state"]} ({upstream["consecutive_failures"]} consecutive failures)')
 
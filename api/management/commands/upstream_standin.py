@@ -0,0 +1,284 @@
+"""
+Management command that runs a local stand-in for LeetCode, HackerRank and Fireworks.
+
+Each upstream gets its own port (so http_client keeps separate pools, rate limits and breakers for
+them) and replays the recorded responses in tests/upstream_fixtures, with the requested username
+substituted in. Latency, random 5xx errors and periodic 429 bursts can be injected to benchmark
+sync and analysis throughput repeatably without touching the real services.
+
+Usage:
+    python manage.py upstream_standin
+    python manage.py upstream_standin --latency 300 --jitter 100 --error-rate 0.02
+    python manage.py upstream_standin --burst-every 50 --burst-length 5 --faults leetcode
+
+Then start the app with the URLs it prints, e.g.
+    LEETCODE_GRAPHQL_URL=http://127.0.0.1:8701/graphql
+    HACKERRANK_BASE_URL=http://127.0.0.1:8702
+    FIREWORKS_BASE_URL=http://127.0.0.1:8703/inference/v1 FIREWORKS_API_KEY=standin
+
+Usernames starting with --missing-prefix ("missing" by default) are answered as nonexistent.
+Each server reports its request counters at GET /__stats.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+UPSTREAMS = ('leetcode', 'hackerrank', 'fireworks')
+DEFAULT_FIXTURES = Path(settings.BASE_DIR) / 'tests' / 'upstream_fixtures'
+# Matches the aliases of a batched query: `u0: matchedUser(username: $u0)`
+BATCH_ALIAS = re.compile(r'(\w+)\s*:\s*matchedUser\(username:\s*\$(\w+)\)')
+HACKER_PATH = re.compile(r'^/rest/hackers/([^/]+)(/scores_elo)?/?$')
+
+
+class Upstream:
+    """Fixtures, fault settings and counters for one stand-in upstream."""
+
+    def __init__(self, name, fixtures, options, faults):
+        self.name = name
+        self.fixtures = fixtures
+        self.latency = options['latency'] / 1000
+        self.jitter = options['jitter'] / 1000
+        self.error_rate = options['error_rate'] if faults else 0
+        self.burst_every = options['burst_every'] if faults else 0
+        self.burst_length = options['burst_length']
+        self.retry_after = options['retry_after']
+        self.missing_prefix = options['missing_prefix'].lower()
+        self._lock = threading.Lock()
+        self._served = 0
+        self.statuses = Counter()
+
+    def exists(self, username):
+        return not (self.missing_prefix and username.lower().startswith(self.missing_prefix))
+
+    def fixture(self, name, username=None):
+        data = self.fixtures[name]
+        if username is None:
+            return data
+        # Fixtures are recorded with a {username} placeholder
+        escaped = json.dumps(username)[1:-1]
+        return json.loads(json.dumps(data).replace('{username}', escaped))
+
+    def fault(self):
+        """Returns an injected (status, headers) for the next request, or None to serve it normally."""
+        with self._lock:
+            position = self._served
+            self._served += 1
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency)
+        # The last `burst_length` requests of every `burst_every` are rate limited
+        if self.burst_every and position % self.burst_every >= self.burst_every - self.burst_length:
+            return 429, {'Retry-After': str(self.retry_after)}
+        if self.error_rate and random.random() < self.error_rate:
+            return random.choice((500, 502, 503)), {}
+        return None
+
+    def record(self, status):
+        with self._lock:
+            self.statuses[status] += 1
+
+    def stats(self):
+        with self._lock:
+            return {'requests': sum(self.statuses.values()), 'statuses': dict(self.statuses)}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the app's pooled sessions reuse connections as they would upstream
+    protocol_version = 'HTTP/1.1'
+    upstream = None
+    verbose = False
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        path = urlparse(self.path).path
+
+        if path == '/__stats':
+            return self._send(200, self.upstream.stats(), record=False)
+
+        injected = self.upstream.fault()
+        if injected is not None:
+            status, headers = injected
+            return self._send(status, {'error': 'injected by upstream_standin'}, headers)
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            return self._send(400, {'error': 'invalid JSON body'})
+
+        handler = getattr(self, f'_{self.upstream.name}')
+        status, data = handler(method, path, payload)
+        self._send(status, data)
+
+    def _leetcode(self, method, path, payload):
+        if method != 'POST' or not path.rstrip('/').endswith('graphql'):
+            return 404, {'error': 'not found'}
+        query = payload.get('query', '')
+        variables = payload.get('variables') or {}
+        upstream = self.upstream
+
+        def user(username):
+            if not username or not upstream.exists(username):
+                return None
+            return upstream.fixture('leetcode_user', username)['data']['matchedUser']
+
+        data = {}
+        aliases = BATCH_ALIAS.findall(query)
+        if aliases:
+            for alias, variable in aliases:
+                data[alias] = user(variables.get(variable))
+            return 200, {'data': data}
+
+        username = variables.get('username')
+        if 'tagProblemCounts' in query:
+            data['matchedUser'] = upstream.fixture('leetcode_tags')['data']['matchedUser'] if user(username) else None
+        elif 'matchedUser' in query:
+            data['matchedUser'] = user(username)
+        for field, value in upstream.fixture('leetcode_contest')['data'].items():
+            if f'{field}(' in query:
+                data[field] = value if user(username) else None
+        return 200, {'data': data}
+
+    def _hackerrank(self, method, path, payload):
+        match = HACKER_PATH.match(path)
+        if method != 'GET' or not match:
+            return 404, {'error': 'not found'}
+        username = unquote(match.group(1))
+        if not self.upstream.exists(username):
+            return 404, {'error': 'not found'}
+        if match.group(2):
+            return 200, self.upstream.fixture('hackerrank_scores_elo', username)
+        return 200, self.upstream.fixture('hackerrank_profile', username)
+
+    def _fireworks(self, method, path, payload):
+        if method != 'POST' or not path.endswith('/chat/completions'):
+            return 404, {'error': 'not found'}
+        if not self.headers.get('Authorization'):
+            return 401, {'error': 'missing API key'}
+        response = self.upstream.fixture('fireworks_chat_completion')
+        return 200, {**response, 'model': payload.get('model', response.get('model'))}
+
+    def _send(self, status, data, headers=None, record=True):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        if record:
+            self.upstream.record(status)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def _rebase_calendar(user_payload):
+    """Shifts the recorded submission calendar so its last active day is today, keeping streaks realistic."""
+    user = user_payload['data']['matchedUser']
+    calendar = json.loads(user.get('submissionCalendar') or '{}')
+    if not calendar:
+        return
+    today = int(datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+    offset = today - max(int(ts) for ts in calendar)
+    user['submissionCalendar'] = json.dumps({str(int(ts) + offset): count for ts, count in calendar.items()})
+
+
+class Command(BaseCommand):
+    help = 'Serve recorded LeetCode/HackerRank/Fireworks responses locally for offline load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8701,
+            help='LeetCode port; HackerRank and Fireworks use the next two ports',
+        )
+        parser.add_argument('--fixtures', default=str(DEFAULT_FIXTURES), help='Directory of recorded responses')
+        parser.add_argument('--latency', type=float, default=0, help='Mean added latency per request (ms)')
+        parser.add_argument('--jitter', type=float, default=0, help='Standard deviation of the latency (ms)')
+        parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests answered with a 5xx')
+        parser.add_argument(
+            '--burst-every',
+            type=int,
+            default=0,
+            help='Rate limit the last --burst-length of every N requests with 429s (0 disables)',
+        )
+        parser.add_argument('--burst-length', type=int, default=5)
+        parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+        parser.add_argument(
+            '--faults',
+            default=','.join(UPSTREAMS),
+            help='Comma-separated upstreams that get errors and 429 bursts (latency applies to all)',
+        )
+        parser.add_argument('--missing-prefix', default='missing', help='Usernames treated as nonexistent')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] <= 1:
+            raise CommandError('--error-rate must be between 0 and 1')
+        if options['burst_every'] and not 0 < options['burst_length'] <= options['burst_every']:
+            raise CommandError('--burst-length must be between 1 and --burst-every')
+        faults = {name.strip() for name in options['faults'].split(',') if name.strip()}
+        unknown = faults - set(UPSTREAMS)
+        if unknown:
+            raise CommandError(f"Unknown upstream(s) in --faults: {', '.join(sorted(unknown))}")
+
+        fixtures = self._load_fixtures(Path(options['fixtures']))
+        verbose = options['verbosity'] > 1
+
+        servers = []
+        for offset, name in enumerate(UPSTREAMS):
+            upstream = Upstream(name, fixtures, options, name in faults)
+            handler = type(f'{name.title()}StandInHandler', (StandInHandler,), {'upstream': upstream, 'verbose': verbose})
+            server = ThreadingHTTPServer((options['host'], options['port'] + offset), handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name=f'standin-{name}', daemon=True).start()
+            servers.append((upstream, server))
+
+        base = f"http://{options['host']}"
+        self.stdout.write(self.style.SUCCESS('Upstream stand-in running. Point the app at it with:'))
+        self.stdout.write(f"    LEETCODE_GRAPHQL_URL={base}:{options['port']}/graphql")
+        self.stdout.write(f"    HACKERRANK_BASE_URL={base}:{options['port'] + 1}")
+        self.stdout.write(f"    FIREWORKS_BASE_URL={base}:{options['port'] + 2}/inference/v1")
+        self.stdout.write('    FIREWORKS_API_KEY=standin')
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for upstream, server in servers:
+                server.shutdown()
+                server.server_close()
+                stats = upstream.stats()
+                self.stdout.write(f"{upstream.name}: {stats['requests']} requests {stats['statuses']}")
+
+    def _load_fixtures(self, directory):
+        fixtures = {}
+        for name in ('leetcode_user', 'leetcode_contest', 'leetcode_tags', 'hackerrank_profile',
+                     'hackerrank_scores_elo', 'fireworks_chat_completion'):
+            path = directory / f'{name}.json'
+            try:
+                fixtures[name] = json.loads(path.read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not load fixture {path}: {e}')
+        _rebase_calendar(fixtures['leetcode_user'])
+        return fixtures
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('namespace', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=255)),
+                ('value', models.JSONField(default=dict)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Cache Entries',
+                'indexes': [models.Index(fields=['namespace', 'expires_at'], name='api_cacheen_namespa_2db7b2_idx')],
+                'unique_together': {('namespace', 'key')},
+            },
+        ),
+    ]
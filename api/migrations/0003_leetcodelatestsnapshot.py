@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+COPIED_FIELDS = (
+    'analyzed_at', 'total_solved', 'easy_solved', 'medium_solved', 'hard_solved',
+    'problem_solving_score', 'ranking', 'acceptance_rate', 'current_streak', 'max_streak',
+    'activity_status',
+)
+
+
+def populate_latest_snapshots(apps, schema_editor):
+    History = apps.get_model('api', 'LeetCodeAnalysisHistory')
+    LatestSnapshot = apps.get_model('api', 'LeetCodeLatestSnapshot')
+    rows = []
+    last_key = None
+    history = History.objects.order_by('company_id', 'employee_identifier', '-analyzed_at')
+    for record in history.only('id', 'company_id', 'employee_identifier', *COPIED_FIELDS).iterator():
+        key = (record.company_id, record.employee_identifier)
+        if key == last_key:
+            continue
+        last_key = key
+        rows.append(LatestSnapshot(
+            company_id=record.company_id,
+            employee_identifier=record.employee_identifier,
+            history_id=record.id,
+            **{field: getattr(record, field) for field in COPIED_FIELDS},
+        ))
+    LatestSnapshot.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_cacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeetCodeLatestSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('employee_identifier', models.CharField(max_length=255)),
+                ('analyzed_at', models.DateTimeField()),
+                ('total_solved', models.IntegerField(default=0)),
+                ('easy_solved', models.IntegerField(default=0)),
+                ('medium_solved', models.IntegerField(default=0)),
+                ('hard_solved', models.IntegerField(default=0)),
+                ('problem_solving_score', models.IntegerField(default=0)),
+                ('ranking', models.IntegerField(default=0)),
+                ('acceptance_rate', models.FloatField(default=0.0)),
+                ('current_streak', models.IntegerField(default=0)),
+                ('max_streak', models.IntegerField(default=0)),
+                ('activity_status', models.CharField(blank=True, max_length=20, null=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leetcode_latest_snapshots', to=settings.AUTH_USER_MODEL)),
+                ('history', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='latest_snapshot', to='api.leetcodeanalysishistory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', '-analyzed_at'], name='api_leetcod_company_ae8f1e_idx')],
+                'unique_together': {('company', 'employee_identifier')},
+            },
+        ),
+        migrations.RunPython(populate_latest_snapshots, migrations.RunPython.noop),
+    ]
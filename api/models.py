@@ -15,3 +15,4 @@ class User(AbstractUser):
     )
 
 from .coding_platform_models import *
+from .cache_models import *
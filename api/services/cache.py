@@ -0,0 +1,241 @@
+"""
+Caching primitives for upstream (LeetCode, HackerRank, LLM) results.
+
+- TTLLRUCache: per-process, size-bounded, least-recently-used eviction with a TTL.
+- PersistentCache: CacheEntry-backed tier shared by every worker process and kept across restarts.
+  Expired rows and rows over a namespace's size cap are purged by a background thread
+  (CACHE_PURGE_INTERVAL) and by the purge_cache management command.
+- TieredCache: memory first, then the persistent tier (hits there are promoted into memory).
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from decouple import config
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Seconds between background purges of the persistent tier; 0 disables the purge thread
+CACHE_PURGE_INTERVAL = config("CACHE_PURGE_INTERVAL", default=600, cast=int)
+
+_persistent_caches = []
+_purge_thread = None
+_purge_lock = threading.Lock()
+
+
+def fingerprint(*parts):
+    """Stable hash of JSON-serialisable inputs, used as a cache key."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTLLRUCache:
+    """Thread-safe in-process cache with a per-entry TTL and LRU eviction once `max_size` is reached."""
+
+    def __init__(self, max_size=1000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class PersistentCache:
+    """
+    Database-backed cache tier (CacheEntry rows) for one namespace.
+    Failures are logged and treated as misses so a cache problem never breaks a fetch.
+    """
+
+    def __init__(self, namespace, ttl=3600, max_entries=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        _persistent_caches.append(self)
+
+    def get(self, key, default=None):
+        from api.cache_models import CacheEntry
+
+        try:
+            value = CacheEntry.objects.filter(
+                namespace=self.namespace,
+                key=key,
+                expires_at__gt=timezone.now(),
+            ).values_list('value', flat=True).first()
+        except Exception as e:
+            logger.warning(f"Persistent cache read failed for {self.namespace}:{key}: {str(e)}")
+            return default
+        return default if value is None else value
+
+    def set(self, key, value, ttl=None):
+        from api.cache_models import CacheEntry
+
+        expires_at = timezone.now() + timedelta(seconds=self.ttl if ttl is None else ttl)
+        try:
+            CacheEntry.objects.update_or_create(
+                namespace=self.namespace,
+                key=key,
+                defaults={'value': value, 'expires_at': expires_at},
+            )
+        except Exception as e:
+            logger.warning(f"Persistent cache write failed for {self.namespace}:{key}: {str(e)}")
+        ensure_purge_thread()
+
+    def delete(self, key):
+        from api.cache_models import CacheEntry
+
+        try:
+            CacheEntry.objects.filter(namespace=self.namespace, key=key).delete()
+        except Exception as e:
+            logger.warning(f"Persistent cache delete failed for {self.namespace}:{key}: {str(e)}")
+
+    def purge(self):
+        """
+        Deletes expired rows, then the soonest-to-expire rows above `max_entries`.
+        Returns the number of rows removed.
+        """
+        from api.cache_models import CacheEntry
+
+        entries = CacheEntry.objects.filter(namespace=self.namespace)
+        removed = entries.filter(expires_at__lte=timezone.now()).delete()[0]
+
+        if self.max_entries:
+            overflow = entries.count() - self.max_entries
+            if overflow > 0:
+                oldest_ids = list(entries.order_by('expires_at').values_list('id', flat=True)[:overflow])
+                removed += CacheEntry.objects.filter(id__in=oldest_ids).delete()[0]
+
+        if removed:
+            logger.info(f"Purged {removed} entries from persistent cache '{self.namespace}'")
+        return removed
+
+
+def purge_persistent_caches(namespace=None):
+    """Purges every registered persistent cache (or just `namespace`). Returns rows removed per namespace."""
+    removed = {}
+    for cache in list(_persistent_caches):
+        if namespace and cache.namespace != namespace:
+            continue
+        removed[cache.namespace] = removed.get(cache.namespace, 0) + cache.purge()
+    return removed
+
+
+def _purge_loop():
+    while True:
+        time.sleep(CACHE_PURGE_INTERVAL)
+        try:
+            purge_persistent_caches()
+        except Exception as e:
+            logger.error(f"Background cache purge failed: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+
+
+def ensure_purge_thread():
+    """Starts this process's background purge thread the first time the persistent tier is written to."""
+    global _purge_thread
+    if CACHE_PURGE_INTERVAL <= 0 or _purge_thread is not None:
+        return
+    with _purge_lock:
+        if _purge_thread is None:
+            _purge_thread = threading.Thread(target=_purge_loop, name='cache-purge', daemon=True)
+            _purge_thread.start()
+
+
+class TieredCache:
+    """In-process TTLLRUCache in front of a PersistentCache."""
+
+    def __init__(self, namespace, ttl=3600, max_size=1000, persistent=True, max_entries=None):
+        self.namespace = namespace
+        self.memory = TTLLRUCache(max_size=max_size, ttl=ttl)
+        self.persistent = PersistentCache(namespace, ttl=ttl, max_entries=max_entries) if persistent else None
+        self.persistent_hits = 0
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.persistent is None:
+            return default
+        value = self.persistent.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.persistent_hits += 1
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.memory.set(key, value, ttl)
+        if self.persistent is not None:
+            self.persistent.set(key, value, ttl)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.persistent is not None:
+            self.persistent.delete(key)
+
+    def stats(self):
+        return {
+            'namespace': self.namespace,
+            'memory': self.memory.stats(),
+            'persistent_hits': self.persistent_hits,
+        }
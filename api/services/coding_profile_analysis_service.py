@@ -1,10 +1,12 @@
 import logging
 import json
-import requests
 from decouple import config
+from api.services import http_client
+from api.services.cache import fingerprint
+from api.services.recommendation_service import llm_cache
 
 FIREWORKS_API_KEY = config("FIREWORKS_API_KEY", default=None)
-FIREWORKS_BASE_URL = config("FIREWORKS_BASE_URL", default="https://api.fireworks.ai/inference/v1")
+FIREWORKS_BASE_URL = http_client.FIREWORKS_BASE_URL
 
 def generate_text_fireworks(prompt, system_prompt="You are a helpful AI assistant."):
     if not FIREWORKS_API_KEY:
@@ -29,7 +31,7 @@ def generate_text_fireworks(prompt, system_prompt="You are a helpful AI assistan
     }
     
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = http_client.post(url, json=payload, headers=headers)
         response.raise_for_status()
         data = response.json()
         return data["choices"][0]["message"]["content"]
@@ -38,6 +40,29 @@ def generate_text_fireworks(prompt, system_prompt="You are a helpful AI assistan
 
 logger = logging.getLogger(__name__)
 
+# Stats keys that change between syncs without the profile itself changing
+VOLATILE_STATS_KEYS = ('analysis', 'secondary')
+
+
+def analysis_prompt_stats(stats):
+    """
+    The part of `stats` that is sent to the model: everything except the previous analysis,
+    secondary datasets and *_at timestamps.
+    """
+    return {
+        key: value for key, value in stats.items()
+        if key not in VOLATILE_STATS_KEYS and not key.endswith('_at')
+    }
+
+
+def analysis_cache_key(platform, stats):
+    """
+    llm_cache key for a profile analysis: the platform plus exactly the stats that go into the
+    prompt, so fields the prompt leaves out can't split or collide cache entries.
+    """
+    return fingerprint('profile_analysis', platform, analysis_prompt_stats(stats))
+
+
 class CodingProfileAnalysisService:
     @staticmethod
     def analyze_profile(profile):
@@ -50,11 +75,16 @@ class CodingProfileAnalysisService:
         if not stats:
             return None
 
+        cache_key = analysis_cache_key(platform, stats)
+        cached = llm_cache.get(cache_key)
+        if cached:
+            return cached
+
         prompt = f"""
         You are an expert technical interviewer and career coach.
         Analyze the following {platform} statistics for a job seeker:
         
-        {json.dumps(stats, indent=2)}
+        {json.dumps(analysis_prompt_stats(stats), indent=2)}
         
         The stats include advanced metrics like:
         - Weighted Acceptance Rate (accounts for problem difficulty)
@@ -85,6 +115,7 @@ class CodingProfileAnalysisService:
                 response_text = response_text.split("```")[1].split("```")[0].strip()
                 
             analysis = json.loads(response_text)
+            llm_cache.set(cache_key, analysis)
             return analysis
 
         except Exception as e:
@@ -0,0 +1,22 @@
+"""
+Helpers for fanning outbound work out over a bounded number of threads.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_bounded(func, items, max_workers):
+    """
+    Calls `func(item)` for every item using at most `max_workers` threads.
+    Results are returned in the same order as `items`.
+    Each call runs in a copy of the caller's context, so a request deadline carries over.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if max_workers <= 1 or len(items) == 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix='bulk-fetch') as executor:
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
@@ -0,0 +1,72 @@
+"""
+Request-scoped deadlines for outbound calls.
+
+A view wraps its work in `with deadline():`. http_client clamps every timeout, rate-limit wait and
+retry backoff to the time left and raises DeadlineExceeded once it is used up, so a chain of
+LeetCode/HackerRank/Fireworks calls can't outlive the request.
+
+The deadline lives in a contextvar: run_bounded copies it into its worker threads, while the
+background executors (AI recommendations, stale-while-revalidate refreshes) deliberately run
+without one.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+import requests
+from decouple import config
+
+# Overall outbound budget for one API request; keep it below the gunicorn worker timeout
+REQUEST_DEADLINE = config("REQUEST_DEADLINE_SECONDS", default=25, cast=float)
+
+_expires_at = contextvars.ContextVar('outbound_deadline', default=None)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised instead of making (or while waiting on) an outbound call once the deadline has passed."""
+
+
+@contextmanager
+def deadline(seconds=None):
+    """Sets a deadline `seconds` from now (REQUEST_DEADLINE by default). Nested deadlines never extend an outer one."""
+    expires_at = time.monotonic() + (REQUEST_DEADLINE if seconds is None else seconds)
+    current = _expires_at.get()
+    if current is not None:
+        expires_at = min(current, expires_at)
+    token = _expires_at.set(expires_at)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None when no deadline is set."""
+    expires_at = _expires_at.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check():
+    if expired():
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+def clamp_timeout(timeout):
+    """Caps a requests timeout (seconds or a (connect, read) tuple) at the time left."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    if timeout is None:
+        return left
+    if isinstance(timeout, tuple):
+        return tuple(left if t is None else min(t, left) for t in timeout)
+    return min(timeout, left)
@@ -0,0 +1,222 @@
+"""
+Resolver cache for outbound HTTP (LeetCode, HackerRank, Fireworks).
+
+Lookups are cached for OUTBOUND_DNS_CACHE_TTL seconds, and a stale entry is served when the
+resolver fails, so slow or flaky DNS costs one lookup per host per TTL instead of one per fetch.
+Addresses are ordered IPv4 first (the same IPv6 stall core/settings.py works around for DB_HOST),
+alternating with IPv6. Connections are made happy-eyeballs style: the next address is tried
+HAPPY_EYEBALLS_DELAY seconds after the previous one, or immediately if it fails, and the first
+socket to connect wins.
+
+http_client's pooled adapter uses these connections for every host it talks to.
+"""
+import logging
+import queue
+import socket
+import sys
+import threading
+import time
+
+from decouple import config
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+try:
+    from urllib3.exceptions import NameResolutionError
+except ImportError:  # urllib3 < 2
+    NameResolutionError = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds a resolved address list is reused; 0 disables the cache
+DNS_CACHE_TTL = config("OUTBOUND_DNS_CACHE_TTL", default=300, cast=int)
+DNS_PREFER_IPV4 = config("OUTBOUND_DNS_PREFER_IPV4", default=True, cast=bool)
+# Head start each address gets before the next one is tried in parallel
+HAPPY_EYEBALLS_DELAY = config("OUTBOUND_HAPPY_EYEBALLS_DELAY", default=0.25, cast=float)
+
+
+class DNSCache:
+    """Thread-safe cache of getaddrinfo results keyed by (host, port), with lookup timing counters."""
+
+    def __init__(self, ttl=300, prefer_ipv4=True):
+        self.ttl = ttl
+        self.prefer_ipv4 = prefer_ipv4
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.failures = 0
+        self.resolve_time_total = 0.0
+        self.resolve_time_max = 0.0
+
+    def resolve(self, host, port):
+        """Returns getaddrinfo-style (family, type, proto, canonname, sockaddr) tuples in connect order."""
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        started = time.monotonic()
+        try:
+            addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            with self._lock:
+                self.failures += 1
+                if entry is not None:
+                    # Resolver is down or slow to recover; an old answer beats no answer
+                    self.stale_served += 1
+                    logger.warning(f"DNS lookup for {host} failed; using cached addresses")
+                    return entry[1]
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.resolve_time_total += elapsed
+                self.resolve_time_max = max(self.resolve_time_max, elapsed)
+
+        addresses = self._order(addresses)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def _order(self, addresses):
+        """Alternates address families, starting with IPv4 when preferred (RFC 8305 style)."""
+        first = socket.AF_INET if self.prefer_ipv4 else socket.AF_INET6
+        preferred = [a for a in addresses if a[0] == first]
+        others = [a for a in addresses if a[0] != first]
+        ordered = []
+        for i in range(max(len(preferred), len(others))):
+            ordered.extend(group[i] for group in (preferred, others) if i < len(group))
+        return ordered
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.misses
+            return {
+                'hosts': len(self._entries),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_served': self.stale_served,
+                'failures': self.failures,
+                'resolve_ms_avg': round(1000 * self.resolve_time_total / lookups, 2) if lookups else 0,
+                'resolve_ms_max': round(1000 * self.resolve_time_max, 2),
+            }
+
+
+dns_cache = DNSCache(ttl=DNS_CACHE_TTL, prefer_ipv4=DNS_PREFER_IPV4)
+
+
+def _connect(address, timeout, source_address, socket_options):
+    family, socktype, proto, _, sockaddr = address
+    sock = socket.socket(family, socktype, proto)
+    try:
+        for option in socket_options or ():
+            sock.setsockopt(*option)
+        if isinstance(timeout, (int, float)):
+            sock.settimeout(timeout)
+        if source_address:
+            sock.bind(source_address)
+        sock.connect(sockaddr)
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+
+def _close_late_sockets(results, outstanding):
+    for _ in range(outstanding):
+        sock, _ = results.get()
+        if sock is not None:
+            sock.close()
+
+
+def create_connection(host, port, timeout=None, source_address=None, socket_options=None):
+    """
+    Connects to `host`:`port` using cached addresses, racing them happy-eyeballs style.
+    Raises the last connection error if no address could be reached.
+    """
+    addresses = dns_cache.resolve(host, port)
+    if len(addresses) == 1:
+        return _connect(addresses[0], timeout, source_address, socket_options)
+
+    results = queue.Queue()
+
+    def attempt(address):
+        try:
+            results.put((_connect(address, timeout, source_address, socket_options), None))
+        except OSError as e:
+            results.put((None, e))
+
+    started = finished = 0
+    winner = None
+    error = None
+    for address in addresses:
+        threading.Thread(target=attempt, args=(address,), name='happy-eyeballs', daemon=True).start()
+        started += 1
+        try:
+            sock, error = results.get(timeout=HAPPY_EYEBALLS_DELAY)
+        except queue.Empty:
+            continue
+        finished += 1
+        if sock is not None:
+            winner = sock
+            break
+
+    while winner is None and finished < started:
+        sock, error = results.get()
+        finished += 1
+        winner = sock
+
+    if started > finished:
+        # Slower attempts may still connect; close them when they do
+        threading.Thread(target=_close_late_sockets, args=(results, started - finished), daemon=True).start()
+    if winner is None:
+        raise error
+    return winner
+
+
+class _CachedDNSMixin:
+    """Replaces urllib3's connect step with create_connection above; everything else is unchanged."""
+
+    def _new_conn(self):
+        try:
+            sock = create_connection(
+                self._dns_host,
+                self.port,
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+            )
+        except socket.gaierror as e:
+            if NameResolutionError is not None:
+                raise NameResolutionError(self.host, self, e) from e
+            raise NewConnectionError(self, f"Failed to resolve {self.host}: {e}") from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(
+                self,
+                f"Connection to {self.host} timed out. (connect timeout={self.timeout})",
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+        sys.audit("http.client.connect", self, self.host, self.port)
+        return sock
+
+
+class CachedDNSHTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class CachedDNSHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    pass
@@ -0,0 +1,303 @@
+"""
+Employee LeetCode sync.
+
+record_snapshot turns fetched stats into a LeetCodeAnalysisHistory snapshot and updates the
+employee's sync schedule and goals; it is shared by SyncEmployeeView and sync_employee_profiles.
+
+Incremental syncs probe LeetCode with the small 'standard' fetch profile first (has_new_activity)
+and only fetch and rescore the full profile when the solved count or the submission totals
+(accepted and attempted) moved, or when the stored streak/activity status may have lapsed since;
+otherwise mark_synced just bumps the schedule.
+
+Each snapshot also replaces the employee's LeetCodeLatestSnapshot row in the same transaction,
+so read paths get the latest stats by key; rebuild_latest_snapshots recomputes that table from
+history (manage.py rebuild_latest_snapshots).
+
+Secondary datasets (contest rating/history, tag counts) are loaded on demand by
+load_secondary_stats and kept on the snapshot under full_stats['secondary'].
+
+SyncEmployeeView can also answer stale-while-revalidate: it returns the latest snapshot with its
+age straight away and, if the snapshot is older than SYNC_FRESHNESS_WINDOW, refreshes it on a
+small background pool. At most one refresh per employee runs at a time in each worker.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from decouple import config
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from api.coding_platform_models import Employee, EmployeeGoal, LeetCodeAnalysisHistory, LeetCodeLatestSnapshot
+from api.services.leetcode_service import LeetCodeService
+from api.services.recommendation_service import queue_ai_recommendations
+
+logger = logging.getLogger(__name__)
+
+# Snapshots younger than this (seconds) are served without triggering a background refresh
+SYNC_FRESHNESS_WINDOW = config("SYNC_FRESHNESS_WINDOW", default=3600, cast=int)
+SYNC_REFRESH_WORKERS = config("SYNC_REFRESH_WORKERS", default=2, cast=int)
+
+# Goal metrics that map one-to-one onto keys of the stats dict
+GOAL_METRICS = (
+    'total_solved', 'easy_solved', 'medium_solved', 'hard_solved',
+    'problem_solving_score', 'acceptance_rate', 'current_streak', 'ranking',
+)
+
+SYNC_INTERVALS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'monthly': timedelta(days=30),
+}
+
+_executor = ThreadPoolExecutor(max_workers=SYNC_REFRESH_WORKERS, thread_name_prefix='employee-sync')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def record_snapshot(employee, stats_result):
+    """
+    Stores `stats_result` as a new history snapshot, queues AI recommendations for it and updates
+    the employee's last_synced/next_sync and active goals.
+    Returns (history, goals_updated, ai_job).
+    """
+    with transaction.atomic():
+        history = LeetCodeAnalysisHistory.objects.create(
+            company_id=employee.company_id,
+            employee_identifier=employee.leetcode_username,
+            leetcode_username=employee.leetcode_username,
+            leetcode_url=employee.leetcode_url,
+            total_solved=stats_result.get('total_solved', 0),
+            easy_solved=stats_result.get('easy_solved', 0),
+            medium_solved=stats_result.get('medium_solved', 0),
+            hard_solved=stats_result.get('hard_solved', 0),
+            problem_solving_score=stats_result.get('problem_solving_score', 0),
+            ranking=stats_result.get('ranking', 0),
+            acceptance_rate=stats_result.get('acceptance_rate', 0),
+            current_streak=stats_result.get('current_streak', 0),
+            max_streak=stats_result.get('max_streak', 0),
+            activity_status=stats_result.get('activity_status', 'Unknown'),
+            full_stats=stats_result,
+            analysis_data=stats_result.get('analysis', {}),
+        )
+        update_latest_snapshot(history)
+    # Queued after commit: the background job reads the snapshot back
+    ai_job = queue_ai_recommendations(stats_result, history=history)
+
+    # Update employee last_synced and next_sync
+    now = timezone.now()
+    _bump_schedule(employee, now)
+    employee.save()
+
+    # Update goals
+    goals = list(EmployeeGoal.objects.filter(employee=employee, is_active=True))
+    for goal in goals:
+        if goal.metric_type in GOAL_METRICS:
+            goal.current_value = stats_result.get(goal.metric_type, 0)
+
+        # Check if goal achieved
+        if goal.is_achieved and not goal.achieved_at:
+            goal.achieved_at = now
+
+        goal.save()
+
+    return history, len(goals), ai_job
+
+
+def _bump_schedule(employee, now):
+    employee.last_synced = now
+    if employee.auto_sync_enabled and employee.sync_frequency in SYNC_INTERVALS:
+        employee.next_sync = now + SYNC_INTERVALS[employee.sync_frequency]
+
+
+def mark_synced(employee):
+    """Records a sync that found nothing new: only last_synced/next_sync are written."""
+    _bump_schedule(employee, timezone.now())
+    employee.save(update_fields=['last_synced', 'next_sync', 'updated_at'])
+
+
+def has_new_activity(history, probe):
+    """
+    Compares a 'standard' fetch-profile probe with the stored snapshot and says whether a full
+    sync is needed. total_submissions only counts accepted submissions, so total_attempts
+    (totalSubmissionNum) is compared too to catch attempts that weren't accepted. Snapshots whose
+    streak or activity status may have lapsed (snapshot_expired) also need a rescore. Missing
+    snapshots and failed or inconclusive probes count as changed.
+    """
+    if history is None or not probe or not probe.get('exists') or probe.get('error'):
+        return True
+    stored = history.full_stats or {}
+    return (
+        probe.get('total_solved') != history.total_solved
+        or probe.get('total_submissions') != stored.get('total_submissions')
+        or probe.get('total_attempts') != stored.get('total_attempts')
+        or snapshot_expired(history)
+    )
+
+
+def snapshot_expired(history, today=None):
+    """
+    True when rescoring today could change the snapshot's time-based fields: a current streak
+    ends a day after the last submission and 'Active' lapses after 30 idle days (see
+    LeetCodeService.calculate_advanced_metrics).
+    """
+    today = today or date.today()
+    calendar = (history.full_stats or {}).get('submission_calendar') or {}
+    if not calendar:
+        return bool(history.current_streak) or history.activity_status == 'Active'
+    last_active = max(datetime.fromtimestamp(int(ts)).date() for ts in calendar)
+    idle_days = (today - last_active).days
+    return (
+        (history.current_streak > 0 and idle_days > 1)
+        or (history.activity_status == 'Active' and idle_days > 30)
+    )
+
+
+def update_latest_snapshot(history):
+    """
+    Points the (company, employee_identifier) LeetCodeLatestSnapshot row at `history`, unless the
+    row already holds a newer snapshot (by analyzed_at, then id). Call inside a transaction: the
+    row is locked so concurrent syncs of one employee can't leave an older snapshot in place.
+    Returns True if the row was written.
+    """
+    key = {'company_id': history.company_id, 'employee_identifier': history.employee_identifier}
+    values = {field: getattr(history, field) for field in LeetCodeLatestSnapshot.COPIED_FIELDS}
+
+    latest = LeetCodeLatestSnapshot.objects.select_for_update().filter(**key).first()
+    if latest is None:
+        try:
+            # Savepoint, so losing the insert race doesn't break the caller's transaction
+            with transaction.atomic():
+                LeetCodeLatestSnapshot.objects.create(history=history, **key, **values)
+            return True
+        except IntegrityError:
+            latest = LeetCodeLatestSnapshot.objects.select_for_update().get(**key)
+
+    if (latest.analyzed_at, latest.history_id) > (history.analyzed_at, history.id):
+        logger.debug(f"Kept newer latest snapshot for {history.employee_identifier}; {history.id} is older")
+        return False
+    latest.history = history
+    for field, value in values.items():
+        setattr(latest, field, value)
+    latest.save()
+    return True
+
+
+def rebuild_latest_snapshots(company_id=None):
+    """
+    Recomputes LeetCodeLatestSnapshot from history, for one company or all of them.
+    Returns the number of rows written.
+    """
+    history = LeetCodeAnalysisHistory.objects.all()
+    snapshots = LeetCodeLatestSnapshot.objects.all()
+    if company_id is not None:
+        history = history.filter(company_id=company_id)
+        snapshots = snapshots.filter(company_id=company_id)
+
+    latest = history.annotate(
+        snapshot_rank=Window(
+            RowNumber(),
+            partition_by=[F('company_id'), F('employee_identifier')],
+            order_by=[F('analyzed_at').desc(), F('id').desc()],
+        ),
+    ).filter(snapshot_rank=1).values('id', 'company_id', 'employee_identifier', *LeetCodeLatestSnapshot.COPIED_FIELDS)
+
+    with transaction.atomic():
+        snapshots.delete()
+        created = LeetCodeLatestSnapshot.objects.bulk_create(
+            [LeetCodeLatestSnapshot(history_id=row.pop('id'), **row) for row in latest.iterator()],
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def latest_snapshot(employee):
+    latest = LeetCodeLatestSnapshot.objects.filter(
+        company_id=employee.company_id,
+        employee_identifier=employee.leetcode_username
+    ).select_related('history').first()
+    return latest.history if latest else None
+
+
+def load_secondary_stats(employee, history, datasets):
+    """
+    Returns {dataset: data} for the requested LeetCode secondary datasets. Copies stored on the
+    snapshot are used while younger than LeetCodeService.SECONDARY_TTL; anything else is fetched
+    and stored back on the snapshot.
+    """
+    stored = dict(((history.full_stats or {}).get('secondary') or {}) if history else {})
+    now = timezone.now()
+    results = {}
+    missing = []
+    for dataset in datasets:
+        entry = stored.get(dataset)
+        if entry and (now - datetime.fromisoformat(entry['fetched_at'])).total_seconds() < LeetCodeService.SECONDARY_TTL:
+            results[dataset] = entry['data']
+        else:
+            missing.append(dataset)
+
+    if missing:
+        fetched = LeetCodeService.get_secondary_stats(employee.leetcode_username, missing)
+        for dataset, data in fetched.items():
+            results[dataset] = data
+            if 'error' not in data:
+                stored[dataset] = {'data': data, 'fetched_at': now.isoformat()}
+        if history and any('error' not in data for data in fetched.values()):
+            history.full_stats = {**(history.full_stats or {}), 'secondary': stored}
+            history.save(update_fields=['full_stats'])
+
+    return results
+
+
+def snapshot_age_seconds(history):
+    return max(0, int((timezone.now() - history.analyzed_at).total_seconds()))
+
+
+def is_fresh(history, freshness_window=None):
+    window = SYNC_FRESHNESS_WINDOW if freshness_window is None else freshness_window
+    return snapshot_age_seconds(history) < window
+
+
+def refresh_in_background(employee, target_role="Mid-Level"):
+    """
+    Queues a background re-sync of `employee` unless one is already running.
+    Returns 'queued', 'in_progress' or 'upstream_unavailable'.
+    """
+    if not LeetCodeService.upstream_available():
+        return 'upstream_unavailable'
+
+    with _refreshing_lock:
+        if employee.id in _refreshing:
+            return 'in_progress'
+        _refreshing.add(employee.id)
+
+    try:
+        _executor.submit(_refresh, employee.id, target_role)
+    except Exception:
+        with _refreshing_lock:
+            _refreshing.discard(employee.id)
+        raise
+    return 'queued'
+
+
+def _refresh(employee_id, target_role):
+    try:
+        employee = Employee.objects.get(id=employee_id)
+        stats_result = LeetCodeService.get_user_stats(employee.leetcode_username, target_role)
+        if not stats_result or 'error' in stats_result:
+            error_msg = stats_result.get('error') if stats_result else 'Failed to fetch stats'
+            logger.warning(f"Background sync of employee {employee_id} failed: {error_msg}")
+            return None
+        history, _, _ = record_snapshot(employee, stats_result)
+        return history
+    except Exception as e:
+        logger.error(f"Background sync of employee {employee_id} failed: {str(e)}", exc_info=True)
+        return None
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(employee_id)
+        # Worker threads get their own DB connection; don't leave it open between jobs
+        close_old_connections()
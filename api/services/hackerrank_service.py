@@ -1,5 +1,12 @@
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from django.db import close_old_connections
+from api.services import http_client
+from api.services.cache import TieredCache
+from api.services.concurrency import run_bounded
+from api.services.deadline import DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
@@ -10,24 +17,42 @@ class HackerRankService:
     # Alternatively, we could scrape the profile page, but that's brittle.
     # For this MVP, we will try a known endpoint.
     
-    BASE_URL = "https://www.hackerrank.com/rest/hackers/{}/scores_elo"
-    PROFILE_URL = "https://www.hackerrank.com/rest/hackers/{}"
+    BASE_URL = http_client.HACKERRANK_BASE_URL + "/rest/hackers/{}/scores_elo"
+    PROFILE_URL = http_client.HACKERRANK_BASE_URL + "/rest/hackers/{}"
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'application/json'
+    }
+
+    # Raw profile payloads, shared across workers through the persistent tier
+    profile_cache = TieredCache(
+        'hackerrank',
+        ttl=config("HACKERRANK_CACHE_TTL", default=900, cast=int),
+        max_size=config("HACKERRANK_CACHE_MAX_SIZE", default=1000, cast=int),
+        max_entries=config("HACKERRANK_PERSISTENT_CACHE_MAX_ENTRIES", default=10000, cast=int),
+    )
+
+    # Finishes fetches a request gave up on at its deadline, so a retry is served from cache
+    _prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hackerrank-prefetch')
 
     @staticmethod
-    def get_user_stats(username):
+    def get_user_stats(username, force_refresh=False):
         """
-        Fetches user statistics from HackerRank.
+        Fetches user statistics from HackerRank (profile and scores_elo, in parallel).
         Note: This uses undocumented endpoints and might be unstable.
         """
+        cache_key = (username or '').strip().lower()
         try:
-            # Fetch basic profile info
-            profile_response = requests.get(
-                HackerRankService.PROFILE_URL.format(username),
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json'
-                },
-                timeout=15
+            response_data = None if force_refresh else HackerRankService.profile_cache.get(cache_key)
+            if response_data is not None:
+                logger.debug(f"HackerRank profile cache hit for {username}")
+                return HackerRankService.parse_user_stats(username, response_data)
+
+            # Profile and scores_elo are independent, so fetch both at once
+            profile_response, scores_response = run_bounded(
+                lambda url: HackerRankService._get(url, username),
+                [HackerRankService.PROFILE_URL, HackerRankService.BASE_URL],
+                max_workers=2,
             )
             
             logger.debug(f"HackerRank API response status: {profile_response.status_code}")
@@ -38,33 +63,16 @@ class HackerRankService:
                 
             profile_response.raise_for_status()
             response_data = profile_response.json()
-            profile_data = response_data.get('model', {})
-            
-            if not profile_data:
-                logger.warning(f"No profile data found for HackerRank user '{username}'")
-                return None
-            
-            # Fetch scores/badges if possible (this endpoint might require auth or be limited)
-            # For now, we'll stick to what we can get from the profile model
-            
-            # Construct stats
-            parsed_stats = {
-                'username': profile_data.get('username', username),
-                'name': profile_data.get('name', ''),
-                'country': profile_data.get('country', ''),
-                'created_at': profile_data.get('created_at', ''),
-                'level': profile_data.get('level', 0),
-                'total_solved': 0,  # HackerRank doesn't easily expose this
-                'easy_solved': 0,
-                'medium_solved': 0,
-                'hard_solved': 0,
-                # HackerRank doesn't easily expose "total solved" in a simple number without scraping
-                # We will try to get badges or points if available in the profile model
-            }
-            
-            logger.info(f"Successfully fetched HackerRank profile for {username}")
-            return parsed_stats
+            if scores_response is not None and scores_response.status_code == 200:
+                response_data['scores_elo'] = scores_response.json()
+            if response_data.get('model'):
+                HackerRankService.profile_cache.set(cache_key, response_data)
+
+            return HackerRankService.parse_user_stats(username, response_data)
 
+        except DeadlineExceeded:
+            logger.warning(f"Request deadline reached before HackerRank answered for {username}")
+            return HackerRankService._pending_result(username)
         except requests.exceptions.Timeout:
             logger.error(f"Timeout while fetching HackerRank stats for {username}")
             return None
@@ -74,3 +82,83 @@ class HackerRankService:
         except Exception as e:
             logger.error(f"Unexpected error fetching HackerRank stats for {username}: {str(e)}", exc_info=True)
             return None
+
+    @staticmethod
+    def _pending_result(username):
+        return {
+            'error': 'HackerRank did not answer before the request deadline; the result is still pending.',
+            'username': username,
+            'pending': True,
+        }
+
+    @staticmethod
+    def prefetch(usernames):
+        """Fetches `usernames` into the profile cache in the background, outside any request deadline."""
+        usernames = list(usernames)
+        if usernames:
+            return HackerRankService._prefetch_executor.submit(HackerRankService._run_prefetch, usernames)
+        return None
+
+    @staticmethod
+    def _run_prefetch(usernames):
+        try:
+            for username in usernames:
+                HackerRankService.get_user_stats(username)
+        except Exception as e:
+            logger.error(f"Background HackerRank prefetch failed: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _get(url, username):
+        try:
+            return http_client.get(url.format(username), headers=HackerRankService.HEADERS)
+        except requests.exceptions.RequestException as e:
+            # Scores are a bonus; a failing scores_elo call still leaves the profile usable
+            if url == HackerRankService.PROFILE_URL:
+                raise
+            logger.warning(f"HackerRank scores_elo request failed for {username}: {str(e)}")
+            return None
+
+    @staticmethod
+    def parse_user_stats(username, response_data):
+        """
+        Builds the stats dict from a raw HackerRank profile payload.
+        """
+        profile_data = response_data.get('model', {})
+        
+        if not profile_data:
+            logger.warning(f"No profile data found for HackerRank user '{username}'")
+            return None
+        
+        # Per-track scores from scores_elo, when that call succeeded
+        scores = []
+        for track in response_data.get('scores_elo') or []:
+            if not isinstance(track, dict):
+                continue
+            practice = track.get('practice') or {}
+            scores.append({
+                'track': track.get('name', ''),
+                'slug': track.get('slug', ''),
+                'practice_score': practice.get('score', 0),
+                'practice_rank': practice.get('rank'),
+            })
+        
+        # Construct stats
+        parsed_stats = {
+            'username': profile_data.get('username', username),
+            'name': profile_data.get('name', ''),
+            'country': profile_data.get('country', ''),
+            'created_at': profile_data.get('created_at', ''),
+            'level': profile_data.get('level', 0),
+            'total_solved': 0,  # HackerRank doesn't easily expose this
+            'easy_solved': 0,
+            'medium_solved': 0,
+            'hard_solved': 0,
+            # HackerRank doesn't easily expose "total solved" in a simple number without scraping
+            # We will try to get badges or points if available in the profile model
+            'scores': scores,
+        }
+        
+        logger.info(f"Successfully fetched HackerRank profile for {username}")
+        return parsed_stats
@@ -0,0 +1,406 @@
+"""
+Shared outbound HTTP layer for the external platform clients (LeetCode, HackerRank, Fireworks).
+
+Every upstream host gets its own keep-alive requests.Session with a pooled adapter, so repeated
+calls reuse TCP/TLS connections instead of handshaking on every request. New connections resolve
+through a shared DNS cache with IPv4 preference and happy-eyeballs fallback.
+
+Hosts configured with a rate limit also get a token bucket, retries with exponential backoff on
+429/5xx (honouring Retry-After), and a circuit breaker that fails fast while the host is unhealthy.
+Hosts with `hedge_after` set get hedged requests to cut tail latency.
+"""
+import contextvars
+import threading
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from decouple import config
+
+from api.services import deadline
+from api.services.cache import PersistentCache
+from api.services.dns_cache import CachedDNSHTTPConnection, CachedDNSHTTPSConnection, dns_cache
+from api.services.deadline import DeadlineExceeded
+from api.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    TokenBucket,
+    backoff_delay,
+    is_retryable_status,
+    retry_after_seconds,
+)
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open per host; raise for hosts hit concurrently by bulk jobs
+POOL_MAXSIZE = config("OUTBOUND_HTTP_POOL_MAXSIZE", default=20, cast=int)
+# Distinct (scheme, host, port) pools cached by each session
+POOL_CONNECTIONS = config("OUTBOUND_HTTP_POOL_CONNECTIONS", default=4, cast=int)
+DEFAULT_TIMEOUT = config("OUTBOUND_HTTP_TIMEOUT", default=15, cast=float)
+# Threads running hedged requests (both legs)
+HEDGE_WORKERS = config("OUTBOUND_HTTP_HEDGE_WORKERS", default=16, cast=int)
+
+# Upstream endpoints. Override them to point at a local stand-in (manage.py upstream_standin);
+# the per-host settings below follow the override.
+LEETCODE_GRAPHQL_URL = config("LEETCODE_GRAPHQL_URL", default="https://leetcode.com/graphql")
+HACKERRANK_BASE_URL = config("HACKERRANK_BASE_URL", default="https://www.hackerrank.com")
+FIREWORKS_BASE_URL = config("FIREWORKS_BASE_URL", default="https://api.fireworks.ai/inference/v1")
+
+
+def host_key(url):
+    # An explicit port is part of the key, so stand-ins on one machine get separate pools and limits
+    parsed = urlparse(url)
+    host = parsed.hostname or ''
+    return f'{host}:{parsed.port}' if parsed.port else host
+
+
+# Per-host overrides; hosts not listed use the defaults above.
+# `rate_per_second`/`burst` enable the token bucket, `max_retries` the backoff loop and
+# `breaker_failures`/`breaker_reset` the circuit breaker, and `hedge_after` (seconds, roughly the
+# host's p95 latency) hedged requests.
+HOST_SETTINGS = {
+    host_key(LEETCODE_GRAPHQL_URL): {
+        'timeout': 15,
+        'rate_per_second': config("LEETCODE_RATE_LIMIT", default=2.0, cast=float),
+        'burst': config("LEETCODE_RATE_BURST", default=5, cast=int),
+        'max_retries': config("LEETCODE_MAX_RETRIES", default=3, cast=int),
+        'breaker_failures': config("LEETCODE_BREAKER_FAILURES", default=5, cast=int),
+        'breaker_reset': config("LEETCODE_BREAKER_RESET", default=30, cast=int),
+        # 0 disables hedging
+        'hedge_after': config("LEETCODE_HEDGE_AFTER", default=0, cast=float),
+    },
+    host_key(HACKERRANK_BASE_URL): {'timeout': 15},
+    host_key(FIREWORKS_BASE_URL): {'timeout': 30},
+}
+
+
+class PoolStats:
+    """Connection counters for one upstream host."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+        self.in_use = 0
+        self.errors = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def connection_opened(self):
+        with self._lock:
+            self.opened += 1
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_use += 1
+
+    def request_finished(self, failed=False):
+        with self._lock:
+            self.in_use -= 1
+            if failed:
+                self.errors += 1
+
+    def hedge_fired(self):
+        with self._lock:
+            self.hedges_fired += 1
+
+    def hedge_won(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'connections_opened': self.opened,
+                'connections_reused': max(0, self.requests - self.opened),
+                'in_use': self.in_use,
+                'requests': self.requests,
+                'errors': self.errors,
+                'hedges_fired': self.hedges_fired,
+                'hedges_won': self.hedges_won,
+            }
+
+
+def _tracked_pool_class(base, connection_cls, stats):
+    class TrackedConnectionPool(base):
+        # Connects through the shared DNS cache (see api.services.dns_cache)
+        ConnectionCls = connection_cls
+
+        def _new_conn(self):
+            stats.connection_opened()
+            return super()._new_conn()
+
+    return TrackedConnectionPool
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter that records connection reuse into a PoolStats instance."""
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _tracked_pool_class(HTTPConnectionPool, CachedDNSHTTPConnection, self.stats),
+            'https': _tracked_pool_class(HTTPSConnectionPool, CachedDNSHTTPSConnection, self.stats),
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.request_started()
+        failed = True
+        try:
+            response = super().send(request, **kwargs)
+            failed = False
+            return response
+        finally:
+            self.stats.request_finished(failed=failed)
+
+
+_sessions = {}
+_stats = {}
+_buckets = {}
+_breakers = {}
+# Open circuits are recorded here so every worker process fails fast, not just the one that tripped
+_breaker_state = PersistentCache('circuit_breaker', ttl=60)
+_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='http-hedge')
+
+
+def configure_host(host, timeout=None, pool_maxsize=None):
+    """
+    Overrides the timeout and/or pool size for one host.
+    A new pool size only applies to sessions created afterwards.
+    """
+    with _lock:
+        host_settings = HOST_SETTINGS.setdefault(host, {})
+        if timeout is not None:
+            host_settings['timeout'] = timeout
+        if pool_maxsize is not None:
+            host_settings['pool_maxsize'] = pool_maxsize
+            _sessions.pop(host, None)
+
+
+def get_session(url):
+    """Returns the shared keep-alive session for the host of `url`."""
+    host = host_key(url)
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            pool_maxsize = HOST_SETTINGS.get(host, {}).get('pool_maxsize', POOL_MAXSIZE)
+            stats = _stats.setdefault(host, PoolStats())
+            adapter = PooledAdapter(
+                stats,
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=pool_maxsize,
+            )
+            session = requests.Session()
+            session.headers['Connection'] = 'keep-alive'
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+            logger.debug(f"Created pooled HTTP session for {host} (pool_maxsize={pool_maxsize})")
+    return session
+
+
+def get_timeout(url):
+    host = host_key(url)
+    return HOST_SETTINGS.get(host, {}).get('timeout', DEFAULT_TIMEOUT)
+
+
+def get_rate_limiter(host):
+    """Returns the host's token bucket, or None if the host is not rate limited."""
+    host_settings = HOST_SETTINGS.get(host, {})
+    if not host_settings.get('rate_per_second'):
+        return None
+    with _lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(host_settings['rate_per_second'], host_settings.get('burst', 1))
+            _buckets[host] = bucket
+    return bucket
+
+
+def get_breaker(host):
+    """Returns the host's circuit breaker, or None if the host has none configured."""
+    host_settings = HOST_SETTINGS.get(host, {})
+    if not host_settings.get('breaker_failures'):
+        return None
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                host_settings['breaker_failures'],
+                host_settings.get('breaker_reset', 30),
+                shared=_breaker_state,
+                name=host,
+            )
+            _breakers[host] = breaker
+    return breaker
+
+
+def request(method, url, hedge_after=None, **kwargs):
+    """
+    Sends a request through the shared session for the URL's host.
+    Uses the host's configured timeout unless one is passed explicitly, capped at whatever is
+    left of the request deadline (see api.services.deadline).
+
+    For protected hosts: raises CircuitOpenError while the breaker is open, waits for a rate-limit
+    token before each attempt, and retries 429/5xx responses and transport errors with backoff.
+    The last response is returned as-is once retries (or the deadline) run out.
+
+    If the request hasn't answered after `hedge_after` seconds (the host's `hedge_after` setting
+    by default), a duplicate is sent and whichever answers first is returned.
+    """
+    if hedge_after is None:
+        hedge_after = HOST_SETTINGS.get(host_key(url), {}).get('hedge_after')
+    if hedge_after:
+        return _hedged_request(method, url, hedge_after, kwargs)
+    return _send(method, url, kwargs)
+
+
+def _send(method, url, kwargs, prepaid=False):
+    """The retry/backoff loop behind request(). `prepaid` means a rate-limit token was already taken."""
+    kwargs = dict(kwargs)
+    timeout = kwargs.pop('timeout', get_timeout(url))
+    host = host_key(url)
+    session = get_session(url)
+    bucket = get_rate_limiter(host)
+    breaker = get_breaker(host)
+    max_retries = HOST_SETTINGS.get(host, {}).get('max_retries', 0)
+
+    deadline.check()
+    if breaker is not None and not breaker.allow_request():
+        raise CircuitOpenError(f"Circuit breaker open for {host}; not sending request")
+
+    # The breaker counts one failure per request, once its retries are exhausted
+    attempt = 0
+    while True:
+        try:
+            if bucket is not None and not prepaid and not bucket.acquire(timeout=deadline.remaining()):
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for {host} rate limit")
+            response = session.request(method, url, timeout=deadline.clamp_timeout(timeout), **kwargs)
+        except DeadlineExceeded:
+            if breaker is not None:
+                breaker.release()
+            raise
+        except requests.exceptions.RequestException as e:
+            if deadline.expired():
+                # Cut short by our own deadline, not the host's fault
+                if breaker is not None:
+                    breaker.release()
+                raise DeadlineExceeded(f"Request deadline exceeded calling {host}") from e
+            delay = backoff_delay(attempt)
+            if attempt >= max_retries or (breaker is not None and breaker.is_open) or not _fits_deadline(delay):
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            logger.warning(f"{method} {host} failed ({str(e)}); retrying in {delay:.2f}s")
+        else:
+            if not is_retryable_status(response.status_code):
+                if breaker is not None:
+                    breaker.record_success()
+                return response
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if attempt >= max_retries or (breaker is not None and breaker.is_open) or not _fits_deadline(delay):
+                if breaker is not None:
+                    breaker.record_failure()
+                return response
+            logger.warning(f"{method} {host} returned {response.status_code}; retrying in {delay:.2f}s")
+            response.close()
+
+        attempt += 1
+        prepaid = False
+        time.sleep(delay)
+
+
+def _hedged_request(method, url, hedge_after, kwargs):
+    """
+    Runs the request on the hedge pool; if it is still outstanding after `hedge_after` seconds,
+    sends one duplicate and returns whichever finishes first. A hedge needs a rate-limit token that
+    is available right away and a closed breaker, otherwise we just keep waiting on the original.
+    """
+    host = host_key(url)
+    get_session(url)
+    stats = _stats[host]
+    primary = _submit_hedge_leg(method, url, kwargs)
+    try:
+        return primary.result(timeout=hedge_after)
+    except FutureTimeoutError:
+        pass
+
+    bucket = get_rate_limiter(host)
+    breaker = get_breaker(host)
+    if (breaker is not None and not breaker.is_closed) or (bucket is not None and not bucket.try_acquire()):
+        return primary.result()
+
+    stats.hedge_fired()
+    hedge = _submit_hedge_leg(method, url, kwargs, prepaid=True)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    stats.hedge_won()
+                # The slower leg can't be cancelled mid-flight; just release its connection
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def _submit_hedge_leg(method, url, kwargs, prepaid=False):
+    # Copy the context so the request deadline applies to both legs
+    return _hedge_executor.submit(contextvars.copy_context().run, _send, method, url, kwargs, prepaid)
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+def _fits_deadline(delay):
+    left = deadline.remaining()
+    return left is None or delay < left
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def get_pool_stats():
+    """Returns connection pool counters keyed by host."""
+    with _lock:
+        return {host: stats.as_dict() for host, stats in _stats.items()}
+
+
+def get_dns_stats():
+    """Resolver cache hit/miss counters and lookup timings for outbound hosts."""
+    return dns_cache.stats()
+
+
+def get_breaker_state(url_or_host):
+    """Circuit breaker state for a host (or the host of a URL); None if it has no breaker."""
+    host = host_key(url_or_host) if '://' in url_or_host else url_or_host
+    breaker = get_breaker(host)
+    return breaker.as_dict() if breaker is not None else None
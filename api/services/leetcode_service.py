@@ -1,381 +1,932 @@
 import requests
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from django.db import close_old_connections
+from django.utils import timezone
+from api.services import http_client
+from api.services.concurrency import run_bounded
+from api.services.deadline import DeadlineExceeded
+from api.services.cache import TieredCache
+from api.services.resilience import CircuitOpenError
+from api.services.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 class LeetCodeService:
-    BASE_URL = "https://leetcode.com/graphql"
+    BASE_URL = http_client.LEETCODE_GRAPHQL_URL
+    HEADERS = {
+        'Content-Type': 'application/json',
+        'Referer': 'https://leetcode.com',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Origin': 'https://leetcode.com'
+    }
+
+    # Named fetch profiles: the UserNode fields each kind of caller needs.
+    # - minimal:  existence checks (employee create, CSV pre-checks)
+    # - standard: solved counts, acceptance rate and ranking (goal start values)
+    # - full:     everything parse_user_stats scores, including the submission calendar
+    FETCH_PROFILES = {
+        'minimal': """
+        username
+    """,
+        'standard': """
+        username
+        submitStats: submitStatsGlobal {
+            acSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+            totalSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+        }
+        profile {
+            ranking
+            reputation
+        }
+    """,
+        'full': """
+        username
+        submissionCalendar
+        submitStats: submitStatsGlobal {
+            acSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+            totalSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+        }
+        profile {
+            ranking
+            reputation
+            starRating
+            realName
+            userAvatar
+            countryName
+            company
+            school
+        }
+    """,
+    }
+
+    # Fields requested for every user; shared by the single and the batched query
+    USER_PROFILE_FRAGMENT = f"""
+    fragment userProfileFields on UserNode {{{FETCH_PROFILES['full']}}}
+    """
+
+    # Existence, profile, global submission stats and calendar in a single round trip.
+    # GraphQL returns partial data alongside `errors`, so a field failing upstream
+    # still leaves us whatever matchedUser fields did resolve.
+    USER_PROFILE_QUERY = """
+    query getUserProfile($username: String!) {
+        matchedUser(username: $username) {
+            ...userProfileFields
+        }
+    }
+    """ + USER_PROFILE_FRAGMENT
+
+    # Number of users packed into one aliased GraphQL document by get_many_user_stats
+    BATCH_SIZE = config("LEETCODE_BATCH_SIZE", default=25, cast=int)
+    # Batches fetched in parallel by get_many_user_stats
+    MAX_CONCURRENCY = config("LEETCODE_MAX_CONCURRENCY", default=4, cast=int)
+
+    # Raw getUserProfile payloads keyed by normalised username. Scoring is role-dependent,
+    # so we cache what LeetCode returned and re-run parse_user_stats on every hit.
+    # The persistent tier is shared by all gunicorn workers and survives deploys.
+    profile_cache = TieredCache(
+        'leetcode',
+        ttl=config("LEETCODE_CACHE_TTL", default=300, cast=int),
+        max_size=config("LEETCODE_CACHE_MAX_SIZE", default=2000, cast=int),
+        max_entries=config("LEETCODE_PERSISTENT_CACHE_MAX_ENTRIES", default=50000, cast=int),
+    )
+
+    # Usernames LeetCode reported as missing/private, keyed the same way. Kept on their own TTL
+    # (well under the daily sync interval) so typos in CSVs and Employee rows are rejected locally,
+    # while a profile that gets fixed or made public is picked up again soon.
+    negative_cache = TieredCache(
+        'leetcode_negative',
+        ttl=config("LEETCODE_NEGATIVE_CACHE_TTL", default=3600, cast=int),
+        max_size=config("LEETCODE_NEGATIVE_CACHE_MAX_SIZE", default=5000, cast=int),
+        max_entries=config("LEETCODE_PERSISTENT_NEGATIVE_CACHE_MAX_ENTRIES", default=20000, cast=int),
+    )
+
+    # Secondary datasets are never part of the primary stats fetch. get_secondary_stats requests
+    # them (all missing ones in one document) only when a view asks, and caches each on a slower TTL.
+    SECONDARY_DATASETS = {
+        'contest': """
+        userContestRanking(username: $username) {
+            attendedContestsCount
+            rating
+            globalRanking
+            totalParticipants
+            topPercentage
+        }
+        userContestRankingHistory(username: $username) {
+            attended
+            rating
+            ranking
+            contest {
+                title
+                startTime
+            }
+        }
+        """,
+        'tags': """
+        matchedUser(username: $username) {
+            tagProblemCounts {
+                advanced { tagName tagSlug problemsSolved }
+                intermediate { tagName tagSlug problemsSolved }
+                fundamental { tagName tagSlug problemsSolved }
+            }
+        }
+        """,
+    }
+    # Top-level fields of each dataset, used to attribute GraphQL errors
+    SECONDARY_ROOTS = {
+        'contest': ('userContestRanking', 'userContestRankingHistory'),
+        'tags': ('matchedUser',),
+    }
+    SECONDARY_TTL = config("LEETCODE_SECONDARY_CACHE_TTL", default=6 * 3600, cast=int)
+    secondary_cache = TieredCache(
+        'leetcode_secondary',
+        ttl=SECONDARY_TTL,
+        max_size=config("LEETCODE_SECONDARY_CACHE_MAX_SIZE", default=1000, cast=int),
+        max_entries=config("LEETCODE_PERSISTENT_SECONDARY_CACHE_MAX_ENTRIES", default=20000, cast=int),
+    )
+
+    # Concurrent get_user_stats calls for the same username share one upstream request
+    single_flight = SingleFlight('leetcode')
+
+    # Finishes fetches a request gave up on at its deadline, so a retry is served from cache
+    _prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='leetcode-prefetch')
 
     @staticmethod
-    def get_user_stats(username, target_role="Mid-Level"):
+    def get_user_stats(username, target_role="Mid-Level", wait_for_ai=False, force_refresh=False, fetch_profile='full'):
         """
         Fetches user statistics from LeetCode using their GraphQL API.
+        Pass wait_for_ai=True to block on LLM recommendations instead of the rule-based ones,
+        and force_refresh=True to skip the profile and negative caches.
+        `fetch_profile` ('minimal', 'standard' or 'full') limits what is requested and parsed;
+        see FETCH_PROFILES and parse_profile_summary.
         """
-        query = """
-        query getUserProfile($username: String!) {
-            matchedUser(username: $username) {
-                username
-                submissionCalendar
-                submitStats: submitStatsGlobal {
-                    acSubmissionNum {
-                        difficulty
-                        count
-                        submissions
-                    }
-                }
-                profile {
-                    ranking
-                    reputation
-                    starRating
-                    realName
-                    userAvatar
-                    countryName
-                    company
-                    school
-                }
-            }
-        }
-        """
-
-        variables = {"username": username}
+        LeetCodeService._check_fetch_profile(fetch_profile)
+        cache_key = LeetCodeService._cache_key(username)
+        payload_key = LeetCodeService._payload_key(cache_key, fetch_profile)
 
         try:
-            # First, try a simpler query to check if user exists
-            simple_check_query = """
-            query userPublicProfile($username: String!) {
-                matchedUser(username: $username) {
-                    username
-                    submissionCalendar
-                    profile {
-                        ranking
-                    }
-                }
-            }
-            """
-            
-            # Try simple query first
-            simple_response = requests.post(
-                LeetCodeService.BASE_URL,
-                json={'query': simple_check_query, 'variables': variables},
-                headers={
-                    'Content-Type': 'application/json',
-                    'Referer': 'https://leetcode.com',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Origin': 'https://leetcode.com'
-                },
-                timeout=15
+            if force_refresh:
+                LeetCodeService.negative_cache.delete(cache_key)
+            else:
+                negative = LeetCodeService.negative_cache.get(cache_key)
+                if negative is not None:
+                    logger.debug(f"LeetCode negative cache hit for {username}")
+                    return LeetCodeService._negative_result(username, negative)
+
+                cached = LeetCodeService._cached_payload(cache_key, fetch_profile)
+                if cached is not None:
+                    logger.debug(f"LeetCode profile cache hit for {username}")
+                    return LeetCodeService.parse_user_stats(username, cached, target_role, wait_for_ai, fetch_profile)
+
+            status_code, data = LeetCodeService.single_flight.do(
+                payload_key,
+                lambda: LeetCodeService._fetch_profile_payload(username, cache_key, fetch_profile),
+                # Other workers fetching the same user publish the payload to the shared tier.
+                # A forced refresh must not settle for whatever that tier already holds.
+                load_shared=None if force_refresh else (
+                    lambda: LeetCodeService._load_shared_payload(cache_key, fetch_profile)
+                ),
             )
-            
-            logger.debug(f"LeetCode simple check response status: {simple_response.status_code} for user {username}")
-            
-            if simple_response.status_code != 200:
-                logger.error(f"LeetCode API returned status {simple_response.status_code} for user {username}")
-                return {
-                    'error': f'LeetCode API returned error status {simple_response.status_code}. The service may be temporarily unavailable.',
-                    'username': username,
-                    'exists': None
-                }
-            
-            simple_data = simple_response.json()
-            
-            if 'errors' in simple_data:
-                error_details = simple_data.get('errors', [])
-                error_messages = [err.get('message', str(err)) for err in error_details]
-                logger.error(f"LeetCode API errors for user {username}: {error_messages}")
+
+            if status_code != 200:
                 return {
-                    'error': f'LeetCode API error: {", ".join(error_messages)}',
+                    'error': f'LeetCode API returned error status {status_code}. The service may be temporarily unavailable.',
                     'username': username,
                     'exists': None
                 }
-            
-            simple_matched = simple_data.get('data', {}).get('matchedUser')
-            if not simple_matched:
-                logger.warning(f"LeetCode user '{username}' not found in simple check. Response data: {simple_data}")
-                # Log the full response for debugging
-                logger.debug(f"Full LeetCode API response for {username}: {simple_data}")
-                return {
+
+            return LeetCodeService.parse_user_stats(username, data, target_role, wait_for_ai, fetch_profile)
+
+        except CircuitOpenError:
+            logger.warning(f"LeetCode circuit breaker open; skipping fetch for {username}")
+            return LeetCodeService._unavailable_result(username)
+        except DeadlineExceeded:
+            logger.warning(f"Request deadline reached before LeetCode answered for {username}")
+            return LeetCodeService._pending_result(username)
+        except requests.exceptions.Timeout:
+            logger.error(f"Timeout while fetching LeetCode stats for {username}")
+            return None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error fetching LeetCode stats for {username}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error fetching LeetCode stats for {username}: {str(e)}", exc_info=True)
+            return None
+
+    @staticmethod
+    def _fetch_profile_payload(username, cache_key, fetch_profile='full'):
+        """
+        POSTs the single-user query. Returns (status_code, payload); the payload is None on non-200.
+        """
+        response = http_client.post(
+            LeetCodeService.BASE_URL,
+            json={'query': LeetCodeService._single_query(fetch_profile), 'variables': {"username": username}},
+            headers=LeetCodeService.HEADERS,
+        )
+
+        logger.debug(f"LeetCode API response status: {response.status_code} for user {username}")
+
+        if response.status_code != 200:
+            logger.error(f"LeetCode API returned status {response.status_code} for user {username}")
+            logger.error(f"Response text: {response.text[:500]}")
+            return response.status_code, None
+
+        data = response.json()
+
+        # Log the full response for debugging
+        logger.debug(f"Full LeetCode API response for {username}: {data}")
+
+        LeetCodeService._cache_payload(cache_key, data, fetch_profile)
+        return response.status_code, data
+
+    @staticmethod
+    def _load_shared_payload(cache_key, fetch_profile='full'):
+        if LeetCodeService.profile_cache.persistent is None:
+            return None
+        data = LeetCodeService.profile_cache.persistent.get(LeetCodeService._payload_key(cache_key, fetch_profile))
+        if data is not None:
+            return 200, data
+        # The other worker may have found that the user doesn't exist
+        if LeetCodeService.negative_cache.persistent is None:
+            return None
+        if LeetCodeService.negative_cache.persistent.get(cache_key) is not None:
+            return 200, {'data': {'matchedUser': None}}
+        return None
+
+    @staticmethod
+    def get_many_user_stats(usernames, target_role="Mid-Level", batch_size=None, max_concurrency=None,
+                            wait_for_ai=False, force_refresh=False, fetch_profile='full'):
+        """
+        Fetches stats for many users, packing up to `batch_size` users into one aliased GraphQL query
+        (`u0: matchedUser(...)`, `u1: ...`) and running up to `max_concurrency` batches in parallel.
+        Users found in the profile or negative cache are not fetched again unless force_refresh is set.
+
+        Returns a dict mapping each username, in input order, to the same result get_user_stats
+        would return for it.
+        """
+        LeetCodeService._check_fetch_profile(fetch_profile)
+        batch_size = max(1, batch_size or LeetCodeService.BATCH_SIZE)
+        max_concurrency = max_concurrency or LeetCodeService.MAX_CONCURRENCY
+        # Deduplicate while keeping input order
+        usernames = list(dict.fromkeys(usernames))
+
+        results = {}
+        to_fetch = []
+        for username in usernames:
+            cache_key = LeetCodeService._cache_key(username)
+            if force_refresh:
+                LeetCodeService.negative_cache.delete(cache_key)
+                to_fetch.append(username)
+                continue
+
+            negative = LeetCodeService.negative_cache.get(cache_key)
+            if negative is not None:
+                results[username] = LeetCodeService._negative_result(username, negative)
+                continue
+
+            cached = LeetCodeService._cached_payload(cache_key, fetch_profile)
+            if cached is None:
+                to_fetch.append(username)
+                continue
+            try:
+                results[username] = LeetCodeService.parse_user_stats(username, cached, target_role, wait_for_ai, fetch_profile)
+            except Exception as e:
+                logger.error(f"Unexpected error parsing cached LeetCode stats for {username}: {str(e)}", exc_info=True)
+                results[username] = None
+
+        batches = [to_fetch[start:start + batch_size] for start in range(0, len(to_fetch), batch_size)]
+        batch_results = run_bounded(
+            lambda batch: LeetCodeService._fetch_batch(batch, target_role, wait_for_ai, fetch_profile),
+            batches,
+            max_concurrency,
+        )
+
+        for batch, batch_result in zip(batches, batch_results):
+            for username in batch:
+                results[username] = batch_result.get(username)
+        return {username: results.get(username) for username in usernames}
+
+    @staticmethod
+    def get_secondary_stats(username, datasets=('contest', 'tags'), force_refresh=False):
+        """
+        Returns {dataset: data} for the requested SECONDARY_DATASETS. Cached datasets are served from
+        secondary_cache; the rest are fetched together in one GraphQL request. A dataset that
+        couldn't be fetched maps to an error dict instead.
+        """
+        for dataset in datasets:
+            if dataset not in LeetCodeService.SECONDARY_DATASETS:
+                raise ValueError(f"Unknown LeetCode secondary dataset '{dataset}'")
+
+        cache_key = LeetCodeService._cache_key(username)
+        negative = LeetCodeService.negative_cache.get(cache_key)
+        if negative is not None and not force_refresh:
+            result = LeetCodeService._negative_result(username, negative)
+            return {dataset: result for dataset in datasets}
+
+        results = {}
+        missing = []
+        for dataset in dict.fromkeys(datasets):
+            cached = None if force_refresh else LeetCodeService.secondary_cache.get(f'{dataset}:{cache_key}')
+            if cached is not None:
+                results[dataset] = cached
+            else:
+                missing.append(dataset)
+        if not missing:
+            return results
+
+        fields = ''.join(LeetCodeService.SECONDARY_DATASETS[dataset] for dataset in missing)
+        query = f"query userSecondaryStats($username: String!) {{{fields}}}"
+        try:
+            response = http_client.post(
+                LeetCodeService.BASE_URL,
+                json={'query': query, 'variables': {'username': username}},
+                headers=LeetCodeService.HEADERS,
+            )
+            if response.status_code != 200:
+                logger.error(f"LeetCode API returned status {response.status_code} for secondary stats of {username}")
+                error = {'error': f'LeetCode API returned error status {response.status_code}.', 'username': username}
+                results.update({dataset: error for dataset in missing})
+                return results
+            data = response.json()
+        except CircuitOpenError:
+            results.update({dataset: LeetCodeService._unavailable_result(username) for dataset in missing})
+            return results
+        except DeadlineExceeded:
+            results.update({dataset: LeetCodeService._pending_result(username) for dataset in missing})
+            return results
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error fetching LeetCode secondary stats for {username}: {str(e)}")
+            results.update({dataset: {'error': 'Could not fetch data from LeetCode', 'username': username} for dataset in missing})
+            return results
+
+        payload = data.get('data') or {}
+        errors = data.get('errors') or []
+        for dataset in missing:
+            roots = LeetCodeService.SECONDARY_ROOTS[dataset]
+            dataset_errors = [
+                err.get('message', str(err)) for err in errors
+                if not err.get('path') or err['path'][0] in roots
+            ]
+            if dataset_errors:
+                results[dataset] = {'error': f'LeetCode API error: {", ".join(dataset_errors)}', 'username': username}
+                continue
+            if dataset == 'tags':
+                parsed = LeetCodeService._parse_tag_counts(payload.get('matchedUser'))
+            else:
+                parsed = LeetCodeService._parse_contest(payload)
+            if parsed is None:
+                results[dataset] = {
                     'error': f'User "{username}" does not exist on LeetCode or profile is private.',
                     'username': username,
-                    'exists': False
+                    'exists': False,
                 }
-            
-            # User exists, now get full stats
-            response = requests.post(
+                continue
+            LeetCodeService.secondary_cache.set(f'{dataset}:{cache_key}', parsed)
+            results[dataset] = parsed
+        return results
+
+    @staticmethod
+    def _parse_contest(payload):
+        ranking = payload.get('userContestRanking') or {}
+        history = payload.get('userContestRankingHistory') or []
+        return {
+            'rating': round(ranking['rating']) if ranking.get('rating') else None,
+            'attended_contests': ranking.get('attendedContestsCount', 0),
+            'global_ranking': ranking.get('globalRanking'),
+            'total_participants': ranking.get('totalParticipants'),
+            'top_percentage': ranking.get('topPercentage'),
+            # The history lists every contest; keep only the ones the user took part in
+            'history': [
+                {
+                    'title': (entry.get('contest') or {}).get('title'),
+                    'start_time': (entry.get('contest') or {}).get('startTime'),
+                    'rating': round(entry.get('rating') or 0),
+                    'ranking': entry.get('ranking'),
+                }
+                for entry in history if entry.get('attended')
+            ],
+        }
+
+    @staticmethod
+    def _parse_tag_counts(matched_user):
+        if not matched_user:
+            return None
+        counts = matched_user.get('tagProblemCounts') or {}
+        return {
+            level: sorted(
+                (
+                    {'tag': tag.get('tagName'), 'slug': tag.get('tagSlug'), 'solved': tag.get('problemsSolved', 0)}
+                    for tag in counts.get(level) or []
+                ),
+                key=lambda tag: tag['solved'],
+                reverse=True,
+            )
+            for level in ('fundamental', 'intermediate', 'advanced')
+        }
+
+    @staticmethod
+    def _cache_key(username):
+        return (username or '').strip().lower()
+
+    @staticmethod
+    def _check_fetch_profile(fetch_profile):
+        if fetch_profile not in LeetCodeService.FETCH_PROFILES:
+            raise ValueError(f"Unknown LeetCode fetch profile '{fetch_profile}'")
+
+    @staticmethod
+    def _payload_key(cache_key, fetch_profile):
+        # Full payloads keep the bare username as key; lighter profiles are stored next to them
+        return cache_key if fetch_profile == 'full' else f'{fetch_profile}:{cache_key}'
+
+    @staticmethod
+    def _cached_payload(cache_key, fetch_profile='full'):
+        # A cached full payload answers every lighter profile too
+        cached = LeetCodeService.profile_cache.get(cache_key)
+        if cached is None and fetch_profile != 'full':
+            cached = LeetCodeService.profile_cache.get(LeetCodeService._payload_key(cache_key, fetch_profile))
+        return cached
+
+    @staticmethod
+    def _cache_payload(cache_key, data, fetch_profile='full'):
+        # Complete profiles go to the profile cache and clean "no such user" answers to the
+        # negative cache; anything with errors is always re-fetched
+        if data.get('errors'):
+            return
+        if (data.get('data') or {}).get('matchedUser'):
+            LeetCodeService.profile_cache.set(LeetCodeService._payload_key(cache_key, fetch_profile), data)
+        else:
+            LeetCodeService.negative_cache.set(cache_key, {'checked_at': timezone.now().isoformat()})
+
+    @staticmethod
+    def _pending_result(username):
+        return {
+            'error': 'LeetCode did not answer before the request deadline; the result is still pending.',
+            'username': username,
+            'exists': None,
+            'pending': True,
+        }
+
+    @staticmethod
+    def prefetch(usernames, target_role="Mid-Level"):
+        """Fetches `usernames` into the profile cache in the background, outside any request deadline."""
+        usernames = list(usernames)
+        if usernames:
+            return LeetCodeService._prefetch_executor.submit(LeetCodeService._run_prefetch, usernames, target_role)
+        return None
+
+    @staticmethod
+    def _run_prefetch(usernames, target_role):
+        try:
+            LeetCodeService.get_many_user_stats(usernames, target_role)
+        except Exception as e:
+            logger.error(f"Background LeetCode prefetch failed: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _negative_result(username, entry):
+        return {
+            'error': f'User "{username}" does not exist on LeetCode or profile is private.',
+            'username': username,
+            'exists': False,
+            'negative_cached': True,
+            'checked_at': entry.get('checked_at'),
+        }
+
+    @staticmethod
+    def cache_stats():
+        """Hit/miss/eviction counters of the profile cache (memory tier plus persistent-tier hits)."""
+        return LeetCodeService.profile_cache.stats()
+
+    @staticmethod
+    def negative_cache_stats():
+        return LeetCodeService.negative_cache.stats()
+
+    @staticmethod
+    def upstream_status():
+        """Circuit breaker state for the LeetCode GraphQL host, e.g. {'state': 'open', 'retry_in_seconds': 12, ...}."""
+        return http_client.get_breaker_state(LeetCodeService.BASE_URL)
+
+    @staticmethod
+    def hedge_stats():
+        """How many hedged requests were sent to LeetCode and how many answered first (see LEETCODE_HEDGE_AFTER)."""
+        stats = http_client.get_pool_stats().get(http_client.host_key(LeetCodeService.BASE_URL), {})
+        return {'fired': stats.get('hedges_fired', 0), 'won': stats.get('hedges_won', 0)}
+
+    @staticmethod
+    def upstream_available():
+        status = LeetCodeService.upstream_status()
+        return not status or status['state'] != 'open' or not status['retry_in_seconds']
+
+    @staticmethod
+    def _unavailable_result(username):
+        return {
+            'error': 'LeetCode is temporarily unavailable (too many failed requests). Please try again shortly.',
+            'username': username,
+            'exists': None,
+            'upstream': LeetCodeService.upstream_status(),
+        }
+
+    @staticmethod
+    def single_flight_stats():
+        """How many get_user_stats fetches ran versus were coalesced onto an in-flight one."""
+        return LeetCodeService.single_flight.stats()
+
+    @staticmethod
+    def _fragment(fetch_profile='full'):
+        return f"""
+    fragment userProfileFields on UserNode {{{LeetCodeService.FETCH_PROFILES[fetch_profile]}}}
+    """
+
+    @staticmethod
+    def _single_query(fetch_profile='full'):
+        if fetch_profile == 'full':
+            return LeetCodeService.USER_PROFILE_QUERY
+        return """
+    query getUserProfile($username: String!) {
+        matchedUser(username: $username) {
+            ...userProfileFields
+        }
+    }
+    """ + LeetCodeService._fragment(fetch_profile)
+
+    @staticmethod
+    def _build_batch_query(usernames, fetch_profile='full'):
+        aliases = [f'u{i}' for i in range(len(usernames))]
+        params = ', '.join(f'${alias}: String!' for alias in aliases)
+        fields = '\n'.join(
+            f'        {alias}: matchedUser(username: ${alias}) {{ ...userProfileFields }}'
+            for alias in aliases
+        )
+        query = f"query getUserProfiles({params}) {{\n{fields}\n    }}\n" + LeetCodeService._fragment(fetch_profile)
+        variables = dict(zip(aliases, usernames))
+        return query, variables
+
+    @staticmethod
+    def _fetch_batch(usernames, target_role="Mid-Level", wait_for_ai=False, fetch_profile='full'):
+        """
+        Runs one aliased query for `usernames` and splits the payload back into per-user results.
+        """
+        query, variables = LeetCodeService._build_batch_query(usernames, fetch_profile)
+
+        try:
+            response = http_client.post(
                 LeetCodeService.BASE_URL,
                 json={'query': query, 'variables': variables},
-                headers={
-                    'Content-Type': 'application/json',
-                    'Referer': 'https://leetcode.com',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Origin': 'https://leetcode.com'
-                },
-                timeout=15
+                headers=LeetCodeService.HEADERS,
             )
-            
-            logger.debug(f"LeetCode API full query response status: {response.status_code}")
-            
+
+            logger.debug(f"LeetCode API batch response status: {response.status_code} for {len(usernames)} users")
+
             if response.status_code != 200:
-                logger.error(f"LeetCode API returned status {response.status_code} for full query user {username}")
+                logger.error(f"LeetCode API returned status {response.status_code} for batch of {len(usernames)} users")
                 logger.error(f"Response text: {response.text[:500]}")
-                # User exists but we can't get full stats - try to get basic info from simple query
-                profile = simple_matched.get('profile', {})
-                # Try to get submitStats from simple_matched if available
-                simple_stats = simple_matched.get('submitStats', {})
-                simple_ac = simple_stats.get('acSubmissionNum', []) if simple_stats else []
-                
-                total_solved = 0
-                for stat in simple_ac:
-                    if stat.get('difficulty') == 'All':
-                        total_solved = stat.get('count', 0)
-                        break
-                
-                # Try to get submissionCalendar from simple_matched
-                calendar_str = simple_matched.get('submissionCalendar', '{}')
-                import json
-                submission_calendar = json.loads(calendar_str)
-
                 return {
-                    'total_solved': total_solved,
-                    'easy_solved': 0,
-                    'medium_solved': 0,
-                    'hard_solved': 0,
-                    'total_submissions': 0,
-                    'acceptance_rate': 0,
-                    'ranking': profile.get('ranking', 0),
-                    'reputation': profile.get('reputation', 0),
-                    'star_rating': profile.get('starRating', 0),
-                    'real_name': profile.get('realName', ''),
-                    'avatar': profile.get('userAvatar', ''),
-                    'country': profile.get('countryName', ''),
-                    'company': profile.get('company', ''),
-                    'school': profile.get('school', ''),
-                    'error': 'Could not fetch complete statistics. Some data may be missing.',
-                    'username': username,
-                    'submission_calendar': submission_calendar
+                    username: {
+                        'error': f'LeetCode API returned error status {response.status_code}. The service may be temporarily unavailable.',
+                        'username': username,
+                        'exists': None
+                    }
+                    for username in usernames
                 }
-                
-            response.raise_for_status()
+
             data = response.json()
-            
-            # Log the full response for debugging
-            logger.debug(f"Full LeetCode API response for {username}: {data}")
-
-            if 'errors' in data:
-                error_details = data.get('errors', [])
-                error_messages = [err.get('message', str(err)) for err in error_details]
-                logger.error(f"LeetCode API error for user {username}: {error_messages}")
-                # User exists (we checked earlier), but full query failed
-                profile = simple_matched.get('profile', {})
-                # Try to get submissionCalendar from simple_matched
-                calendar_str = simple_matched.get('submissionCalendar', '{}')
-                import json
-                submission_calendar = json.loads(calendar_str)
-
-                # Get partial stats from simple query if available
-                simple_stats = simple_matched.get('submitStats', {})
-                simple_ac = simple_stats.get('acSubmissionNum', []) if simple_stats else []
-                total_solved = 0
-                for stat in simple_ac:
-                    if stat.get('difficulty') == 'All':
-                        total_solved = stat.get('count', 0)
-                        break
+        except CircuitOpenError:
+            logger.warning(f"LeetCode circuit breaker open; skipping batch of {len(usernames)} users")
+            return {username: LeetCodeService._unavailable_result(username) for username in usernames}
+        except DeadlineExceeded:
+            logger.warning(f"Request deadline reached before LeetCode answered for batch of {len(usernames)} users")
+            return {username: LeetCodeService._pending_result(username) for username in usernames}
+        except requests.exceptions.Timeout:
+            logger.error(f"Timeout while fetching LeetCode stats for batch {usernames}")
+            return {username: None for username in usernames}
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error fetching LeetCode stats for batch {usernames}: {str(e)}")
+            return {username: None for username in usernames}
+        except Exception as e:
+            logger.error(f"Unexpected error fetching LeetCode stats for batch {usernames}: {str(e)}", exc_info=True)
+            return {username: None for username in usernames}
 
-                return {
-                    'total_solved': total_solved,
-                    'easy_solved': 0,
-                    'medium_solved': 0,
-                    'hard_solved': 0,
-                    'total_submissions': 0,
-                    'acceptance_rate': 0,
-                    'ranking': profile.get('ranking', 0),
-                    'reputation': profile.get('reputation', 0),
-                    'star_rating': profile.get('starRating', 0),
-                    'real_name': profile.get('realName', ''),
-                    'avatar': profile.get('userAvatar', ''),
-                    'country': profile.get('countryName', ''),
-                    'company': profile.get('company', ''),
-                    'school': profile.get('school', ''),
-                    'error': f'Could not fetch full statistics. API errors: {", ".join(error_messages)}',
-                    'username': username,
-                    'submission_calendar': submission_calendar
-                }
+        batch_data = data.get('data') or {}
+        batch_errors = data.get('errors') or []
 
-            matched_user = data.get('data', {}).get('matchedUser')
-            if not matched_user:
-                # This shouldn't happen since we checked earlier, but handle it
-                logger.warning(f"LeetCode user '{username}' matchedUser is null in full query")
-                profile = simple_matched.get('profile', {})
-                # Try to get submissionCalendar from simple_matched
-                calendar_str = simple_matched.get('submissionCalendar', '{}')
-                import json
-                submission_calendar = json.loads(calendar_str)
-                
-                # Get partial stats from simple query if available
-                simple_stats = simple_matched.get('submitStats', {})
-                simple_ac = simple_stats.get('acSubmissionNum', []) if simple_stats else []
-                total_solved = 0
-                for stat in simple_ac:
-                    if stat.get('difficulty') == 'All':
-                        total_solved = stat.get('count', 0)
-                        break
-
-                # Return partial stats with a specific error message
-                return {
-                    'total_solved': total_solved,
-                    'easy_solved': 0,
-                    'medium_solved': 0,
-                    'hard_solved': 0,
-                    'total_submissions': 0,
-                    'acceptance_rate': 0,
-                    'ranking': profile.get('ranking', 0),
-                    'reputation': profile.get('reputation', 0),
-                    'star_rating': profile.get('starRating', 0),
-                    'real_name': profile.get('realName', ''),
-                    'avatar': profile.get('userAvatar', ''),
-                    'country': profile.get('countryName', ''),
-                    'company': profile.get('company', ''),
-                    'school': profile.get('school', ''),
-                    'error': 'Profile is private. Showing limited public information.',
-                    'username': username,
-                    'submission_calendar': submission_calendar
-                }
+        results = {}
+        for alias, username in variables.items():
+            # Errors carry a path starting at the alias they belong to; path-less errors apply to everyone
+            user_errors = [
+                err for err in batch_errors
+                if not err.get('path') or err['path'][0] == alias
+            ]
+            user_data = {'data': {'matchedUser': batch_data.get(alias)}}
+            if user_errors:
+                user_data['errors'] = user_errors
+            LeetCodeService._cache_payload(LeetCodeService._cache_key(username), user_data, fetch_profile)
+            try:
+                results[username] = LeetCodeService.parse_user_stats(username, user_data, target_role, wait_for_ai, fetch_profile)
+            except Exception as e:
+                logger.error(f"Unexpected error parsing LeetCode stats for {username}: {str(e)}", exc_info=True)
+                results[username] = None
+        return results
 
-            stats = matched_user.get('submitStats', {})
-            if not stats:
-                logger.warning(f"LeetCode user '{username}' has no submission stats")
-                return {
-                    'error': 'User profile exists but has no submission statistics. The user may not have solved any problems yet.',
-                    'username': username,
-                    'exists': True
-                }
-            
-            ac_submission_num = stats.get('acSubmissionNum', [])
-            if not ac_submission_num or len(ac_submission_num) == 0:
-                logger.warning(f"LeetCode user '{username}' has empty submission stats array")
-                profile = matched_user.get('profile', {})
+    @staticmethod
+    def parse_user_stats(username, data, target_role="Mid-Level", wait_for_ai=False, fetch_profile='full'):
+        """
+        Turns a raw `getUserProfile` GraphQL payload into the stats dict returned by get_user_stats.
+        Payloads fetched with a lighter profile are handed to parse_profile_summary.
+        """
+        if fetch_profile != 'full':
+            return LeetCodeService.parse_profile_summary(username, data, fetch_profile)
+
+        error_details = data.get('errors') or []
+        error_messages = [err.get('message', str(err)) for err in error_details]
+        matched_user = (data.get('data') or {}).get('matchedUser')
+
+        if not matched_user:
+            if error_messages:
+                logger.error(f"LeetCode API errors for user {username}: {error_messages}")
                 return {
-                    'error': 'User profile exists but has no solved problems or submission history.',
+                    'error': f'LeetCode API error: {", ".join(error_messages)}',
                     'username': username,
-                    'exists': True,
-                    'ranking': profile.get('ranking', 0),
-                    'reputation': profile.get('reputation', 0),
+                    'exists': None
                 }
-            
-            profile = matched_user.get('profile', {})
-            # Contest ranking removed from query as it's not available on UserNode
-            
-            # Log the raw stats for debugging
-            logger.debug(f"Raw stats for {username}: {ac_submission_num}")
-            
-            # Calculate total submissions and acceptance rate
-            total_submissions = 0
-            total_accepted = 0
-            found_all_difficulty = False
-            
-            for stat in ac_submission_num:
-                difficulty = stat.get('difficulty', '')
-                count = stat.get('count', 0)
-                submissions = stat.get('submissions', 0)
-                
-                logger.debug(f"Processing stat: difficulty={difficulty}, count={count}, submissions={submissions}")
-                
-                if difficulty == 'All':
-                    total_accepted = count
-                    total_submissions = submissions
-                    found_all_difficulty = True
-                elif difficulty == 'Easy':
-                    total_submissions += submissions
-                elif difficulty == 'Medium':
-                    total_submissions += submissions
-                elif difficulty == 'Hard':
-                    total_submissions += submissions
-            
-            # If we didn't find "All" difficulty, something is wrong with the data structure
-            if not found_all_difficulty:
-                logger.warning(f"LeetCode user '{username}' stats missing 'All' difficulty entry. Stats: {ac_submission_num}")
-                # Try to calculate from individual difficulties
-                total_accepted = sum(s.get('count', 0) for s in ac_submission_num if s.get('difficulty') != 'All')
-            
-            acceptance_rate = (total_accepted / total_submissions * 100) if total_submissions > 0 else 0
-            
-            # If all stats are zero, the user likely has no activity
-            if total_accepted == 0 and total_submissions == 0:
-                logger.warning(f"LeetCode user '{username}' has zero solved problems and zero submissions")
+            logger.warning(f"LeetCode user '{username}' not found. Response data: {data}")
+            return {
+                'error': f'User "{username}" does not exist on LeetCode or profile is private.',
+                'username': username,
+                'exists': False
+            }
+
+        if error_messages:
+            # User exists, but part of the query failed - return what did resolve
+            logger.error(f"LeetCode API error for user {username}: {error_messages}")
+            return LeetCodeService._partial_stats(
+                username,
+                matched_user,
+                f'Could not fetch full statistics. API errors: {", ".join(error_messages)}'
+            )
+
+        stats = matched_user.get('submitStats') or {}
+        if not stats:
+            logger.warning(f"LeetCode user '{username}' has no submission stats")
+            return {
+                'error': 'User profile exists but has no submission statistics. The user may not have solved any problems yet.',
+                'username': username,
+                'exists': True
+            }
+
+        profile = matched_user.get('profile') or {}
+
+        ac_submission_num = stats.get('acSubmissionNum', [])
+        if not ac_submission_num or len(ac_submission_num) == 0:
+            logger.warning(f"LeetCode user '{username}' has empty submission stats array")
+            return {
+                'error': 'User profile exists but has no solved problems or submission history.',
+                'username': username,
+                'exists': True,
+                'ranking': profile.get('ranking', 0),
+                'reputation': profile.get('reputation', 0),
+            }
+
+        # Contest ranking removed from query as it's not available on UserNode
+
+        # Log the raw stats for debugging
+        logger.debug(f"Raw stats for {username}: {ac_submission_num}")
+
+        # Calculate total submissions and acceptance rate
+        total_accepted, total_submissions, acceptance_rate = LeetCodeService._submission_totals(username, ac_submission_num)
+
+        # If all stats are zero, the user likely has no activity
+        if total_accepted == 0 and total_submissions == 0:
+            logger.warning(f"LeetCode user '{username}' has zero solved problems and zero submissions")
+            return {
+                'error': 'User profile exists but has no solved problems or submission history.',
+                'username': username,
+                'exists': True,
+                'ranking': profile.get('ranking', 0),
+                'reputation': profile.get('reputation', 0),
+            }
+
+        # Parse submission calendar
+        submission_calendar = LeetCodeService._parse_calendar(matched_user)
+
+        # Parse stats into a cleaner format
+        parsed_stats = {
+            'total_solved': 0,
+            'easy_solved': 0,
+            'medium_solved': 0,
+            'hard_solved': 0,
+            'total_submissions': total_submissions,
+            'total_attempts': LeetCodeService._attempt_total(matched_user),
+            'acceptance_rate': round(acceptance_rate, 2),
+            'ranking': profile.get('ranking', 0),
+            'reputation': profile.get('reputation', 0),
+            'star_rating': profile.get('starRating', 0),
+            'real_name': profile.get('realName', ''),
+            'avatar': profile.get('userAvatar', ''),
+            'country': profile.get('countryName', ''),
+            'company': profile.get('company', ''),
+            'school': profile.get('school', ''),
+            'submission_calendar': submission_calendar,
+        }
+
+        parsed_stats.update(LeetCodeService._solved_counts(ac_submission_num))
+
+        # Contest rating/history and tag counts are secondary datasets, see get_secondary_stats
+
+        # Final validation - if total_solved is 0, check if user actually has any activity
+        if parsed_stats['total_solved'] == 0 and parsed_stats['ranking'] == 0:
+            logger.warning(f"LeetCode user '{username}' appears to have no activity (all zeros)")
+            # Still return the data but log it
+            logger.debug(f"Returning stats for {username}: {parsed_stats}")
+
+        # Calculate advanced metrics
+        advanced_metrics = LeetCodeService.calculate_advanced_metrics(parsed_stats, target_role, include_ai=wait_for_ai)
+        parsed_stats.update(advanced_metrics)
+
+        logger.info(f"Successfully fetched LeetCode stats for {username}: {parsed_stats['total_solved']} problems solved, ranking: {parsed_stats['ranking']}")
+        return parsed_stats
+
+    @staticmethod
+    def parse_profile_summary(username, data, fetch_profile='standard'):
+        """
+        Parses a 'minimal' or 'standard' payload. Missing users and API errors give the same dicts
+        as parse_user_stats; otherwise the result only holds what that profile requested
+        (no scoring or recommendations).
+        """
+        error_details = data.get('errors') or []
+        error_messages = [err.get('message', str(err)) for err in error_details]
+        matched_user = (data.get('data') or {}).get('matchedUser')
+
+        if not matched_user:
+            if error_messages:
                 return {
-                    'error': 'User profile exists but has no solved problems or submission history.',
+                    'error': f'LeetCode API error: {", ".join(error_messages)}',
                     'username': username,
-                    'exists': True,
-                    'ranking': profile.get('ranking', 0),
-                    'reputation': profile.get('reputation', 0),
+                    'exists': None
                 }
-            
-            # Parse submission calendar
-            calendar_str = matched_user.get('submissionCalendar', '{}')
-            import json
-            submission_calendar = json.loads(calendar_str)
-
-            # Parse stats into a cleaner format
-            parsed_stats = {
-                'total_solved': 0,
-                'easy_solved': 0,
-                'medium_solved': 0,
-                'hard_solved': 0,
-                'total_submissions': total_submissions,
-                'acceptance_rate': round(acceptance_rate, 2),
-                'ranking': profile.get('ranking', 0),
-                'reputation': profile.get('reputation', 0),
-                'star_rating': profile.get('starRating', 0),
-                'real_name': profile.get('realName', ''),
-                'avatar': profile.get('userAvatar', ''),
-                'country': profile.get('countryName', ''),
-                'company': profile.get('company', ''),
-                'school': profile.get('school', ''),
-                'submission_calendar': submission_calendar,
+            return {
+                'error': f'User "{username}" does not exist on LeetCode or profile is private.',
+                'username': username,
+                'exists': False
             }
 
-            for stat in ac_submission_num:
-                difficulty = stat.get('difficulty', '')
-                count = stat.get('count', 0)
-                if difficulty == 'All':
-                    parsed_stats['total_solved'] = count
-                elif difficulty == 'Easy':
-                    parsed_stats['easy_solved'] = count
-                elif difficulty == 'Medium':
-                    parsed_stats['medium_solved'] = count
-                elif difficulty == 'Hard':
-                    parsed_stats['hard_solved'] = count
-            
-            # Contest information not available in current API structure
-            # Can be added later if needed with a separate query
-
-            # Final validation - if total_solved is 0, check if user actually has any activity
-            if parsed_stats['total_solved'] == 0 and parsed_stats['ranking'] == 0:
-                logger.warning(f"LeetCode user '{username}' appears to have no activity (all zeros)")
-                # Still return the data but log it
-                logger.debug(f"Returning stats for {username}: {parsed_stats}")
-            
-            # Calculate advanced metrics
-            advanced_metrics = LeetCodeService.calculate_advanced_metrics(parsed_stats, target_role)
-            parsed_stats.update(advanced_metrics)
-            
-            logger.info(f"Successfully fetched LeetCode stats for {username}: {parsed_stats['total_solved']} problems solved, ranking: {parsed_stats['ranking']}")
-            return parsed_stats
+        summary = {
+            'username': matched_user.get('username') or username,
+            'exists': True,
+            'fetch_profile': fetch_profile,
+        }
+        if fetch_profile == 'minimal':
+            return summary
 
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout while fetching LeetCode stats for {username}")
-            return None
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request error fetching LeetCode stats for {username}: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error fetching LeetCode stats for {username}: {str(e)}", exc_info=True)
-            return None
+        ac_submission_num = (matched_user.get('submitStats') or {}).get('acSubmissionNum') or []
+        profile = matched_user.get('profile') or {}
+        _, total_submissions, acceptance_rate = LeetCodeService._submission_totals(username, ac_submission_num)
+        summary.update({
+            'total_solved': 0,
+            'easy_solved': 0,
+            'medium_solved': 0,
+            'hard_solved': 0,
+            'total_submissions': total_submissions,
+            'total_attempts': LeetCodeService._attempt_total(matched_user),
+            'acceptance_rate': round(acceptance_rate, 2),
+            'ranking': profile.get('ranking', 0),
+            'reputation': profile.get('reputation', 0),
+        })
+        summary.update(LeetCodeService._solved_counts(ac_submission_num))
+        if error_messages:
+            summary['error'] = f'Could not fetch full statistics. API errors: {", ".join(error_messages)}'
+        return summary
+
+    @staticmethod
+    def _attempt_total(matched_user):
+        """All submissions, accepted or not, from totalSubmissionNum (acSubmissionNum only counts accepted ones)."""
+        total_submission_num = (matched_user.get('submitStats') or {}).get('totalSubmissionNum') or []
+        for stat in total_submission_num:
+            if stat.get('difficulty') == 'All':
+                return stat.get('submissions', 0)
+        return sum(stat.get('submissions', 0) for stat in total_submission_num)
+
+    @staticmethod
+    def _submission_totals(username, ac_submission_num):
+        """Returns (total_accepted, total_submissions, acceptance_rate) from acSubmissionNum."""
+        total_submissions = 0
+        total_accepted = 0
+        found_all_difficulty = False
+
+        for stat in ac_submission_num:
+            difficulty = stat.get('difficulty', '')
+            count = stat.get('count', 0)
+            submissions = stat.get('submissions', 0)
+
+            logger.debug(f"Processing stat: difficulty={difficulty}, count={count}, submissions={submissions}")
+
+            if difficulty == 'All':
+                total_accepted = count
+                total_submissions = submissions
+                found_all_difficulty = True
+            elif difficulty == 'Easy':
+                total_submissions += submissions
+            elif difficulty == 'Medium':
+                total_submissions += submissions
+            elif difficulty == 'Hard':
+                total_submissions += submissions
+
+        # If we didn't find "All" difficulty, something is wrong with the data structure
+        if ac_submission_num and not found_all_difficulty:
+            logger.warning(f"LeetCode user '{username}' stats missing 'All' difficulty entry. Stats: {ac_submission_num}")
+            # Try to calculate from individual difficulties
+            total_accepted = sum(s.get('count', 0) for s in ac_submission_num if s.get('difficulty') != 'All')
+
+        acceptance_rate = (total_accepted / total_submissions * 100) if total_submissions > 0 else 0
+        return total_accepted, total_submissions, acceptance_rate
+
+    @staticmethod
+    def _solved_counts(ac_submission_num):
+        counts = {}
+        for stat in ac_submission_num:
+            difficulty = stat.get('difficulty', '')
+            count = stat.get('count', 0)
+            if difficulty == 'All':
+                counts['total_solved'] = count
+            elif difficulty == 'Easy':
+                counts['easy_solved'] = count
+            elif difficulty == 'Medium':
+                counts['medium_solved'] = count
+            elif difficulty == 'Hard':
+                counts['hard_solved'] = count
+        return counts
+
+    @staticmethod
+    def _parse_calendar(matched_user):
+        calendar_str = matched_user.get('submissionCalendar') or '{}'
+        try:
+            return json.loads(calendar_str)
+        except (TypeError, ValueError):
+            logger.warning(f"Could not parse submissionCalendar for {matched_user.get('username')}")
+            return {}
+
+    @staticmethod
+    def _partial_stats(username, matched_user, error):
+        """
+        Builds the limited stats dict returned when the user exists but only part of the profile resolved.
+        """
+        profile = matched_user.get('profile') or {}
+        submission_calendar = LeetCodeService._parse_calendar(matched_user)
+
+        # Get partial stats if the submitStats field resolved
+        partial_stats = matched_user.get('submitStats') or {}
+        partial_ac = partial_stats.get('acSubmissionNum') or []
+        total_solved = 0
+        for stat in partial_ac:
+            if stat.get('difficulty') == 'All':
+                total_solved = stat.get('count', 0)
+                break
+
+        return {
+            'total_solved': total_solved,
+            'easy_solved': 0,
+            'medium_solved': 0,
+            'hard_solved': 0,
+            'total_submissions': 0,
+            'acceptance_rate': 0,
+            'ranking': profile.get('ranking', 0),
+            'reputation': profile.get('reputation', 0),
+            'star_rating': profile.get('starRating', 0),
+            'real_name': profile.get('realName', ''),
+            'avatar': profile.get('userAvatar', ''),
+            'country': profile.get('countryName', ''),
+            'company': profile.get('company', ''),
+            'school': profile.get('school', ''),
+            'error': error,
+            'username': username,
+            'submission_calendar': submission_calendar
+        }
 
 
     @staticmethod
-    def calculate_advanced_metrics(stats, target_role="Mid-Level"):
+    def calculate_advanced_metrics(stats, target_role="Mid-Level", include_ai=False):
         """
         Calculates advanced metrics with role-based weighting and returns a detailed breakdown.
+        With include_ai=True the recommendations come from the LLM (blocking on it); otherwise
+        the rule-based recommendations are returned.
         """
         try:
             # Define Weight Profiles
@@ -495,45 +1046,25 @@ class LeetCodeService:
             unified_score = round(final_score)
             
             
-            # Generate personalized recommendations
+            # Rule-based recommendations are always available immediately. AI recommendations
+            # are generated here only when the caller opts in; otherwise see
+            # recommendation_service.queue_ai_recommendations.
             recommendations = []
+            recommendations_source = 'rules'
             
-            try:
-                from api.services.coding_profile_analysis_service import generate_text_fireworks
-                import json
+            if include_ai:
+                from api.services.recommendation_service import build_recommendation_inputs, generate_ai_recommendations
                 
-                ai_prompt = f"""
-                As an expert technical coach, provide 3 specific, actionable recommendations for a {target_role} software engineer based on these LeetCode stats:
-                - Total Solved: {stats.get('total_solved')}
-                - Easy: {easy}, Medium: {medium}, Hard: {hard}
-                - Weighted Acceptance Rate: {weighted_acceptance_rate}%
-                - Max Streak: {max_streak} days
-                - Community Reputation: {reputation}
-                
-                The recommendations should be highly specific (e.g., mention specific LeetCode study plans, problem patterns, or practice habits).
-                Return ONLY a JSON list of 3 strings. Example: ["Recommendation 1", "Recommendation 2", "Recommendation 3"]
-                """
-                
-                ai_response = generate_text_fireworks(ai_prompt, system_prompt="You are a helpful technical coaching assistant that only speaks JSON.")
-                
-                if not ai_response or "Error" in ai_response:
-                    raise ValueError(f"AI service error: {ai_response}")
-                if "```json" in ai_response:
-                    ai_response = ai_response.split("```json")[1].split("```")[0].strip()
-                elif "```" in ai_response:
-                    ai_response = ai_response.split("```")[1].split("```")[0].strip()
-                
-                recommendations = json.loads(ai_response)
-                
-                if not isinstance(recommendations, list) or len(recommendations) == 0:
-                    raise ValueError("Invalid AI response format")
-                
-                # Ensure we only have strings and limit to 3
-                recommendations = [str(r) for r in recommendations[:3]]
-                
-            except Exception as e:
-                logger.warning(f"AI recommendation generation failed, falling back to rules: {str(e)}")
-                # Fallback to rule-based recommendations
+                ai_recommendations = generate_ai_recommendations(build_recommendation_inputs({
+                    **stats,
+                    'weighted_acceptance_rate': weighted_acceptance_rate,
+                    'max_streak': max_streak,
+                }, target_role))
+                if ai_recommendations:
+                    recommendations = ai_recommendations
+                    recommendations_source = 'ai'
+            
+            if not recommendations:
                 if comp_difficulty < 40:
                     recommendations.append("Start with the 'LeetCode 75' study plan to build a strong foundation in Medium problems.")
                 elif comp_difficulty < 70:
@@ -592,7 +1123,8 @@ class LeetCodeService:
                         "value": f"{reputation} Rep"
                     }
                 },
-                "recommendations": recommendations
+                "recommendations": recommendations,
+                "recommendations_source": recommendations_source
             }
             
             return {
@@ -0,0 +1,91 @@
+"""
+Coding platform adapters.
+
+Each supported platform registers an adapter with the same fetch interface, so callers such as
+CodingProfileViewSet don't need per-platform branches. fetch_many fans fetches for several
+platforms out concurrently; the total time is that of the slowest platform.
+"""
+from api.services.concurrency import run_bounded
+from api.services.hackerrank_service import HackerRankService
+from api.services.leetcode_service import LeetCodeService
+
+_registry = {}
+
+
+class PlatformAdapter:
+    """Common fetch interface for one coding platform."""
+    name = None
+    # Whether stats from this platform feed recommendation_service's AI recommendations
+    ai_recommendations = False
+
+    def fetch_stats(self, username, wait_for_ai=False, force_refresh=False):
+        """Returns the platform's stats dict for `username`, or None if it couldn't be fetched."""
+        raise NotImplementedError
+
+    def upstream_available(self):
+        return True
+
+    def upstream_status(self):
+        return None
+
+    def warm_cache(self, usernames):
+        """Finishes fetches a request gave up on in the background, where the platform supports it."""
+
+
+class LeetCodeAdapter(PlatformAdapter):
+    name = 'leetcode'
+    ai_recommendations = True
+
+    def fetch_stats(self, username, wait_for_ai=False, force_refresh=False):
+        return LeetCodeService.get_user_stats(username, wait_for_ai=wait_for_ai, force_refresh=force_refresh)
+
+    def upstream_available(self):
+        return LeetCodeService.upstream_available()
+
+    def upstream_status(self):
+        return LeetCodeService.upstream_status()
+
+    def warm_cache(self, usernames):
+        LeetCodeService.prefetch(usernames)
+
+
+class HackerRankAdapter(PlatformAdapter):
+    name = 'hackerrank'
+
+    def fetch_stats(self, username, wait_for_ai=False, force_refresh=False):
+        return HackerRankService.get_user_stats(username, force_refresh=force_refresh)
+
+    def warm_cache(self, usernames):
+        HackerRankService.prefetch(usernames)
+
+
+def register(adapter):
+    _registry[adapter.name] = adapter
+    return adapter
+
+
+def get_adapter(platform):
+    return _registry.get(platform)
+
+
+def registered_platforms():
+    return list(_registry)
+
+
+def fetch_many(targets, wait_for_ai=False, force_refresh=False):
+    """
+    Fetches stats for (platform, username) pairs concurrently.
+    Returns results in the same order; unregistered platforms give None.
+    """
+    def fetch(target):
+        adapter = get_adapter(target[0])
+        if adapter is None:
+            return None
+        return adapter.fetch_stats(target[1], wait_for_ai=wait_for_ai, force_refresh=force_refresh)
+
+    targets = list(targets)
+    return run_bounded(fetch, targets, max_workers=len(targets))
+
+
+register(LeetCodeAdapter())
+register(HackerRankAdapter())
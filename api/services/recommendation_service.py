@@ -0,0 +1,174 @@
+"""
+AI (LLM) coaching recommendations for LeetCode stats.
+
+Stats fetches only return the rule-based recommendations from LeetCodeService.calculate_advanced_metrics.
+The AI version is generated afterwards on a small background pool and attached to the stored record
+(LeetCodeAnalysisHistory.analysis_data / CodingProfile.analysis) once the model answers.
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api.services.cache import TieredCache, fingerprint
+
+logger = logging.getLogger(__name__)
+
+AI_RECOMMENDATION_WORKERS = config("AI_RECOMMENDATION_WORKERS", default=2, cast=int)
+
+# LLM output memoized by a fingerprint of the prompt inputs, so unchanged profiles skip the model call
+LLM_CACHE_TTL = config("LLM_CACHE_TTL", default=7 * 24 * 3600, cast=int)
+LLM_CACHE_MAX_SIZE = config("LLM_CACHE_MAX_SIZE", default=1000, cast=int)
+LLM_PERSISTENT_CACHE_MAX_ENTRIES = config("LLM_PERSISTENT_CACHE_MAX_ENTRIES", default=20000, cast=int)
+llm_cache = TieredCache(
+    'llm',
+    ttl=LLM_CACHE_TTL,
+    max_size=LLM_CACHE_MAX_SIZE,
+    max_entries=LLM_PERSISTENT_CACHE_MAX_ENTRIES,
+)
+
+_executor = ThreadPoolExecutor(max_workers=AI_RECOMMENDATION_WORKERS, thread_name_prefix='ai-recommendations')
+
+
+def build_recommendation_inputs(stats, target_role=None):
+    """
+    Picks the values the recommendation prompt is built from out of a scored stats dict.
+    """
+    breakdown = stats.get('score_breakdown') or {}
+    return {
+        'role': target_role or breakdown.get('role') or 'Mid-Level',
+        'total_solved': stats.get('total_solved', 0),
+        'easy_solved': stats.get('easy_solved', 0),
+        'medium_solved': stats.get('medium_solved', 0),
+        'hard_solved': stats.get('hard_solved', 0),
+        'weighted_acceptance_rate': stats.get('weighted_acceptance_rate', 0),
+        'max_streak': stats.get('max_streak', 0),
+        'reputation': stats.get('reputation', 0),
+    }
+
+
+def recommendation_cache_key(inputs):
+    return fingerprint('recommendations', inputs)
+
+
+def generate_ai_recommendations(inputs):
+    """
+    Asks the LLM for 3 recommendations. Returns a list of strings, or None if the call failed.
+    Results are served from llm_cache when the same inputs were seen before.
+    """
+    from api.services.coding_profile_analysis_service import generate_text_fireworks
+
+    cache_key = recommendation_cache_key(inputs)
+    cached = llm_cache.get(cache_key)
+    if cached:
+        return cached
+
+    ai_prompt = f"""
+    As an expert technical coach, provide 3 specific, actionable recommendations for a {inputs['role']} software engineer based on these LeetCode stats:
+    - Total Solved: {inputs['total_solved']}
+    - Easy: {inputs['easy_solved']}, Medium: {inputs['medium_solved']}, Hard: {inputs['hard_solved']}
+    - Weighted Acceptance Rate: {inputs['weighted_acceptance_rate']}%
+    - Max Streak: {inputs['max_streak']} days
+    - Community Reputation: {inputs['reputation']}
+
+    The recommendations should be highly specific (e.g., mention specific LeetCode study plans, problem patterns, or practice habits).
+    Return ONLY a JSON list of 3 strings. Example: ["Recommendation 1", "Recommendation 2", "Recommendation 3"]
+    """
+
+    try:
+        ai_response = generate_text_fireworks(ai_prompt, system_prompt="You are a helpful technical coaching assistant that only speaks JSON.")
+
+        if not ai_response or "Error" in ai_response:
+            raise ValueError(f"AI service error: {ai_response}")
+        if "```json" in ai_response:
+            ai_response = ai_response.split("```json")[1].split("```")[0].strip()
+        elif "```" in ai_response:
+            ai_response = ai_response.split("```")[1].split("```")[0].strip()
+
+        recommendations = json.loads(ai_response)
+
+        if not isinstance(recommendations, list) or len(recommendations) == 0:
+            raise ValueError("Invalid AI response format")
+
+        # Ensure we only have strings and limit to 3
+        recommendations = [str(r) for r in recommendations[:3]]
+        llm_cache.set(cache_key, recommendations)
+        return recommendations
+    except Exception as e:
+        logger.warning(f"AI recommendation generation failed: {str(e)}")
+        return None
+
+
+def _update_records(result, history_id=None, profile_id=None):
+    from api.coding_platform_models import CodingProfile, LeetCodeAnalysisHistory
+
+    if history_id:
+        history = LeetCodeAnalysisHistory.objects.filter(id=history_id).first()
+        if history:
+            history.analysis_data = {**(history.analysis_data or {}), **result}
+            history.save(update_fields=['analysis_data'])
+
+    if profile_id:
+        profile = CodingProfile.objects.filter(id=profile_id).first()
+        if profile:
+            profile.analysis = {**(profile.analysis or {}), **result}
+            profile.save(update_fields=['analysis', 'updated_at'])
+
+
+def _ready_result(recommendations):
+    return {
+        'ai_recommendations': recommendations,
+        'ai_recommendations_status': 'ready' if recommendations else 'failed',
+        'ai_recommendations_generated_at': timezone.now().isoformat(),
+    }
+
+
+def attach_ai_recommendations(inputs, history_id=None, profile_id=None):
+    """
+    Generates AI recommendations and stores them on the given history row and/or coding profile.
+    Returns the recommendations (None on failure).
+    """
+    recommendations = generate_ai_recommendations(inputs)
+    _update_records(_ready_result(recommendations), history_id, profile_id)
+    return recommendations
+
+
+def _run_in_background(inputs, history_id, profile_id):
+    try:
+        return attach_ai_recommendations(inputs, history_id=history_id, profile_id=profile_id)
+    except Exception as e:
+        logger.error(f"Background AI recommendation job failed: {str(e)}", exc_info=True)
+        return None
+    finally:
+        # Worker threads get their own DB connection; don't leave it open between jobs
+        close_old_connections()
+
+
+def queue_ai_recommendations(stats, history=None, profile=None):
+    """
+    Attaches AI recommendations for `stats` to the saved history row and/or coding profile.
+
+    If the stats were fetched with wait_for_ai, or llm_cache already holds recommendations for
+    the same inputs, they are stored straight away. Otherwise the records are marked pending and
+    generation runs in the background.
+    Returns the Future of the background job, or None when nothing was queued.
+    """
+    history_id = history.id if history is not None else None
+    profile_id = profile.id if profile is not None else None
+    breakdown = stats.get('score_breakdown') or {}
+
+    if breakdown.get('recommendations_source') == 'ai':
+        _update_records(_ready_result(breakdown.get('recommendations')), history_id, profile_id)
+        return None
+
+    inputs = build_recommendation_inputs(stats)
+    cached = llm_cache.get(recommendation_cache_key(inputs))
+    if cached:
+        _update_records(_ready_result(cached), history_id, profile_id)
+        return None
+
+    _update_records({'ai_recommendations_status': 'pending'}, history_id, profile_id)
+    return _executor.submit(_run_in_background, inputs, history_id, profile_id)
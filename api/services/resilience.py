@@ -0,0 +1,200 @@
+"""
+Upstream protection for the outbound HTTP layer: per-host token-bucket rate limiting,
+exponential backoff with jitter, and a circuit breaker that fails fast while a host is unhealthy.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.utils import timezone
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request while the host's circuit breaker is open."""
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Takes a token if one is available right now, without waiting."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """Blocks until a token is available. Returns False if that would take longer than `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects requests for `recovery_timeout`
+    seconds. After that a single trial request is let through (half-open); its outcome closes or
+    re-opens the circuit.
+
+    With a `shared` store (a PersistentCache), opening the circuit is recorded under `name` so every
+    worker process fails fast, not just the one that saw the failures. Other processes' state is
+    re-read at most once every `shared_refresh` seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30, shared=None, name=None, shared_refresh=1.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.shared = shared
+        self.name = name
+        self.shared_refresh = shared_refresh
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._shared_checked_at = None
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow_request(self):
+        self._refresh_shared()
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            was_closed = self._state == self.CLOSED
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+        if not was_closed and self.shared is not None:
+            self.shared.delete(self.name)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            opened = self._state == self.HALF_OPEN or self._failures >= self.failure_threshold
+            if opened:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+        if opened and self.shared is not None:
+            # Wall-clock time, since monotonic clocks aren't comparable across processes
+            self.shared.set(
+                self.name,
+                {'opened_until': time.time() + self.recovery_timeout},
+                ttl=self.recovery_timeout,
+            )
+
+    def release(self):
+        """Frees the half-open trial slot when a request was abandoned before it had an outcome."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _refresh_shared(self):
+        """Adopts a circuit opened by another process."""
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        if self._shared_checked_at is not None and now - self._shared_checked_at < self.shared_refresh:
+            return
+        self._shared_checked_at = now
+        state = self.shared.get(self.name)
+        remaining = (state or {}).get('opened_until', 0) - time.time()
+        if remaining <= 0:
+            return
+        with self._lock:
+            opened_at = now - (self.recovery_timeout - remaining)
+            if self._state != self.OPEN or opened_at > self._opened_at:
+                self._state = self.OPEN
+                self._opened_at = opened_at
+                self._trial_in_flight = False
+
+    @property
+    def is_closed(self):
+        self._refresh_shared()
+        with self._lock:
+            return self._state == self.CLOSED
+
+    @property
+    def is_open(self):
+        self._refresh_shared()
+        with self._lock:
+            return self._state == self.OPEN and time.monotonic() - self._opened_at < self.recovery_timeout
+
+    def as_dict(self):
+        self._refresh_shared()
+        with self._lock:
+            retry_in = None
+            if self._state == self.OPEN:
+                retry_in = max(0, round(self.recovery_timeout - (time.monotonic() - self._opened_at), 1))
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'retry_in_seconds': retry_in,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(response, cap=60.0):
+    """Parses a Retry-After header (delta-seconds or HTTP date). Returns None if absent or invalid."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - timezone.now()).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(cap, seconds))
+
+
+def is_retryable_status(status_code):
+    return status_code == 429 or status_code >= 500
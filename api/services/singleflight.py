@@ -0,0 +1,177 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight call instead of each hitting upstream:
+- within a worker, followers wait on the leader thread and receive its result (or exception);
+- across workers, the leader holds a short lease row in CacheEntry. Other workers wait for the
+  leader's result to show up in the shared cache tier, and only fetch themselves if it never does.
+  Leases left behind by dead workers are purged with the rest of the persistent tier.
+  Each lease row carries its owner's token, so a worker only ever releases a lease it still holds.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from api.services import deadline
+from api.services.cache import PersistentCache, ensure_purge_thread
+
+logger = logging.getLogger(__name__)
+
+# _acquire_lease result when the lease table can't be reached: fetch anyway, but there is no lease to release
+_NO_LEASE = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name, lease_ttl=20, poll_interval=0.2):
+        self.name = name
+        self.lease_namespace = f'{name}:lease'
+        self.lease_ttl = lease_ttl
+        # Registers the lease namespace with the persistent-tier purge (thread and purge_cache)
+        self.leases = PersistentCache(self.lease_namespace, ttl=lease_ttl)
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+
+    def do(self, key, fn, load_shared=None):
+        """
+        Runs `fn()` once for all concurrent callers of `key` and returns its result to each of them.
+
+        `load_shared()` should read the result the leader stores in the shared cache tier; when given,
+        callers in other workers wait on the leader's lease and use that instead of calling `fn`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            self._count('coalesced')
+            # Followers stop waiting at their own request deadline; the leader carries on
+            if not call.done.wait(deadline.remaining()):
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting on in-flight {self.name} call")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_as_leader(key, fn, load_shared)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def _run_as_leader(self, key, fn, load_shared):
+        if load_shared is None:
+            self._count('executed')
+            return fn()
+
+        lease = self._acquire_lease(key)
+        if lease is None:
+            shared = self._wait_for_remote(key, load_shared)
+            if shared is not None:
+                self._count('coalesced_remote')
+                return shared
+            # The other worker didn't produce a usable result; fetch it ourselves
+            lease = self._acquire_lease(key)
+
+        try:
+            self._count('executed')
+            return fn()
+        finally:
+            if lease is not None and lease is not _NO_LEASE:
+                self._release_lease(key, lease)
+
+    def _wait_for_remote(self, key, load_shared):
+        wait_until = time.monotonic() + self.lease_ttl
+        while time.monotonic() < wait_until:
+            deadline.check()
+            shared = load_shared()
+            if shared is not None:
+                return shared
+            if not self._lease_held(key):
+                return load_shared()
+            time.sleep(self.poll_interval)
+        return None
+
+    def _acquire_lease(self, key):
+        """
+        Returns the owner token of a newly taken lease, None if another worker holds it, or
+        _NO_LEASE if the lease table can't be reached.
+        """
+        from api.cache_models import CacheEntry
+
+        ensure_purge_thread()
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.lease_ttl)
+        token = uuid.uuid4().hex
+        try:
+            try:
+                with transaction.atomic():
+                    CacheEntry.objects.create(
+                        namespace=self.lease_namespace, key=key, value={'owner': token}, expires_at=expires_at
+                    )
+                return token
+            except IntegrityError:
+                # Take over leases left behind by a worker that died mid-fetch
+                taken = CacheEntry.objects.filter(
+                    namespace=self.lease_namespace, key=key, expires_at__lte=now
+                ).update(value={'owner': token}, expires_at=expires_at)
+                return token if taken == 1 else None
+        except Exception as e:
+            logger.warning(f"Could not acquire single-flight lease {self.lease_namespace}:{key}: {str(e)}")
+            return _NO_LEASE
+
+    def _lease_held(self, key):
+        from api.cache_models import CacheEntry
+
+        try:
+            return CacheEntry.objects.filter(
+                namespace=self.lease_namespace, key=key, expires_at__gt=timezone.now()
+            ).exists()
+        except Exception:
+            return False
+
+    def _release_lease(self, key, token):
+        from api.cache_models import CacheEntry
+
+        # Our lease may have expired and been taken over; only delete it if we still own it
+        try:
+            CacheEntry.objects.filter(namespace=self.lease_namespace, key=key, value__owner=token).delete()
+        except Exception as e:
+            logger.warning(f"Could not release single-flight lease {self.lease_namespace}:{key}: {str(e)}")
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'name': self.name,
+                'in_flight': len(self._calls),
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'coalesced_remote': self.coalesced_remote,
+            }
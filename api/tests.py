@@ -1,3 +1,1459 @@
-from django.test import TestCase
+import json
+import socket
+import threading
+import time as time_module
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.cache_models import CacheEntry
+from api.coding_platform_models import (
+    CodingProfile, Employee, EmployeeGoal, LeetCodeAnalysisHistory, LeetCodeLatestSnapshot,
+)
+from api.management.commands import upstream_standin
+from api.models import User
+from api.services import employee_sync_service, http_client
+from api.services.cache import PersistentCache, TieredCache, TTLLRUCache, fingerprint, purge_persistent_caches
+from api.services.coding_profile_analysis_service import CodingProfileAnalysisService, analysis_cache_key
+from api.services.concurrency import run_bounded
+from api.services.deadline import DeadlineExceeded
+from api.services.dns_cache import DNSCache
+from api.services.employee_sync_service import (
+    has_new_activity, rebuild_latest_snapshots, record_snapshot, snapshot_expired, update_latest_snapshot,
+)
+from api.services.hackerrank_service import HackerRankService
+from api.services.leetcode_service import LeetCodeService
+from api.services.recommendation_service import generate_ai_recommendations, llm_cache, queue_ai_recommendations
+from api.services.resilience import CircuitBreaker, CircuitOpenError, retry_after_seconds
+from api.services.singleflight import SingleFlight
+
+
+class CompanyDataTestCase(TestCase):
+    """A company with employees, two snapshots each and a couple of goals."""
+
+    def setUp(self):
+        self.company = User.objects.create(username='acme', role='company')
+        self.client = APIClient()
+        self.client.force_authenticate(self.company)
+
+    def add_employees(self, count):
+        for _ in range(count):
+            n = Employee.objects.count()
+            employee = Employee.objects.create(
+                company=self.company,
+                name=f'Employee {n}',
+                leetcode_username=f'user{n}',
+                leetcode_url=f'https://leetcode.com/u/user{n}/',
+            )
+            for days_ago, solved in ((1, n), (0, n + 10)):
+                history = LeetCodeAnalysisHistory.objects.create(
+                    company=self.company,
+                    employee_identifier=employee.leetcode_username,
+                    leetcode_username=employee.leetcode_username,
+                    total_solved=solved,
+                    problem_solving_score=solved / 2,
+                )
+                # analyzed_at is auto_now_add; backdate the older snapshot explicitly
+                LeetCodeAnalysisHistory.objects.filter(pk=history.pk).update(
+                    analyzed_at=timezone.now() - timedelta(days=days_ago)
+                )
+            EmployeeGoal.objects.create(
+                employee=employee, company=self.company, metric_type='total_solved',
+                target_value=100, target_date=timezone.now() + timedelta(days=30),
+            )
+            EmployeeGoal.objects.create(
+                employee=employee, company=self.company, metric_type='total_solved',
+                target_value=10, target_date=timezone.now(), is_active=False, achieved_at=timezone.now(),
+            )
+        # Snapshots were written directly rather than through record_snapshot
+        rebuild_latest_snapshots(self.company.id)
+
+
+class EmployeeListQueryCountTests(CompanyDataTestCase):
+    """The company employee listing must not run per-employee queries."""
+
+    def list_employees(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/company/employees/')
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_query_count_is_constant(self):
+        self.add_employees(2)
+        _, small = self.list_employees()
+        self.add_employees(10)
+        data, large = self.list_employees()
+        self.assertEqual(len(data), 12)
+        self.assertEqual(small, large)
+
+    def test_latest_stats_and_goal_counts(self):
+        self.add_employees(1)
+        Employee.objects.create(
+            company=self.company, name='New hire', leetcode_username='newhire',
+            leetcode_url='https://leetcode.com/u/newhire/',
+        )
+        data, _ = self.list_employees()
+        by_username = {row['leetcode_username']: row for row in data}
+
+        synced = by_username['user0']
+        self.assertEqual(synced['latest_stats']['total_solved'], 10)
+        self.assertEqual(synced['latest_stats']['problem_solving_score'], 5)
+        self.assertEqual(synced['active_goals'], 1)
+        self.assertEqual(synced['achieved_goals'], 1)
+
+        new_hire = by_username['newhire']
+        self.assertIsNone(new_hire['latest_stats'])
+        self.assertEqual(new_hire['active_goals'], 0)
+        self.assertEqual(new_hire['achieved_goals'], 0)
+
+
+class KPIDashboardQueryCountTests(CompanyDataTestCase):
+    """The KPI dashboard is computed with a fixed number of queries."""
+
+    def test_query_count_is_constant(self):
+        self.add_employees(2)
+        with self.assertNumQueries(7):
+            self.client.get('/api/company/kpi-dashboard/')
+        self.add_employees(10)
+        with self.assertNumQueries(7):
+            response = self.client.get('/api/company/kpi-dashboard/')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data['overview']['employees_with_data'], 12)
+        # Every latest snapshot is 10 ahead of the one before it
+        self.assertEqual(data['top_performers']['top_solvers'][0]['total_solved'], 21)
+        self.assertEqual(data['team_metrics'][0]['team'], 'Unassigned')
+        self.assertEqual(data['team_metrics'][0]['employee_count'], 12)
+
+
+class ProgressTimelineQueryCountTests(CompanyDataTestCase):
+    """An employee's progress timeline, with its deltas, comes from one history query."""
+
+    def add_snapshots(self, employee, count):
+        for _ in range(count):
+            solved = LeetCodeAnalysisHistory.objects.filter(employee_identifier=employee.leetcode_username).count()
+            history = LeetCodeAnalysisHistory.objects.create(
+                company=self.company,
+                employee_identifier=employee.leetcode_username,
+                total_solved=solved * 5,
+                ranking=1000 - solved,
+            )
+            LeetCodeAnalysisHistory.objects.filter(pk=history.pk).update(
+                analyzed_at=timezone.now() + timedelta(hours=solved)
+            )
+
+    def test_query_count_is_constant(self):
+        self.add_employees(1)
+        employee = Employee.objects.get()
+        url = f'/api/company/employees/{employee.id}/progress/'
+        # The employee lookup and the timeline
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        self.add_snapshots(employee, 20)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        timeline = response.json()['progress_timeline']
+        self.assertEqual(len(timeline), 22)
+        self.assertEqual(timeline[0]['total_solved_change'], 0)
+        self.assertEqual(timeline[-1]['total_solved_change'], 5)
+        # Ranking improves as it goes down
+        self.assertEqual(timeline[-1]['ranking_change'], 1)
+
+
+class ProgressSummaryQueryCountTests(CompanyDataTestCase):
+    """The company progress summary is built in one query plus the employee count."""
+
+    def test_query_count_is_constant(self):
+        self.add_employees(2)
+        with self.assertNumQueries(2):
+            self.client.get('/api/company/progress/')
+        self.add_employees(10)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/company/progress/')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data['total_employees'], 12)
+        self.assertEqual(len(data['summary']), 12)
+        first = data['summary'][0]
+        self.assertEqual((first['employee_name'], first['latest_total_solved']), ('Employee 0', 10))
+        self.assertEqual(first['total_solved_change'], 10)
+        self.assertEqual(first['score_change'], 5)
+
+
+class LatestSnapshotTests(CompanyDataTestCase):
+    """LeetCodeLatestSnapshot always mirrors each employee's newest history row."""
+
+    def latest_rows(self):
+        return list(LeetCodeLatestSnapshot.objects.order_by('company_id', 'employee_identifier').values(
+            'company_id', 'employee_identifier', 'history_id', *LeetCodeLatestSnapshot.COPIED_FIELDS
+        ))
+
+    @mock.patch('api.services.employee_sync_service.queue_ai_recommendations', return_value=None)
+    def test_record_snapshot_upserts_the_latest_row(self, queue_ai):
+        self.add_employees(1)
+        employee = Employee.objects.get()
+        record_snapshot(employee, {'total_solved': 30, 'problem_solving_score': 40})
+        second, _, _ = record_snapshot(employee, {'total_solved': 31, 'problem_solving_score': 41, 'ranking': 900})
+
+        latest = LeetCodeLatestSnapshot.objects.get()
+        self.assertEqual(latest.history_id, second.id)
+        self.assertEqual((latest.total_solved, latest.problem_solving_score, latest.ranking), (31, 41, 900))
+        self.assertEqual(latest.analyzed_at, second.analyzed_at)
+        self.assertEqual(queue_ai.call_count, 2)
+
+    @mock.patch('api.services.employee_sync_service.queue_ai_recommendations', return_value=None)
+    def test_older_snapshot_recorded_later_does_not_replace_a_newer_one(self, queue_ai):
+        self.add_employees(1)
+        employee = Employee.objects.get()
+        newer, _, _ = record_snapshot(employee, {'total_solved': 31})
+        # A slower sync that started earlier commits its snapshot last
+        with mock.patch('django.utils.timezone.now', return_value=newer.analyzed_at - timedelta(minutes=5)):
+            older, _, _ = record_snapshot(employee, {'total_solved': 30})
+
+        self.assertLess(older.analyzed_at, newer.analyzed_at)
+        latest = LeetCodeLatestSnapshot.objects.get()
+        self.assertEqual((latest.history_id, latest.total_solved), (newer.id, 31))
+
+        # Equal timestamps fall back to the history id
+        tied = LeetCodeAnalysisHistory.objects.create(
+            company=self.company, employee_identifier=employee.leetcode_username, total_solved=32,
+        )
+        LeetCodeAnalysisHistory.objects.filter(pk=tied.pk).update(analyzed_at=newer.analyzed_at)
+        tied.refresh_from_db()
+        with transaction.atomic():
+            self.assertEqual(update_latest_snapshot(tied), tied.id > newer.id)
+
+    def test_rebuild_reproduces_the_table_from_history(self):
+        self.add_employees(3)
+        other = User.objects.create(username='globex', role='company')
+        LeetCodeAnalysisHistory.objects.create(company=other, employee_identifier='someone', total_solved=7)
+        rebuild_latest_snapshots()
+        expected = self.latest_rows()
+        self.assertEqual(len(expected), 4)
+
+        # Drift the table: a stale pointer for one company and a missing row for the other
+        newest = LeetCodeLatestSnapshot.objects.filter(company=self.company).first()
+        stale = LeetCodeAnalysisHistory.objects.filter(
+            employee_identifier=newest.employee_identifier
+        ).exclude(pk=newest.history_id).get()
+        LeetCodeLatestSnapshot.objects.filter(pk=newest.pk).update(history=stale, total_solved=stale.total_solved)
+        LeetCodeLatestSnapshot.objects.filter(company=other).delete()
+
+        self.assertEqual(rebuild_latest_snapshots(self.company.id), 3)
+        self.assertEqual(LeetCodeLatestSnapshot.objects.filter(company=other).count(), 0)
+        self.assertEqual(rebuild_latest_snapshots(), 4)
+        self.assertEqual(self.latest_rows(), expected)
+
+
+class ProfileAnalysisCacheKeyTests(TestCase):
+    """Profile analyses are cached on the stats the prompt is built from."""
+
+    def hackerrank_stats(self, username, level):
+        return {
+            'username': username, 'name': username.title(), 'country': 'Egypt', 'level': level,
+            'total_solved': 0, 'easy_solved': 0, 'medium_solved': 0, 'hard_solved': 0,
+            'scores': [{'track': 'Algorithms', 'slug': 'algorithms', 'practice_score': level * 100, 'practice_rank': None}],
+        }
+
+    def test_hackerrank_profiles_get_distinct_keys(self):
+        self.assertNotEqual(
+            analysis_cache_key('hackerrank', self.hackerrank_stats('alice', 3)),
+            analysis_cache_key('hackerrank', self.hackerrank_stats('bob', 5)),
+        )
+
+    def test_volatile_fields_are_ignored(self):
+        stats = {'total_solved': 42, 'acceptance_rate': 61.5}
+        self.assertEqual(
+            analysis_cache_key('leetcode', stats),
+            analysis_cache_key('leetcode', {**stats, 'analysis': {'summary': 'old'}, 'checked_at': '2026-01-01'}),
+        )
+        self.assertNotEqual(
+            analysis_cache_key('leetcode', stats),
+            analysis_cache_key('leetcode', {**stats, 'acceptance_rate': 62.0}),
+        )
+
+    def test_change_to_a_field_left_out_of_the_prompt_hits_the_cache(self):
+        use_empty_memory_tiers(self, llm_cache)
+        stats = {'total_solved': 42, 'acceptance_rate': 61.5}
+        answer = json.dumps({'summary': 'Solid', 'estimated_level': 'Intermediate'})
+        with mock.patch('api.services.coding_profile_analysis_service.generate_text_fireworks',
+                        return_value=answer) as generate:
+            first = CodingProfileAnalysisService.analyze_profile(mock.Mock(platform='leetcode', stats={
+                **stats, 'analysis': {'summary': 'Previous'}, 'last_synced_at': '2026-01-01',
+            }))
+            again = CodingProfileAnalysisService.analyze_profile(mock.Mock(platform='leetcode', stats={
+                **stats, 'analysis': first, 'secondary': {'tags': {}}, 'last_synced_at': '2026-01-02',
+            }))
+
+        generate.assert_called_once()
+        self.assertEqual(again, first)
+        # The prompt carries exactly the keyed stats
+        prompt = generate.call_args.args[0]
+        self.assertIn('"acceptance_rate": 61.5', prompt)
+        self.assertNotIn('Previous', prompt)
+        self.assertNotIn('last_synced_at', prompt)
+
+
+class IncrementalSyncProbeTests(TestCase):
+    """has_new_activity decides whether an incremental sync needs a full fetch and rescore."""
+
+    def snapshot(self, last_active, current_streak=0, activity_status='Active'):
+        timestamp = int(datetime.combine(last_active, datetime.min.time()).timestamp())
+        return LeetCodeAnalysisHistory(
+            total_solved=40,
+            current_streak=current_streak,
+            activity_status=activity_status,
+            full_stats={
+                'total_submissions': 90,
+                'total_attempts': 150,
+                'submission_calendar': {str(timestamp): 2},
+            },
+        )
+
+    def probe(self, **overrides):
+        return {'exists': True, 'total_solved': 40, 'total_submissions': 90, 'total_attempts': 150, **overrides}
+
+    def test_unchanged_probe_skips_the_full_sync(self):
+        self.assertFalse(has_new_activity(self.snapshot(date.today()), self.probe()))
+
+    def test_attempts_that_were_not_accepted_count_as_activity(self):
+        self.assertTrue(has_new_activity(self.snapshot(date.today()), self.probe(total_attempts=151)))
+
+    def test_failed_probe_counts_as_changed(self):
+        self.assertTrue(has_new_activity(self.snapshot(date.today()), {'exists': None, 'error': 'boom'}))
+
+    def test_streak_expires_after_an_idle_day(self):
+        today = date.today()
+        history = self.snapshot(today - timedelta(days=1), current_streak=3)
+        self.assertFalse(snapshot_expired(history, today))
+        self.assertTrue(snapshot_expired(history, today + timedelta(days=1)))
+        self.assertTrue(has_new_activity(self.snapshot(today - timedelta(days=2), current_streak=3), self.probe()))
+
+    def test_activity_status_lapses_after_30_days(self):
+        today = date.today()
+        history = self.snapshot(today - timedelta(days=30))
+        self.assertFalse(snapshot_expired(history, today))
+        self.assertTrue(snapshot_expired(history, today + timedelta(days=1)))
+        self.assertFalse(snapshot_expired(self.snapshot(today - timedelta(days=60), activity_status='Inactive'), today))
+
+
+def fake_response(status_code, json_data=None, headers=None):
+    response = mock.Mock(status_code=status_code, headers=headers or {}, text='')
+    response.json.return_value = json_data or {}
+    return response
+
+
+def leetcode_user(username, solved=(40, 25, 12, 3)):
+    """A getUserProfile matchedUser payload for `username` with (total, easy, medium, hard) solved."""
+    total, easy, medium, hard = solved
+    yesterday = int(time_module.time()) - 86400
+    return {
+        'username': username,
+        'submissionCalendar': json.dumps({str(yesterday): 2}),
+        'submitStats': {
+            'acSubmissionNum': [
+                {'difficulty': 'All', 'count': total, 'submissions': 90},
+                {'difficulty': 'Easy', 'count': easy, 'submissions': 40},
+                {'difficulty': 'Medium', 'count': medium, 'submissions': 35},
+                {'difficulty': 'Hard', 'count': hard, 'submissions': 15},
+            ],
+        },
+        'totalSubmissionNum': [
+            {'difficulty': 'All', 'count': 150, 'submissions': 150},
+        ],
+        'profile': {
+            'ranking': 120000, 'reputation': 3, 'starRating': 2, 'realName': username.title(),
+            'userAvatar': '', 'countryName': 'Egypt', 'company': '', 'school': '',
+        },
+    }
+
+
+def use_empty_memory_tiers(test, *caches):
+    """Gives each TieredCache an empty in-process tier for the length of the test."""
+    for cache in caches:
+        patch = mock.patch.object(cache, 'memory', TTLLRUCache(cache.memory.max_size, cache.memory.ttl))
+        patch.start()
+        test.addCleanup(patch.stop)
+
+
+def use_empty_leetcode_caches(test):
+    use_empty_memory_tiers(
+        test, LeetCodeService.profile_cache, LeetCodeService.negative_cache, LeetCodeService.secondary_cache
+    )
+
+
+class LeetCodeServiceTestCase(TestCase):
+    """Gives each test empty LeetCode caches."""
+
+    def setUp(self):
+        use_empty_leetcode_caches(self)
+
+
+class SingleRequestFetchTests(LeetCodeServiceTestCase):
+    """get_user_stats gets existence, profile, stats and calendar in one GraphQL request."""
+
+    def fetch(self, payload, username='alice'):
+        with mock.patch.object(http_client, 'post', return_value=fake_response(200, payload)) as post:
+            stats = LeetCodeService.get_user_stats(username)
+        self.assertEqual(post.call_count, 1)
+        return stats, post.call_args.kwargs['json']
+
+    def test_one_request_returns_full_stats(self):
+        stats, body = self.fetch({'data': {'matchedUser': leetcode_user('alice')}})
+        for field in ('matchedUser(username: $username)', 'submissionCalendar', 'submitStatsGlobal', 'profile'):
+            self.assertIn(field, body['query'])
+        self.assertEqual(body['variables'], {'username': 'alice'})
+        self.assertEqual((stats['total_solved'], stats['easy_solved'], stats['hard_solved']), (40, 25, 3))
+        self.assertNotIn('error', stats)
+
+    def test_missing_user(self):
+        stats, _ = self.fetch({'data': {'matchedUser': None}}, username='ghost')
+        self.assertFalse(stats['exists'])
+
+    def test_partial_data_falls_back_to_limited_stats(self):
+        user = leetcode_user('alice')
+        stats, _ = self.fetch({'data': {'matchedUser': user}, 'errors': [{'message': 'profile timed out'}]})
+        self.assertIn('Could not fetch full statistics', stats['error'])
+        self.assertEqual(stats['total_solved'], 40)
+        self.assertEqual(stats['ranking'], 120000)
+
+    def test_non_200_status(self):
+        with mock.patch.object(http_client, 'post', return_value=fake_response(503)):
+            stats = LeetCodeService.get_user_stats('alice')
+        self.assertIsNone(stats['exists'])
+        self.assertIn('503', stats['error'])
+
+
+class BatchFetchTests(LeetCodeServiceTestCase):
+    """get_many_user_stats packs users into aliased queries and splits the answers back out."""
+
+    def answer_batch(self, url, json=None, headers=None, errors=()):
+        variables = json['variables']
+        data = {alias: leetcode_user(name) if not name.startswith('missing') else None
+                for alias, name in variables.items()}
+        return fake_response(200, {'data': data, 'errors': list(errors)})
+
+    def test_users_are_split_into_aliased_batches(self):
+        with mock.patch.object(http_client, 'post', side_effect=self.answer_batch) as post:
+            # One batch at a time, so the calls come in batch order
+            results = LeetCodeService.get_many_user_stats(['alice', 'missing-bob', 'carol', 'alice'], batch_size=2,
+                                                          max_concurrency=1)
+
+        self.assertEqual(post.call_count, 2)
+        first = post.call_args_list[0].kwargs['json']
+        self.assertIn('u0: matchedUser(username: $u0)', first['query'])
+        self.assertEqual(first['variables'], {'u0': 'alice', 'u1': 'missing-bob'})
+        self.assertEqual(post.call_args_list[1].kwargs['json']['variables'], {'u0': 'carol'})
+        self.assertEqual(list(results), ['alice', 'missing-bob', 'carol'])
+        self.assertEqual(results['alice']['total_solved'], 40)
+        self.assertFalse(results['missing-bob']['exists'])
+        self.assertEqual(results['carol']['total_solved'], 40)
+
+    def test_errors_are_attributed_by_alias(self):
+        errors = [{'message': 'rate limited field', 'path': ['u1', 'submitStats']}]
+        with mock.patch.object(http_client, 'post',
+                               side_effect=lambda *args, **kwargs: self.answer_batch(*args, **kwargs, errors=errors)):
+            results = LeetCodeService.get_many_user_stats(['alice', 'bob'], batch_size=2, max_concurrency=1)
+
+        self.assertNotIn('error', results['alice'])
+        self.assertIn('rate limited field', results['bob']['error'])
+
+    def test_failed_batch_maps_to_each_of_its_users(self):
+        responses = [fake_response(502), requests.exceptions.ConnectionError('reset')]
+        with mock.patch.object(http_client, 'post', side_effect=responses):
+            results = LeetCodeService.get_many_user_stats(['alice', 'bob', 'carol'], batch_size=2, max_concurrency=1)
+
+        self.assertIn('502', results['alice']['error'])
+        self.assertIn('502', results['bob']['error'])
+        self.assertIsNone(results['carol'])
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledSessionTests(TestCase):
+    """http_client keeps one pooled keep-alive session per host, with per-host settings."""
+
+    def setUp(self):
+        for target in (http_client._sessions, http_client._stats, http_client.HOST_SETTINGS):
+            patch = mock.patch.dict(target)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_one_keep_alive_session_per_host(self):
+        session = http_client.get_session('https://leetcode.com/graphql')
+        self.assertIs(http_client.get_session('https://leetcode.com/api/other'), session)
+        self.assertIsNot(http_client.get_session('https://www.hackerrank.com/rest/hackers/x'), session)
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+
+    def test_pool_size_comes_from_host_settings(self):
+        default = http_client.get_session('https://pool.test/a').get_adapter('https://pool.test/a')
+        self.assertEqual(default._pool_maxsize, http_client.POOL_MAXSIZE)
+
+        # configure_host drops the old session so the next one picks up the new size
+        http_client.configure_host('pool.test', pool_maxsize=3)
+        resized = http_client.get_session('https://pool.test/a').get_adapter('https://pool.test/a')
+        self.assertEqual(resized._pool_maxsize, 3)
+
+    def test_timeouts_resolve_per_host(self):
+        self.assertEqual(http_client.get_timeout('https://leetcode.com/graphql'), 15)
+        self.assertEqual(http_client.get_timeout('https://api.fireworks.ai/inference/v1/chat/completions'), 30)
+        self.assertEqual(http_client.get_timeout('https://elsewhere.test/'), http_client.DEFAULT_TIMEOUT)
+
+        session = mock.Mock(**{'request.return_value': fake_response(200)})
+        with mock.patch.object(http_client, 'get_session', return_value=session):
+            http_client.post('https://api.fireworks.ai/inference/v1/chat/completions', json={})
+            self.assertEqual(session.request.call_args.kwargs['timeout'], 30)
+            http_client.get('https://leetcode.com/graphql', timeout=2)
+            self.assertEqual(session.request.call_args.kwargs['timeout'], 2)
+
+    def test_connections_are_reused(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}/'
+
+        for _ in range(3):
+            self.assertEqual(http_client.get(url).status_code, 200)
+        stats = http_client.get_pool_stats()[http_client.host_key(url)]
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 2)
+        self.assertEqual(stats['in_use'], 0)
+
+
+class RunBoundedTests(TestCase):
+    """run_bounded caps the number of threads and keeps results in input order."""
+
+    def test_concurrency_is_capped(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work(item):
+            with lock:
+                running.append(item)
+                peak.append(len(running))
+            time_module.sleep(0.02)
+            with lock:
+                running.remove(item)
+            return item
+
+        run_bounded(work, range(12), max_workers=3)
+        self.assertEqual(max(peak), 3)
+
+    def test_results_keep_input_order(self):
+        # Later items finish first
+        results = run_bounded(lambda n: time_module.sleep((5 - n) * 0.01) or n * n, range(6), max_workers=6)
+        self.assertEqual(results, [0, 1, 4, 9, 16, 25])
+
+    def test_single_worker_runs_inline(self):
+        caller = threading.current_thread()
+        threads = run_bounded(lambda _: threading.current_thread(), [1, 2], max_workers=1)
+        self.assertEqual(threads, [caller, caller])
+        self.assertEqual(run_bounded(str, [], max_workers=4), [])
+
+
+class BulkAnalysisViewTests(TestCase):
+    """The bulk analysis endpoint answers in submission order with the results/successful/failed contract."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='acme', role='company'))
+
+    def test_results_follow_submission_order(self):
+        fetched = {'carol': {'total_solved': 3}, 'alice': {'total_solved': 1}, 'bob': None}
+        with mock.patch.object(LeetCodeService, 'get_many_user_stats', return_value=fetched) as get_many:
+            response = self.client.post('/api/company/leetcode/analyze/', {
+                'urls': 'https://leetcode.com/u/carol/\nalice, bob\ncarol',
+            })
+        self.assertEqual(get_many.call_args.args[0], ['carol', 'alice', 'bob'])
+
+        data = response.json()
+        self.assertEqual([row['username'] for row in data['results']], ['carol', 'alice', 'bob'])
+        self.assertEqual([row['status'] for row in data['results']], ['success', 'success', 'failed'])
+        self.assertEqual((data['total_urls'], data['successful'], data['failed']), (3, 2, 1))
+
+
+class BackgroundRecommendationTests(TransactionTestCase):
+    """Stats fetches return rule-based recommendations; the LLM runs later on the background pool."""
+
+    def setUp(self):
+        use_empty_memory_tiers(self, llm_cache)
+        use_empty_leetcode_caches(self)
+
+    def fetch(self, **kwargs):
+        answer = fake_response(200, {'data': {'matchedUser': leetcode_user('alice')}})
+        with mock.patch.object(http_client, 'post', return_value=answer):
+            return LeetCodeService.get_user_stats('alice', **kwargs)
+
+    def test_fetch_does_not_wait_for_the_llm(self):
+        with mock.patch('api.services.recommendation_service.generate_ai_recommendations') as generate:
+            stats = self.fetch()
+        generate.assert_not_called()
+        self.assertEqual(stats['score_breakdown']['recommendations_source'], 'rules')
+        self.assertTrue(stats['score_breakdown']['recommendations'])
+
+    def test_callers_can_wait_for_ai(self):
+        with mock.patch('api.services.recommendation_service.generate_ai_recommendations', return_value=['Do hards']):
+            stats = self.fetch(wait_for_ai=True)
+        self.assertEqual(stats['score_breakdown']['recommendations_source'], 'ai')
+        self.assertEqual(stats['score_breakdown']['recommendations'], ['Do hards'])
+
+    def test_queued_recommendations_land_on_the_record(self):
+        company = User.objects.create(username='acme', role='company')
+        history = LeetCodeAnalysisHistory.objects.create(company=company, employee_identifier='alice')
+        release = threading.Event()
+
+        def generate(inputs):
+            release.wait(5)
+            return [f"Solve more than {inputs['total_solved']}"]
+
+        with mock.patch('api.services.recommendation_service.generate_ai_recommendations', side_effect=generate):
+            job = queue_ai_recommendations({'total_solved': 40}, history=history)
+            history.refresh_from_db()
+            self.assertEqual(history.analysis_data['ai_recommendations_status'], 'pending')
+            release.set()
+            self.assertEqual(job.result(5), ['Solve more than 40'])
+
+        history.refresh_from_db()
+        self.assertEqual(history.analysis_data['ai_recommendations_status'], 'ready')
+        self.assertEqual(history.analysis_data['ai_recommendations'], ['Solve more than 40'])
+
+
+class LLMCacheTests(TestCase):
+    """LLM recommendations are memoized by a fingerprint of the prompt inputs."""
+
+    inputs = {'role': 'Mid-Level', 'total_solved': 40, 'easy_solved': 25, 'medium_solved': 12, 'hard_solved': 3,
+              'weighted_acceptance_rate': 55.0, 'max_streak': 4, 'reputation': 3}
+
+    def setUp(self):
+        use_empty_memory_tiers(self, llm_cache)
+        patch = mock.patch('api.services.coding_profile_analysis_service.generate_text_fireworks',
+                           return_value='["Practice graphs", "Do contests", "Review DP"]')
+        self.llm = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_fingerprint_ignores_key_order(self):
+        self.assertEqual(fingerprint('x', {'a': 1, 'b': 2}), fingerprint('x', {'b': 2, 'a': 1}))
+        self.assertNotEqual(fingerprint('x', {'a': 1}), fingerprint('y', {'a': 1}))
+
+    def test_same_inputs_skip_the_model(self):
+        first = generate_ai_recommendations(self.inputs)
+        self.assertEqual(generate_ai_recommendations(dict(self.inputs)), first)
+        self.assertEqual(self.llm.call_count, 1)
+
+        generate_ai_recommendations({**self.inputs, 'total_solved': 41})
+        self.assertEqual(self.llm.call_count, 2)
+
+    def test_failed_calls_are_not_cached(self):
+        self.llm.return_value = 'Error: upstream down'
+        self.assertIsNone(generate_ai_recommendations(self.inputs))
+        self.assertIsNone(generate_ai_recommendations(self.inputs))
+        self.assertEqual(self.llm.call_count, 2)
+
+    def test_cached_recommendations_are_attached_without_a_job(self):
+        company = User.objects.create(username='acme', role='company')
+        history = LeetCodeAnalysisHistory.objects.create(company=company, employee_identifier='alice')
+        stats = {'total_solved': 40, 'easy_solved': 25, 'medium_solved': 12, 'hard_solved': 3,
+                 'weighted_acceptance_rate': 55.0, 'max_streak': 4, 'reputation': 3}
+        generate_ai_recommendations(self.inputs)
+
+        self.assertIsNone(queue_ai_recommendations(stats, history=history))
+        history.refresh_from_db()
+        self.assertEqual(history.analysis_data['ai_recommendations_status'], 'ready')
+        self.assertEqual(history.analysis_data['ai_recommendations'][0], 'Practice graphs')
+
+
+class ProfileCacheTests(LeetCodeServiceTestCase):
+    """TTL/LRU behaviour of the profile cache and force_refresh on the fetch paths."""
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = TTLLRUCache(max_size=10, ttl=60)
+        with mock.patch('api.services.cache.time.monotonic', return_value=100.0) as monotonic:
+            cache.set('a', 1)
+            cache.set('b', 2, ttl=5)
+            monotonic.return_value = 106.0
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(cache.get('a'), 1)
+            monotonic.return_value = 161.0
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLLRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_force_refresh_bypasses_the_cache(self):
+        answer = fake_response(200, {'data': {'matchedUser': leetcode_user('alice')}})
+        with mock.patch.object(http_client, 'post', return_value=answer) as post:
+            LeetCodeService.get_user_stats('alice')
+            cached = LeetCodeService.get_user_stats('Alice')
+            self.assertEqual(post.call_count, 1)
+            LeetCodeService.get_user_stats('alice', force_refresh=True)
+            self.assertEqual(post.call_count, 2)
+        self.assertEqual(cached['total_solved'], 40)
+
+    def test_batches_only_fetch_cache_misses(self):
+        LeetCodeService.profile_cache.set('alice', {'data': {'matchedUser': leetcode_user('alice')}})
+        answer = fake_response(200, {'data': {'u0': leetcode_user('bob')}})
+        with mock.patch.object(http_client, 'post', return_value=answer) as post:
+            results = LeetCodeService.get_many_user_stats(['Alice', 'bob'])
+        self.assertEqual(post.call_args.kwargs['json']['variables'], {'u0': 'bob'})
+        self.assertEqual(list(results), ['Alice', 'bob'])
+        self.assertEqual(results['Alice']['total_solved'], 40)
+
+    def test_errors_are_not_cached(self):
+        failed = fake_response(200, {'data': {'matchedUser': leetcode_user('alice')}, 'errors': [{'message': 'boom'}]})
+        with mock.patch.object(http_client, 'post', return_value=failed) as post:
+            LeetCodeService.get_user_stats('alice')
+            LeetCodeService.get_user_stats('alice')
+        self.assertEqual(post.call_count, 2)
+
+
+class NegativeCacheTests(LeetCodeServiceTestCase):
+    """Users LeetCode reports as missing aren't looked up again until the entry expires."""
+
+    def test_missing_user_is_negative_cached_case_insensitively(self):
+        missing = fake_response(200, {'data': {'matchedUser': None}})
+        with mock.patch.object(http_client, 'post', return_value=missing) as post:
+            first = LeetCodeService.get_user_stats('Ghost')
+            again = LeetCodeService.get_user_stats(' ghost ')
+            batched = LeetCodeService.get_many_user_stats(['GHOST'])
+        self.assertEqual(post.call_count, 1)
+        self.assertFalse(first['exists'])
+        self.assertTrue(again['negative_cached'])
+        self.assertTrue(batched['GHOST']['negative_cached'])
+
+    def test_errors_are_not_negative_cached(self):
+        failed = fake_response(200, {'data': {'matchedUser': None}, 'errors': [{'message': 'timeout'}]})
+        with mock.patch.object(http_client, 'post', return_value=failed) as post:
+            LeetCodeService.get_user_stats('ghost')
+            LeetCodeService.get_user_stats('ghost')
+        self.assertEqual(post.call_count, 2)
+
+    def test_force_refresh_clears_the_entry(self):
+        with mock.patch.object(http_client, 'post', return_value=fake_response(200, {'data': {'matchedUser': None}})):
+            LeetCodeService.get_user_stats('ghost')
+        found = fake_response(200, {'data': {'matchedUser': leetcode_user('ghost')}})
+        with mock.patch.object(http_client, 'post', return_value=found):
+            self.assertEqual(LeetCodeService.get_user_stats('ghost', force_refresh=True)['total_solved'], 40)
+        self.assertIsNone(LeetCodeService.negative_cache.get('ghost'))
+
+
+class SharedCacheTests(TestCase):
+    """The persistent tier lets workers with their own memory tier share payloads."""
+
+    def test_second_worker_reads_the_persistent_tier(self):
+        first = TieredCache('shared-test', ttl=60, max_size=10)
+        second = TieredCache('shared-test', ttl=60, max_size=10)
+        first.set('alice', {'total': 40})
+        self.assertEqual(second.get('alice'), {'total': 40})
+        self.assertEqual(second.persistent_hits, 1)
+        self.assertEqual(second.get('alice'), {'total': 40})
+        self.assertEqual(second.persistent_hits, 1)
+
+    def test_hackerrank_payloads_are_cached_by_normalised_username(self):
+        use_empty_memory_tiers(self, HackerRankService.profile_cache)
+        def answer(url, **kwargs):
+            if url.endswith('/scores_elo'):
+                return fake_response(200, [])
+            return fake_response(200, {'model': {'username': 'alice', 'level': 4}})
+
+        with mock.patch.object(http_client, 'get', side_effect=answer) as get:
+            HackerRankService.get_user_stats('alice')
+            stats = HackerRankService.get_user_stats(' Alice ')
+        # Profile and scores_elo for the miss, nothing for the hit
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(stats['level'], 4)
+
+
+class SingleFlightTests(TestCase):
+    """Concurrent callers for one key share a single upstream call."""
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight('test-flight')
+        release = threading.Event()
+        upstream = mock.Mock(side_effect=lambda: release.wait(5) and {'total_solved': 412})
+        results = []
+
+        def caller():
+            results.append(flight.do('alice', upstream))
+
+        threads = [threading.Thread(target=caller) for _ in range(5)]
+        threads[0].start()
+        while not flight.stats()['in_flight']:
+            time_module.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        while flight.stats()['coalesced'] < 4:
+            time_module.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(upstream.call_count, 1)
+        self.assertEqual(results, [{'total_solved': 412}] * 5)
+        self.assertEqual(flight.stats()['executed'], 1)
+
+    def test_failed_call_is_not_left_in_flight(self):
+        flight = SingleFlight('test-flight')
+        with self.assertRaises(ValueError):
+            flight.do('alice', mock.Mock(side_effect=ValueError('boom')))
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    def test_other_workers_result_is_used_while_it_holds_the_lease(self):
+        flight = SingleFlight('test-flight', poll_interval=0.01)
+        CacheEntry.objects.create(namespace=flight.lease_namespace, key='alice', value={},
+                                  expires_at=timezone.now() + timedelta(seconds=20))
+        upstream = mock.Mock()
+        load_shared = mock.Mock(side_effect=[None, (200, {'shared': True})])
+
+        self.assertEqual(flight.do('alice', upstream, load_shared=load_shared), (200, {'shared': True}))
+        upstream.assert_not_called()
+        self.assertEqual(flight.stats()['coalesced_remote'], 1)
+
+    def lease_owners(self, flight):
+        return list(CacheEntry.objects.filter(namespace=flight.lease_namespace).values_list('value', flat=True))
+
+    def test_lease_is_released_after_the_fetch(self):
+        flight = SingleFlight('test-flight')
+        self.assertEqual(flight.do('alice', lambda: 'fetched', load_shared=lambda: None), 'fetched')
+        self.assertEqual(self.lease_owners(flight), [])
+
+    def test_lease_taken_over_during_the_fetch_is_not_released(self):
+        flight = SingleFlight('test-flight')
+
+        def slow_fetch():
+            # Our lease expired mid-fetch and another worker took it over
+            CacheEntry.objects.filter(namespace=flight.lease_namespace).update(value={'owner': 'other-worker'})
+            return 'fetched'
+
+        self.assertEqual(flight.do('alice', slow_fetch, load_shared=lambda: None), 'fetched')
+        self.assertEqual(self.lease_owners(flight), [{'owner': 'other-worker'}])
+
+    def test_fetch_goes_ahead_without_a_lease_when_the_table_fails(self):
+        flight = SingleFlight('test-flight')
+        CacheEntry.objects.create(namespace=flight.lease_namespace, key='alice', value={'owner': 'other-worker'},
+                                  expires_at=timezone.now() + timedelta(seconds=20))
+        upstream = mock.Mock(return_value='fetched')
+        with mock.patch.object(CacheEntry.objects, 'create', side_effect=DatabaseError('database is locked')):
+            self.assertEqual(flight.do('alice', upstream, load_shared=lambda: None), 'fetched')
+        upstream.assert_called_once_with()
+        self.assertEqual(self.lease_owners(flight), [{'owner': 'other-worker'}])
+
+
+class StaleWhileRevalidateTests(TestCase):
+    """SyncEmployeeView serves the stored snapshot and refreshes stale ones off the request path."""
+
+    def setUp(self):
+        self.company = User.objects.create(username='acme', role='company')
+        self.client = APIClient()
+        self.client.force_authenticate(self.company)
+        self.employee = Employee.objects.create(
+            company=self.company, name='Alice', leetcode_username='alice',
+            leetcode_url='https://leetcode.com/u/alice/',
+        )
+        self.url = f'/api/company/employees/{self.employee.id}/sync/'
+
+    def add_snapshot(self, age):
+        history = LeetCodeAnalysisHistory.objects.create(
+            company=self.company, employee_identifier='alice', leetcode_username='alice', total_solved=40,
+        )
+        LeetCodeAnalysisHistory.objects.filter(pk=history.pk).update(analyzed_at=timezone.now() - age)
+        rebuild_latest_snapshots(self.company.id)
+        return history
+
+    def test_fresh_snapshot_is_served_without_a_refresh(self):
+        history = self.add_snapshot(timedelta(minutes=5))
+        with mock.patch.object(employee_sync_service, 'refresh_in_background') as refresh, \
+                mock.patch.object(LeetCodeService, 'get_user_stats') as get_user_stats:
+            data = self.client.post(self.url, {'stale_while_revalidate': 'true'}).json()
+        refresh.assert_not_called()
+        get_user_stats.assert_not_called()
+        self.assertEqual(data['history_id'], str(history.id))
+        self.assertFalse(data['is_stale'])
+        self.assertEqual(data['refresh_status'], 'not_needed')
+        self.assertGreaterEqual(data['snapshot_age_seconds'], 300)
+
+    def test_stale_snapshot_is_served_and_refreshed_in_background(self):
+        self.add_snapshot(timedelta(days=2))
+        with mock.patch.object(employee_sync_service, 'refresh_in_background', return_value='queued') as refresh, \
+                mock.patch.object(LeetCodeService, 'get_user_stats') as get_user_stats:
+            data = self.client.post(self.url, {'stale_while_revalidate': 'true'}).json()
+        refresh.assert_called_once_with(self.employee, 'Mid-Level')
+        get_user_stats.assert_not_called()
+        self.assertTrue(data['is_stale'])
+        self.assertEqual((data['refresh_status'], data['stats']['total_solved']), ('queued', 40))
+
+    def test_without_a_snapshot_the_view_syncs_inline(self):
+        stats = {'total_solved': 12, 'problem_solving_score': 6, 'analysis': {}}
+        with mock.patch.object(LeetCodeService, 'get_user_stats', return_value=stats), \
+                mock.patch.object(employee_sync_service, 'queue_ai_recommendations', return_value=None):
+            data = self.client.post(self.url, {'stale_while_revalidate': 'true'}).json()
+        self.assertEqual(data['message'], 'Employee synced successfully')
+        self.assertEqual(LeetCodeAnalysisHistory.objects.get().total_solved, 12)
+
+    def test_one_refresh_per_employee_at_a_time(self):
+        with mock.patch.object(employee_sync_service, '_executor') as executor:
+            self.assertEqual(employee_sync_service.refresh_in_background(self.employee), 'queued')
+            self.assertEqual(employee_sync_service.refresh_in_background(self.employee), 'in_progress')
+        self.assertEqual(executor.submit.call_count, 1)
+
+        stats = {'total_solved': 45, 'analysis': {}}
+        with mock.patch.object(LeetCodeService, 'get_user_stats', return_value=stats), \
+                mock.patch.object(employee_sync_service, 'queue_ai_recommendations', return_value=None), \
+                mock.patch.object(employee_sync_service, 'close_old_connections'):
+            history = employee_sync_service._refresh(self.employee.id, 'Mid-Level')
+        self.assertEqual(history.total_solved, 45)
+        self.assertNotIn(self.employee.id, employee_sync_service._refreshing)
+
+    def test_no_refresh_while_upstream_is_unavailable(self):
+        with mock.patch.object(LeetCodeService, 'upstream_available', return_value=False), \
+                mock.patch.object(employee_sync_service, '_executor') as executor:
+            self.assertEqual(employee_sync_service.refresh_in_background(self.employee), 'upstream_unavailable')
+        executor.submit.assert_not_called()
+
+
+class HedgedRequestTests(TestCase):
+    """A duplicate request is only sent once the original has been outstanding for hedge_after."""
+
+    url = 'https://hedge.test/graphql'
+
+    def setUp(self):
+        self.stats = http_client.PoolStats()
+        self.session = mock.Mock()
+        patches = [
+            mock.patch.dict(http_client._stats, {'hedge.test': self.stats}),
+            mock.patch('api.services.http_client.get_session', return_value=self.session),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_fast_response_is_not_hedged(self):
+        self.session.request.return_value = fake_response(200)
+        response = http_client.request('POST', self.url, hedge_after=0.5, json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.request.call_count, 1)
+        self.assertEqual(self.stats.hedges_fired, 0)
+
+    def test_slow_response_is_hedged_after_the_delay(self):
+        release = threading.Event()
+        slow, fast = fake_response(200), fake_response(200)
+        sent_at = []
+
+        def respond(*args, **kwargs):
+            sent_at.append(time_module.monotonic())
+            if len(sent_at) == 1:
+                release.wait(5)
+                return slow
+            return fast
+
+        self.session.request.side_effect = respond
+        try:
+            response = http_client.request('POST', self.url, hedge_after=0.1, json={})
+        finally:
+            release.set()
+
+        self.assertIs(response, fast)
+        self.assertGreaterEqual(sent_at[1] - sent_at[0], 0.1)
+        self.assertEqual((self.stats.hedges_fired, self.stats.hedges_won), (1, 1))
+
+
+class DNSCacheTests(TestCase):
+    """Resolved addresses are cached, ordered IPv4 first, and served stale if the resolver fails."""
+
+    def address(self, family, ip):
+        return (family, socket.SOCK_STREAM, 6, '', (ip, 443))
+
+    def setUp(self):
+        self.v4 = [self.address(socket.AF_INET, '192.0.2.1'), self.address(socket.AF_INET, '192.0.2.2')]
+        self.v6 = [self.address(socket.AF_INET6, '2001:db8::1')]
+        clock = mock.patch('api.services.dns_cache.time.monotonic', return_value=100.0)
+        self.monotonic = clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_addresses_alternate_families_ipv4_first(self):
+        with mock.patch('api.services.dns_cache.socket.getaddrinfo', return_value=self.v6 + self.v4):
+            addresses = DNSCache(ttl=300).resolve('leetcode.com', 443)
+        self.assertEqual([a[4][0] for a in addresses], ['192.0.2.1', '2001:db8::1', '192.0.2.2'])
+
+    def test_lookups_are_cached_for_the_ttl(self):
+        cache = DNSCache(ttl=300)
+        with mock.patch('api.services.dns_cache.socket.getaddrinfo', return_value=self.v4) as getaddrinfo:
+            cache.resolve('leetcode.com', 443)
+            cache.resolve('leetcode.com', 443)
+            self.assertEqual(getaddrinfo.call_count, 1)
+            self.monotonic.return_value += 301
+            cache.resolve('leetcode.com', 443)
+            self.assertEqual(getaddrinfo.call_count, 2)
+
+    def test_stale_entry_is_served_when_the_resolver_fails(self):
+        cache = DNSCache(ttl=300)
+        with mock.patch('api.services.dns_cache.socket.getaddrinfo', return_value=self.v4):
+            cache.resolve('leetcode.com', 443)
+        self.monotonic.return_value += 301
+        with mock.patch('api.services.dns_cache.socket.getaddrinfo', side_effect=socket.gaierror('resolver down')):
+            self.assertEqual(cache.resolve('leetcode.com', 443), self.v4)
+            with self.assertRaises(socket.gaierror):
+                cache.resolve('hackerrank.com', 443)
+        self.assertEqual(cache.stats()['stale_served'], 1)
+
+
+class FetchProfileTests(LeetCodeServiceTestCase):
+    """Each fetch profile requests only its fields and is parsed to match."""
+
+    def fetch(self, matched_user, fetch_profile):
+        answer = fake_response(200, {'data': {'matchedUser': matched_user}})
+        with mock.patch.object(http_client, 'post', return_value=answer) as post:
+            result = LeetCodeService.get_user_stats('alice', fetch_profile=fetch_profile)
+        self.assertEqual(post.call_count, 1)
+        return post.call_args.kwargs['json']['query'], result
+
+    def test_minimal_profile_only_checks_existence(self):
+        query, result = self.fetch({'username': 'alice'}, 'minimal')
+        self.assertNotIn('submitStatsGlobal', query)
+        self.assertNotIn('submissionCalendar', query)
+        self.assertEqual(result, {'username': 'alice', 'exists': True, 'fetch_profile': 'minimal'})
+
+    def test_standard_profile_has_counts_without_scoring(self):
+        query, result = self.fetch(leetcode_user('alice'), 'standard')
+        self.assertIn('submitStatsGlobal', query)
+        self.assertIn('ranking', query)
+        self.assertNotIn('submissionCalendar', query)
+        self.assertEqual(
+            (result['total_solved'], result['easy_solved'], result['medium_solved'], result['hard_solved']),
+            (40, 25, 12, 3),
+        )
+        self.assertEqual(result['ranking'], 120000)
+        self.assertNotIn('problem_solving_score', result)
+
+    def test_full_profile_is_scored(self):
+        query, result = self.fetch(leetcode_user('alice'), 'full')
+        self.assertIn('submissionCalendar', query)
+        self.assertEqual(result['total_solved'], 40)
+        self.assertIn('problem_solving_score', result)
+
+    def test_cached_full_payload_answers_lighter_profiles(self):
+        LeetCodeService.profile_cache.set('alice', {'data': {'matchedUser': leetcode_user('alice')}})
+        with mock.patch.object(http_client, 'post') as post:
+            result = LeetCodeService.get_user_stats('Alice', fetch_profile='standard')
+        post.assert_not_called()
+        self.assertEqual(result['total_solved'], 40)
+
+    def test_light_payload_does_not_answer_the_full_profile(self):
+        self.fetch({'username': 'alice'}, 'minimal')
+        self.assertIsNotNone(LeetCodeService.profile_cache.get('minimal:alice'))
+        self.assertIsNone(LeetCodeService.profile_cache.get('alice'))
+
+    def test_missing_user_goes_to_the_negative_cache(self):
+        _, result = self.fetch(None, 'minimal')
+        self.assertFalse(result['exists'])
+        self.assertIsNotNone(LeetCodeService.negative_cache.get('alice'))
+
+    def test_batches_use_the_profile_fragment(self):
+        answer = fake_response(200, {'data': {'u0': {'username': 'alice'}, 'u1': None}})
+        with mock.patch.object(http_client, 'post', return_value=answer) as post:
+            results = LeetCodeService.get_many_user_stats(['alice', 'bob'], fetch_profile='minimal')
+        self.assertNotIn('submitStatsGlobal', post.call_args.kwargs['json']['query'])
+        self.assertEqual((results['alice']['exists'], results['bob']['exists']), (True, False))
+
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ValueError):
+            LeetCodeService.get_user_stats('alice', fetch_profile='everything')
+
+
+class EmployeeCreateValidationTests(LeetCodeServiceTestCase):
+    """Creating an employee only checks the username against LeetCode when asked to."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='acme', role='company'))
+
+    def create(self, **data):
+        return self.client.post('/api/company/employees/', {'leetcode_url': 'https://leetcode.com/u/alice/', **data})
+
+    def test_default_create_does_not_call_leetcode(self):
+        with mock.patch.object(http_client, 'post') as post:
+            response = self.create()
+        post.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Employee.objects.filter(leetcode_username='alice').exists())
+
+    def test_validation_rejects_unknown_usernames(self):
+        missing = fake_response(200, {'data': {'matchedUser': None}})
+        with mock.patch.object(http_client, 'post', return_value=missing) as post:
+            response = self.create(validate_username=True)
+        self.assertIn('username', post.call_args.kwargs['json']['query'])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Employee.objects.exists())
+
+    def test_validation_still_creates_when_leetcode_is_unreachable(self):
+        with mock.patch.object(http_client, 'post', side_effect=requests.exceptions.ConnectionError('reset')):
+            response = self.create(validate_username=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Employee.objects.filter(leetcode_username='alice').exists())
+
+
+class SecondaryStatsTests(LeetCodeServiceTestCase):
+    """Contest and tag datasets are fetched only on request, together, and cached per dataset."""
+
+    contest = {
+        'userContestRanking': {'attendedContestsCount': 2, 'rating': 1650.4, 'globalRanking': 9000,
+                               'totalParticipants': 500000, 'topPercentage': 12.5},
+        'userContestRankingHistory': [
+            {'attended': True, 'rating': 1500.2, 'ranking': 3000, 'contest': {'title': 'Weekly 1', 'startTime': 1}},
+            {'attended': False, 'rating': 1500.2, 'ranking': 0, 'contest': {'title': 'Weekly 2', 'startTime': 2}},
+        ],
+    }
+    tags = {'matchedUser': {'tagProblemCounts': {
+        'fundamental': [{'tagName': 'Array', 'tagSlug': 'array', 'problemsSolved': 5},
+                        {'tagName': 'String', 'tagSlug': 'string', 'problemsSolved': 9}],
+        'intermediate': [],
+        'advanced': [],
+    }}}
+
+    def fetch(self, payload, datasets=('contest', 'tags')):
+        with mock.patch.object(http_client, 'post', return_value=fake_response(200, payload)) as post:
+            results = LeetCodeService.get_secondary_stats('alice', datasets)
+        return post, results
+
+    def test_primary_query_leaves_secondary_datasets_out(self):
+        self.assertNotIn('userContestRanking', LeetCodeService.USER_PROFILE_QUERY)
+        self.assertNotIn('tagProblemCounts', LeetCodeService.USER_PROFILE_QUERY)
+
+    def test_missing_datasets_are_fetched_in_one_request(self):
+        post, results = self.fetch({'data': {**self.contest, **self.tags}})
+        self.assertEqual(post.call_count, 1)
+        query = post.call_args.kwargs['json']['query']
+        self.assertIn('userContestRankingHistory', query)
+        self.assertIn('tagProblemCounts', query)
+        self.assertEqual(results['contest']['rating'], 1650)
+        self.assertEqual([entry['title'] for entry in results['contest']['history']], ['Weekly 1'])
+        self.assertEqual([tag['tag'] for tag in results['tags']['fundamental']], ['String', 'Array'])
+
+    def test_cached_datasets_are_not_requested_again(self):
+        self.fetch({'data': self.contest}, ('contest',))
+        post, results = self.fetch({'data': self.tags})
+        self.assertNotIn('userContestRanking', post.call_args.kwargs['json']['query'])
+        self.assertEqual(results['contest']['attended_contests'], 2)
+        self.assertIn('fundamental', results['tags'])
+
+    def test_errors_are_attributed_to_their_dataset(self):
+        errors = [{'message': 'contest service down', 'path': ['userContestRanking']}]
+        _, results = self.fetch({'data': {**self.tags, 'userContestRanking': None}, 'errors': errors})
+        self.assertIn('contest service down', results['contest']['error'])
+        self.assertNotIn('error', results['tags'])
+        self.assertIsNone(LeetCodeService.secondary_cache.get('contest:alice'))
+        self.assertIsNotNone(LeetCodeService.secondary_cache.get('tags:alice'))
+
+    def test_snapshot_copy_is_served_within_the_ttl(self):
+        company = User.objects.create(username='acme', role='company')
+        employee = Employee.objects.create(company=company, name='Alice', leetcode_username='alice',
+                                           leetcode_url='https://leetcode.com/u/alice/')
+        history = LeetCodeAnalysisHistory.objects.create(
+            company=company, employee_identifier='alice', leetcode_username='alice', full_stats={},
+        )
+        with mock.patch.object(http_client, 'post', return_value=fake_response(200, {'data': self.contest})):
+            employee_sync_service.load_secondary_stats(employee, history, ['contest'])
+        history.refresh_from_db()
+        self.assertEqual(history.full_stats['secondary']['contest']['data']['rating'], 1650)
+
+        with mock.patch.object(LeetCodeService, 'get_secondary_stats') as get_secondary_stats:
+            results = employee_sync_service.load_secondary_stats(employee, history, ['contest'])
+        get_secondary_stats.assert_not_called()
+        self.assertEqual(results['contest']['attended_contests'], 2)
+
+
+class StandInTests(LeetCodeServiceTestCase):
+    """LeetCodeService and http_client against the upstream_standin LeetCode server on an ephemeral port."""
+
+    fixtures_by_name = None
+
+    def start(self, host_settings=None, **options):
+        if StandInTests.fixtures_by_name is None:
+            StandInTests.fixtures_by_name = upstream_standin.Command()._load_fixtures(upstream_standin.DEFAULT_FIXTURES)
+        options = {
+            'latency': 0, 'jitter': 0, 'error_rate': 0, 'burst_every': 0, 'burst_length': 1,
+            'retry_after': 1, 'missing_prefix': 'missing', **options,
+        }
+        self.upstream = upstream_standin.Upstream('leetcode', StandInTests.fixtures_by_name, options, True)
+        handler = type('LeetcodeStandInHandler', (upstream_standin.StandInHandler,), {'upstream': self.upstream})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        url = f'http://127.0.0.1:{server.server_port}/graphql'
+        self.host = http_client.host_key(url)
+        for target in (http_client._sessions, http_client._stats, http_client._buckets, http_client._breakers):
+            patch = mock.patch.dict(target)
+            patch.start()
+            self.addCleanup(patch.stop)
+        patches = [
+            mock.patch.dict(http_client.HOST_SETTINGS, {self.host: {'timeout': 5, **(host_settings or {})}}),
+            mock.patch.object(LeetCodeService, 'BASE_URL', url),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return url
+
+    def test_batched_aliases_are_answered_per_user(self):
+        self.start()
+        results = LeetCodeService.get_many_user_stats(['alice', 'missing-bob', 'carol'], batch_size=3,
+                                                      max_concurrency=1)
+        self.assertEqual(results['alice']['total_solved'], 412)
+        self.assertEqual(results['carol']['total_solved'], 412)
+        self.assertFalse(results['missing-bob']['exists'])
+        self.assertEqual(self.upstream.stats(), {'requests': 1, 'statuses': {200: 1}})
+
+    def test_retry_after_is_honoured_during_a_429_burst(self):
+        # Every second request is rate limited
+        self.start({'max_retries': 2}, burst_every=2, burst_length=1, retry_after=3)
+        with mock.patch('api.services.http_client.time.sleep') as sleep:
+            LeetCodeService.get_user_stats('alice')
+            result = LeetCodeService.get_user_stats('bob')
+        # time.sleep is patched module-wide, so the stand-in's zero latency sleeps show up too
+        self.assertEqual(sleep.call_args_list.count(mock.call(3.0)), 1)
+        self.assertEqual(result['total_solved'], 412)
+        self.assertEqual(self.upstream.stats()['statuses'], {200: 2, 429: 1})
+
+    def test_last_429_is_returned_once_retries_run_out(self):
+        self.start({'max_retries': 2}, burst_every=3, burst_length=3, retry_after=2)
+        with mock.patch('api.services.http_client.time.sleep') as sleep:
+            result = LeetCodeService.get_user_stats('alice')
+        self.assertEqual(sleep.call_args_list.count(mock.call(2.0)), 2)
+        self.assertIn('429', result['error'])
+        self.assertEqual(self.upstream.stats()['statuses'], {429: 3})
+
+    def test_slow_upstream_is_hedged(self):
+        url = self.start({'hedge_after': 0.05}, latency=200)
+        response = http_client.post(url, json={'query': '', 'variables': {}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(http_client.get_pool_stats()[self.host]['hedges_fired'], 1)
+
+    def test_no_hedge_without_a_rate_limit_token(self):
+        url = self.start({'hedge_after': 0.05, 'rate_per_second': 0.001, 'burst': 1}, latency=200)
+        response = http_client.post(url, json={'query': '', 'variables': {}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(http_client.get_pool_stats()[self.host]['hedges_fired'], 0)
+        self.assertEqual(self.upstream.stats()['requests'], 1)
+
+
+class CircuitBreakerTests(TestCase):
+    """Breaker transitions, shared state and how http_client feeds it."""
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch('api.services.resilience.time', wraps=time_module)
+        self.time = clock.start()
+        self.addCleanup(clock.stop)
+        self.time.monotonic.side_effect = lambda: self.now
+        self.time.time.side_effect = lambda: 1_700_000_000 + self.now
+
+    def test_opens_half_opens_and_closes(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+        breaker.record_failure()
+        self.assertTrue(breaker.is_closed)
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow_request())
+
+        self.now += 30
+        # Half-open: exactly one trial request gets through
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.as_dict()['state'], CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertTrue(breaker.is_closed)
+        self.assertTrue(breaker.allow_request())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+        self.now += 30
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertEqual(breaker.as_dict()['times_opened'], 2)
+
+    def test_open_state_is_shared_across_processes(self):
+        store = PersistentCache('circuit_breaker_test')
+        tripped = CircuitBreaker(1, 30, shared=store, name='leetcode.com')
+        tripped.record_failure()
+
+        # A breaker in another process starts closed but adopts the recorded open circuit
+        other = CircuitBreaker(1, 30, shared=store, name='leetcode.com')
+        self.assertTrue(other.is_open)
+        self.assertFalse(other.allow_request())
+        self.assertGreater(other.as_dict()['retry_in_seconds'], 0)
+
+        self.now += 30
+        self.assertTrue(tripped.allow_request())
+        tripped.record_success()
+        self.assertIsNone(store.get('leetcode.com'))
+
+    def test_retry_after_header(self):
+        self.assertEqual(retry_after_seconds(fake_response(429, headers={'Retry-After': '7'})), 7)
+        self.assertEqual(retry_after_seconds(fake_response(429, headers={'Retry-After': '600'})), 60)
+        self.assertIsNone(retry_after_seconds(fake_response(429, headers={'Retry-After': 'soon'})))
+        self.assertIsNone(retry_after_seconds(fake_response(429)))
+
+
+class HttpClientRetryTests(TestCase):
+    """The retry loop honours Retry-After and charges the breaker once per logical request."""
+
+    url = 'https://upstream.test/graphql'
+
+    def setUp(self):
+        settings = {'rate_per_second': 0, 'max_retries': 2, 'breaker_failures': 2, 'breaker_reset': 30}
+        patches = [
+            mock.patch.dict(http_client.HOST_SETTINGS, {'upstream.test': settings}),
+            mock.patch.dict(http_client._breakers, clear=True),
+            mock.patch('api.services.http_client.time.sleep'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.session = mock.Mock()
+        get_session = mock.patch('api.services.http_client.get_session', return_value=self.session)
+        get_session.start()
+        self.addCleanup(get_session.stop)
+
+    def test_retry_after_is_honoured(self):
+        self.session.request.side_effect = [
+            fake_response(429, headers={'Retry-After': '3'}),
+            fake_response(200),
+        ]
+        response = http_client.post(self.url, json={})
+        self.assertEqual(response.status_code, 200)
+        http_client.time.sleep.assert_called_once_with(3.0)
+        self.assertTrue(http_client.get_breaker('upstream.test').is_closed)
+
+    def test_one_failure_per_exhausted_request(self):
+        self.session.request.return_value = fake_response(503)
+        self.assertEqual(http_client.post(self.url, json={}).status_code, 503)
+        self.assertEqual(self.session.request.call_count, 3)
+        state = http_client.get_breaker_state(self.url)
+        self.assertEqual(state['consecutive_failures'], 1)
+        self.assertEqual(state['state'], CircuitBreaker.CLOSED)
+
+        http_client.post(self.url, json={})
+        self.assertEqual(http_client.get_breaker_state(self.url)['state'], CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            http_client.post(self.url, json={})
+
+
+class DeadlinePendingTests(TestCase):
+    """Fetches cut short by the request deadline report 'pending' instead of failing."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='dev', role='jobseeker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.timeout = DeadlineExceeded('Request deadline exceeded')
+
+    def test_leetcode_returns_pending(self):
+        with mock.patch.object(http_client, 'post', side_effect=self.timeout):
+            stats = LeetCodeService.get_user_stats('pending-leetcode', force_refresh=True)
+        self.assertTrue(stats['pending'])
+
+    def test_hackerrank_returns_pending(self):
+        with mock.patch.object(http_client, 'get', side_effect=self.timeout):
+            stats = HackerRankService.get_user_stats('pending-hackerrank', force_refresh=True)
+        self.assertTrue(stats['pending'])
+
+    def test_sync_views_report_pending(self):
+        profile = CodingProfile.objects.create(user=self.user, platform='hackerrank', username='pending-hackerrank')
+        with mock.patch.object(http_client, 'get', side_effect=self.timeout), \
+                mock.patch.object(HackerRankService, 'prefetch') as prefetch:
+            response = self.client.post(f'/api/coding-profiles/{profile.id}/sync/', {'force_refresh': True})
+            self.assertEqual(response.status_code, 202)
+            prefetch.assert_called_once_with(['pending-hackerrank'])
+
+            response = self.client.post('/api/coding-profiles/sync_all/', {'force_refresh': True})
+            self.assertEqual(response.json()['results'][0]['status'], 'pending')
+        profile.refresh_from_db()
+        self.assertIsNone(profile.last_synced)
+
+
+class CodingProfileSyncTests(TestCase):
+    """Whatever stats a platform returns are saved, including partial ones carrying an error note."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='dev', role='jobseeker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.profile = CodingProfile.objects.create(user=self.user, platform='leetcode', username='partial')
+        self.partial = {'username': 'partial', 'total_solved': 12, 'error': 'Could not fetch full statistics'}
+        patches = [
+            mock.patch.object(LeetCodeService, 'upstream_available', return_value=True),
+            mock.patch('api.views.coding_profile_views.queue_ai_recommendations'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_sync_saves_partial_stats(self):
+        with mock.patch.object(LeetCodeService, 'get_user_stats', return_value=self.partial):
+            response = self.client.post(f'/api/coding-profiles/{self.profile.id}/sync/')
+        self.assertEqual(response.status_code, 200)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.stats['total_solved'], 12)
+
+    def test_sync_all_saves_partial_stats(self):
+        with mock.patch.object(LeetCodeService, 'get_user_stats', return_value=self.partial):
+            response = self.client.post('/api/coding-profiles/sync_all/')
+        self.assertEqual(response.json()['results'][0]['status'], 'synced')
+
+        with mock.patch.object(LeetCodeService, 'get_user_stats', return_value=None):
+            response = self.client.post('/api/coding-profiles/sync_all/')
+        self.assertEqual(response.json()['results'][0]['status'], 'failed')
+
+
+class PersistentTierPurgeTests(TestCase):
+    """Single-flight lease rows are purged with the rest of the persistent tier."""
+
+    def test_expired_leases_are_purged(self):
+        namespace = LeetCodeService.single_flight.lease_namespace
+        CacheEntry.objects.create(namespace=namespace, key='stale', value={},
+                                  expires_at=timezone.now() - timedelta(seconds=1))
+        CacheEntry.objects.create(namespace=namespace, key='live', value={},
+                                  expires_at=timezone.now() + timedelta(seconds=20))
+        self.assertEqual(purge_persistent_caches(namespace), {namespace: 1})
+        self.assertEqual(list(CacheEntry.objects.filter(namespace=namespace).values_list('key', flat=True)), ['live'])
+
+    def test_shared_payload_without_persistent_negative_tier(self):
+        with mock.patch.object(LeetCodeService.negative_cache, 'persistent', None):
+            self.assertIsNone(LeetCodeService._load_shared_payload('nobody'))
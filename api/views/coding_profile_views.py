@@ -4,7 +4,10 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from api.coding_platform_models import CodingProfile
 from api.coding_profile_serializers import CodingProfileSerializer
-from api.services.leetcode_service import LeetCodeService
+from api.services import platforms
+from api.services.recommendation_service import queue_ai_recommendations
+from api.services.deadline import deadline
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,22 +22,81 @@ class CodingProfileViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @staticmethod
+    def _flag(request, name):
+        return str(request.data.get(name, '')).lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def _save_stats(profile, adapter, stats):
+        profile.stats = stats
+        profile.last_synced = timezone.now()
+        profile.save()
+        if adapter.ai_recommendations:
+            queue_ai_recommendations(stats, profile=profile)
+            profile.refresh_from_db(fields=['analysis'])
+
     @action(detail=True, methods=['post'])
     def sync(self, request, pk=None):
         profile = self.get_object()
-        if profile.platform != 'leetcode':
-            return Response({'error': 'Only LeetCode syncing is supported currently'}, 
+        adapter = platforms.get_adapter(profile.platform)
+        if adapter is None:
+            return Response({'error': f'Syncing {profile.get_platform_display()} profiles is not supported'},
                           status=status.HTTP_400_BAD_REQUEST)
         
+        if not adapter.upstream_available():
+            return Response({'error': f'{profile.get_platform_display()} is temporarily unavailable. Please try again shortly.',
+                             'upstream': adapter.upstream_status()},
+                          status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
         try:
-            stats = LeetCodeService.get_user_stats(profile.username)
+            with deadline():
+                stats = adapter.fetch_stats(profile.username,
+                                            wait_for_ai=self._flag(request, 'wait_for_ai'),
+                                            force_refresh=self._flag(request, 'force_refresh'))
+            if stats and stats.get('pending'):
+                # Out of time: warm the cache in the background so the next sync returns quickly
+                adapter.warm_cache([profile.username])
+                return Response({'message': 'Sync is still running; try again shortly', 'status': 'pending'},
+                              status=status.HTTP_202_ACCEPTED)
+            # Partial stats (e.g. "Could not fetch full statistics") are still saved
             if stats:
-                profile.stats = stats
-                profile.last_synced = timezone.now()
-                profile.save()
+                self._save_stats(profile, adapter, stats)
                 return Response(CodingProfileSerializer(profile).data)
-            return Response({'error': 'Failed to fetch stats from LeetCode'}, 
+            return Response({'error': f'Failed to fetch stats from {profile.get_platform_display()}'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Error syncing profile: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'])
+    def sync_all(self, request):
+        """Syncs all of the user's profiles; platforms are fetched concurrently."""
+        profiles = [p for p in self.get_queryset() if platforms.get_adapter(p.platform)]
+        if not profiles:
+            return Response({'results': []})
+
+        try:
+            with deadline():
+                results = platforms.fetch_many(
+                    [(p.platform, p.username) for p in profiles],
+                    wait_for_ai=self._flag(request, 'wait_for_ai'),
+                    force_refresh=self._flag(request, 'force_refresh'),
+                )
+
+            response = []
+            for profile, stats in zip(profiles, results):
+                adapter = platforms.get_adapter(profile.platform)
+                if stats and stats.get('pending'):
+                    adapter.warm_cache([profile.username])
+                    response.append({'id': profile.id, 'platform': profile.platform, 'status': 'pending'})
+                elif stats:
+                    self._save_stats(profile, adapter, stats)
+                    response.append({'id': profile.id, 'platform': profile.platform, 'status': 'synced',
+                                     'profile': CodingProfileSerializer(profile).data})
+                else:
+                    response.append({'id': profile.id, 'platform': profile.platform, 'status': 'failed',
+                                     'error': f'Failed to fetch stats from {profile.get_platform_display()}'})
+            return Response({'results': response})
+        except Exception as e:
+            logger.error(f"Error syncing profiles: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -4,6 +4,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from api.coding_platform_models import Employee, LeetCodeAnalysisHistory
 from api.services.leetcode_service import LeetCodeService
+from api.services.deadline import deadline
 from django.http import HttpResponse
 import csv
 import logging
@@ -52,44 +53,76 @@ class CompanyLeetCodeAnalysisView(APIView):
                 except Exception as e:
                     return Response({'error': f'Error reading CSV: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Deduplicate
-            usernames = list(set(usernames))
+            # Deduplicate, keeping the order they were submitted in
+            usernames = list(dict.fromkeys(usernames))
 
             if not usernames:
                 return Response({'error': 'No usernames provided'}, status=status.HTTP_400_BAD_REQUEST)
 
+            # Pre-check: only confirm the usernames exist, without fetching or scoring full profiles
+            validate_only = str(request.data.get('validate_only', '')).lower() in ('1', 'true', 'yes')
+            if validate_only:
+                return self._validate_usernames(usernames)
+
+            # One aliased GraphQL request per batch of users, with batches fetched concurrently
+            try:
+                # Rule-based recommendations only, unless the caller is willing to wait on the LLM
+                wait_for_ai = str(request.data.get('wait_for_ai', '')).lower() in ('1', 'true', 'yes')
+                force_refresh = str(request.data.get('force_refresh', '')).lower() in ('1', 'true', 'yes')
+                # Whatever isn't back by the request deadline is reported as pending
+                with deadline():
+                    stats_by_username = LeetCodeService.get_many_user_stats(
+                        usernames, wait_for_ai=wait_for_ai, force_refresh=force_refresh
+                    )
+            except Exception as e:
+                logger.error(f"Bulk LeetCode fetch failed: {str(e)}", exc_info=True)
+                stats_by_username = {}
+
             results = []
+            cached_negatives = []
+            pending = []
             for username in usernames:
-                try:
-                    stats = LeetCodeService.get_user_stats(username)
-                    if stats:
-                        results.append({
-                            'username': username,
-                            'stats': stats,
-                            'status': 'success'
-                        })
-                    else:
-                        results.append({
-                            'username': username,
-                            'status': 'failed',
-                            'error': 'Could not fetch stats'
-                        })
-                except Exception as e:
+                stats = stats_by_username.get(username)
+                if stats and stats.get('pending'):
+                    pending.append(username)
+                    results.append({
+                        'username': username,
+                        'status': 'pending',
+                        'error': stats['error']
+                    })
+                elif stats:
+                    result = {
+                        'username': username,
+                        'stats': stats,
+                        'status': 'success'
+                    }
+                    if stats.get('negative_cached'):
+                        # Known-bad username, rejected without asking LeetCode again
+                        result['negative_cached'] = True
+                        cached_negatives.append(username)
+                    results.append(result)
+                else:
                     results.append({
                         'username': username,
-                        'status': 'error',
-                        'error': str(e)
+                        'status': 'failed',
+                        'error': 'Could not fetch stats'
                     })
             
             # Calculate summary stats
             successful = len([r for r in results if r['status'] == 'success'])
-            failed = len(results) - successful
+            failed = len(results) - successful - len(pending)
+            
+            # Finish the pending fetches in the background so a retry is served from cache
+            LeetCodeService.prefetch(pending)
             
             return Response({
                 'results': results,
                 'total_urls': len(usernames),
                 'successful': successful,
-                'failed': failed
+                'failed': failed,
+                'pending': len(pending),
+                'cached_negatives': cached_negatives,
+                'upstream': LeetCodeService.upstream_status(),
             })
         except Exception as e:
             logger.error(f"Analysis error: {str(e)}", exc_info=True)
@@ -98,6 +131,27 @@ class CompanyLeetCodeAnalysisView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _validate_usernames(self, usernames):
+        with deadline():
+            checks = LeetCodeService.get_many_user_stats(usernames, fetch_profile='minimal')
+
+        results = []
+        for username in usernames:
+            check = checks.get(username) or {}
+            result = {'username': username, 'exists': check.get('exists')}
+            if check.get('error'):
+                result['error'] = check['error']
+            results.append(result)
+
+        return Response({
+            'results': results,
+            'total_urls': len(usernames),
+            'valid': len([r for r in results if r['exists'] is True]),
+            'invalid': len([r for r in results if r['exists'] is False]),
+            'unknown': len([r for r in results if r['exists'] is None]),
+            'upstream': LeetCodeService.upstream_status(),
+        })
+
 class CompanyLeetCodeExportView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -4,7 +4,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from django.utils import timezone
 from datetime import datetime
-from api.coding_platform_models import Employee, EmployeeGoal, LeetCodeAnalysisHistory
+from api.coding_platform_models import Employee, EmployeeGoal, LeetCodeLatestSnapshot
+from api.services.leetcode_service import LeetCodeService
+from api.services.deadline import deadline
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,6 +18,9 @@ class EmployeeGoalViewSet(APIView):
     """
     permission_classes = [IsAuthenticated]
 
+    # Metrics a 'standard' LeetCode fetch can provide when the employee has no history yet
+    LIVE_START_METRICS = ('total_solved', 'easy_solved', 'medium_solved', 'hard_solved', 'acceptance_rate', 'ranking')
+
     def get(self, request, employee_id=None):
         """Get goals for an employee or all employees."""
         try:
@@ -116,15 +121,21 @@ class EmployeeGoalViewSet(APIView):
                 )
             
             # Get current value from latest history
-            latest = LeetCodeAnalysisHistory.objects.filter(
+            latest = LeetCodeLatestSnapshot.objects.filter(
                 company=request.user,
                 employee_identifier=employee.leetcode_username
-            ).order_by('-analyzed_at').first()
+            ).first()
             
             # Determine start value based on metric type
             start_value = 0
+            metric_type = request.data.get('metric_type')
+            if not latest and metric_type in self.LIVE_START_METRICS:
+                # Never synced yet: read the current counts live, without the calendar or scoring
+                with deadline():
+                    current = LeetCodeService.get_user_stats(employee.leetcode_username, fetch_profile='standard')
+                if current and current.get('exists'):
+                    start_value = current.get(metric_type, 0)
             if latest:
-                metric_type = request.data.get('metric_type')
                 if metric_type == 'total_solved':
                     start_value = latest.total_solved
                 elif metric_type == 'easy_solved':
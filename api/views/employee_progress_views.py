@@ -2,12 +2,15 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from django.db.models import Q, Avg, Max, Min, Count, F, Sum
+from django.db.models import Q, Avg, Max, Min, Count, F, Sum, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, Lag, NullIf
 from django.utils import timezone
 from datetime import timedelta
-from api.coding_platform_models import Employee, EmployeeGoal, LeetCodeAnalysisHistory
+from api.coding_platform_models import Employee, LeetCodeAnalysisHistory, LeetCodeLatestSnapshot
 from api.services.leetcode_service import LeetCodeService
 from api.services.coding_profile_analysis_service import CodingProfileAnalysisService
+from api.services import employee_sync_service
+from api.services.deadline import deadline
 from urllib.parse import urlparse
 import logging
 
@@ -29,6 +32,53 @@ def extract_username_from_leetcode_url(url):
         return None
 
 
+# Timeline columns and their deltas against the previous snapshot
+TIMELINE_METRICS = (
+    ('total_solved', 'total_solved_change'),
+    ('easy_solved', 'easy_solved_change'),
+    ('medium_solved', 'medium_solved_change'),
+    ('hard_solved', 'hard_solved_change'),
+    ('problem_solving_score', 'score_change'),
+    ('ranking', 'ranking_change'),
+    ('acceptance_rate', 'acceptance_rate_change'),
+    ('current_streak', 'streak_change'),
+)
+
+
+def snapshot_change(field, lower_is_better=False):
+    """
+    Change in `field` since the employee's previous snapshot, via LAG() over analyzed_at;
+    0 for the first snapshot. With lower_is_better (ranking) an improvement is positive.
+    """
+    previous = Window(Lag(field), order_by=F('analyzed_at').asc())
+    change = previous - F(field) if lower_is_better else F(field) - previous
+    output_field = LeetCodeAnalysisHistory._meta.get_field(field).__class__()
+    return Coalesce(change, Value(0), output_field=output_field)
+
+
+def latest_snapshots(company, since=None):
+    """Latest snapshot of each of the company's active employees, if taken on or after `since`."""
+    snapshots = LeetCodeLatestSnapshot.objects.filter(
+        company=company,
+        employee_identifier__in=Employee.objects.filter(company=company, is_active=True).values('leetcode_username'),
+    )
+    if since is not None:
+        snapshots = snapshots.filter(analyzed_at__gte=since)
+    return snapshots
+
+
+def with_employee_columns(snapshots, company):
+    """Annotates snapshots with the matching active employee's id, name and team."""
+    employee = Employee.objects.filter(
+        company=company, is_active=True, leetcode_username=OuterRef('employee_identifier')
+    )
+    return snapshots.annotate(
+        employee_pk=Subquery(employee.values('id')[:1]),
+        employee_name=Subquery(employee.values('name')[:1]),
+        employee_team=Subquery(employee.values('team')[:1]),
+    )
+
+
 class EmployeeViewSet(APIView):
     """
     Manage employees for problem-solving progress tracking.
@@ -45,18 +95,22 @@ class EmployeeViewSet(APIView):
             if team:
                 employees = employees.filter(team=team)
             
-            # Get latest stats for each employee
+            # Latest snapshot columns and goal counts come back as annotations, so the listing
+            # costs the same number of queries however many employees there are
+            latest_history = LeetCodeLatestSnapshot.objects.filter(
+                company=request.user,
+                employee_identifier=OuterRef('leetcode_username')
+            )
+            employees = employees.annotate(
+                latest_total_solved=Subquery(latest_history.values('total_solved')[:1]),
+                latest_problem_solving_score=Subquery(latest_history.values('problem_solving_score')[:1]),
+                latest_analyzed_at=Subquery(latest_history.values('analyzed_at')[:1]),
+                active_goals=Count('goals', filter=Q(goals__is_active=True)),
+                achieved_goals=Count('goals', filter=Q(goals__achieved_at__isnull=False)),
+            )
+            
             employee_data = []
             for employee in employees:
-                latest_history = LeetCodeAnalysisHistory.objects.filter(
-                    company=request.user,
-                    employee_identifier=employee.leetcode_username
-                ).order_by('-analyzed_at').first()
-                
-                # Get active goals
-                active_goals = employee.goals.filter(is_active=True).count()
-                achieved_goals = employee.goals.filter(achieved_at__isnull=False).count()
-                
                 employee_data.append({
                     'id': str(employee.id),
                     'name': employee.name,
@@ -72,12 +126,12 @@ class EmployeeViewSet(APIView):
                     'next_sync': employee.next_sync.isoformat() if employee.next_sync else None,
                     'notes': employee.notes,
                     'latest_stats': {
-                        'total_solved': latest_history.total_solved if latest_history else 0,
-                        'problem_solving_score': latest_history.problem_solving_score if latest_history else 0,
-                        'analyzed_at': latest_history.analyzed_at.isoformat() if latest_history else None,
-                    } if latest_history else None,
-                    'active_goals': active_goals,
-                    'achieved_goals': achieved_goals,
+                        'total_solved': employee.latest_total_solved,
+                        'problem_solving_score': employee.latest_problem_solving_score,
+                        'analyzed_at': employee.latest_analyzed_at.isoformat(),
+                    } if employee.latest_analyzed_at else None,
+                    'active_goals': employee.active_goals,
+                    'achieved_goals': employee.achieved_goals,
                     'created_at': employee.created_at.isoformat(),
                 })
             
@@ -118,6 +172,19 @@ class EmployeeViewSet(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            # Creating an employee doesn't call LeetCode unless the caller asks for validate_username:
+            # then usernames LeetCode doesn't know are rejected (only the username field is fetched).
+            # If LeetCode can't be reached we still create the employee.
+            validate_username = str(request.data.get('validate_username', '')).lower() in ('1', 'true', 'yes')
+            if validate_username:
+                with deadline():
+                    check = LeetCodeService.get_user_stats(leetcode_username, fetch_profile='minimal')
+                if check and check.get('exists') is False:
+                    return Response(
+                        {"error": check['error']},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            
             # Create employee
             employee = Employee.objects.create(
                 company=request.user,
@@ -266,84 +333,51 @@ class EmployeeProgressView(APIView):
                         status=status.HTTP_404_NOT_FOUND
                     )
                 
-                # Get historical data
+                # Timeline with per-snapshot deltas from LAG(), in one query over the scalar columns only
                 history = LeetCodeAnalysisHistory.objects.filter(
                     company=request.user,
                     employee_identifier=employee.leetcode_username
                 ).order_by('analyzed_at')
+                timeline = list(history.annotate(**{
+                    change: snapshot_change(field, lower_is_better=(field == 'ranking'))
+                    for field, change in TIMELINE_METRICS
+                }).values('analyzed_at', *(name for pair in TIMELINE_METRICS for name in pair)))
                 
-                # Calculate progress metrics
-                progress_data = []
-                previous_stats = None
-                
-                for record in history:
-                    if previous_stats:
-                        progress_data.append({
-                            'date': record.analyzed_at.isoformat(),
-                            'total_solved': record.total_solved,
-                            'total_solved_change': record.total_solved - previous_stats['total_solved'],
-                            'easy_solved': record.easy_solved,
-                            'easy_solved_change': record.easy_solved - previous_stats['easy_solved'],
-                            'medium_solved': record.medium_solved,
-                            'medium_solved_change': record.medium_solved - previous_stats['medium_solved'],
-                            'hard_solved': record.hard_solved,
-                            'hard_solved_change': record.hard_solved - previous_stats['hard_solved'],
-                            'problem_solving_score': record.problem_solving_score,
-                            'score_change': record.problem_solving_score - previous_stats['problem_solving_score'],
-                            'ranking': record.ranking,
-                            'ranking_change': previous_stats['ranking'] - record.ranking,  # Lower is better
-                            'acceptance_rate': record.acceptance_rate,
-                            'acceptance_rate_change': record.acceptance_rate - previous_stats['acceptance_rate'],
-                            'current_streak': record.current_streak,
-                            'streak_change': record.current_streak - previous_stats['current_streak'],
-                        })
-                    else:
-                        progress_data.append({
-                            'date': record.analyzed_at.isoformat(),
-                            'total_solved': record.total_solved,
-                            'total_solved_change': 0,
-                            'easy_solved': record.easy_solved,
-                            'easy_solved_change': 0,
-                            'medium_solved': record.medium_solved,
-                            'medium_solved_change': 0,
-                            'hard_solved': record.hard_solved,
-                            'hard_solved_change': 0,
-                            'problem_solving_score': record.problem_solving_score,
-                            'score_change': 0,
-                            'ranking': record.ranking,
-                            'ranking_change': 0,
-                            'acceptance_rate': record.acceptance_rate,
-                            'acceptance_rate_change': 0,
-                            'current_streak': record.current_streak,
-                            'streak_change': 0,
-                        })
-                    
-                    previous_stats = {
-                        'total_solved': record.total_solved,
-                        'easy_solved': record.easy_solved,
-                        'medium_solved': record.medium_solved,
-                        'hard_solved': record.hard_solved,
-                        'problem_solving_score': record.problem_solving_score,
-                        'ranking': record.ranking,
-                        'acceptance_rate': record.acceptance_rate,
-                        'current_streak': record.current_streak,
-                    }
+                progress_data = [
+                    {'date': row['analyzed_at'].isoformat(), **{name: row[name] for pair in TIMELINE_METRICS for name in pair}}
+                    for row in timeline
+                ]
                 
-                # Get latest and previous records for comparison
-                latest = history.last()
-                previous = history.order_by('-analyzed_at')[1] if history.count() > 1 else None
+                # Latest and previous records for comparison
+                latest = timeline[-1] if timeline else None
+                previous = timeline[-2] if len(timeline) > 1 else None
                 
                 # Calculate growth rates
                 growth_metrics = {}
                 if latest and previous:
-                    days_diff = (latest.analyzed_at - previous.analyzed_at).days
+                    days_diff = (latest['analyzed_at'] - previous['analyzed_at']).days
                     if days_diff > 0:
                         growth_metrics = {
-                            'total_solved_growth_rate': ((latest.total_solved - previous.total_solved) / days_diff) * 7,  # per week
-                            'score_growth_rate': ((latest.problem_solving_score - previous.problem_solving_score) / days_diff) * 7,
+                            'total_solved_growth_rate': ((latest['total_solved'] - previous['total_solved']) / days_diff) * 7,  # per week
+                            'score_growth_rate': ((latest['problem_solving_score'] - previous['problem_solving_score']) / days_diff) * 7,
                             'period_days': days_diff,
                         }
                 
+                # Contest/tag data is only fetched when asked for, e.g. ?include=contest,tags
+                secondary = None
+                include = [name.strip() for name in request.query_params.get('include', '').split(',') if name.strip()]
+                if include:
+                    unknown = [name for name in include if name not in LeetCodeService.SECONDARY_DATASETS]
+                    if unknown:
+                        return Response(
+                            {"error": f"Unknown include: {', '.join(unknown)}"},
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    with deadline():
+                        secondary = employee_sync_service.load_secondary_stats(
+                            employee, employee_sync_service.latest_snapshot(employee), include
+                        )
+                
                 return Response({
                     'employee': {
                         'id': str(employee.id),
@@ -351,18 +385,19 @@ class EmployeeProgressView(APIView):
                         'leetcode_username': employee.leetcode_username,
                     },
                     'latest_stats': {
-                        'total_solved': latest.total_solved if latest else 0,
-                        'problem_solving_score': latest.problem_solving_score if latest else 0,
-                        'analyzed_at': latest.analyzed_at.isoformat() if latest else None,
+                        'total_solved': latest['total_solved'],
+                        'problem_solving_score': latest['problem_solving_score'],
+                        'analyzed_at': latest['analyzed_at'].isoformat(),
                     } if latest else None,
                     'previous_stats': {
-                        'total_solved': previous.total_solved if previous else 0,
-                        'problem_solving_score': previous.problem_solving_score if previous else 0,
-                        'analyzed_at': previous.analyzed_at.isoformat() if previous else None,
+                        'total_solved': previous['total_solved'],
+                        'problem_solving_score': previous['problem_solving_score'],
+                        'analyzed_at': previous['analyzed_at'].isoformat(),
                     } if previous else None,
                     'progress_timeline': progress_data,
                     'growth_metrics': growth_metrics,
-                    'total_records': history.count(),
+                    'total_records': len(timeline),
+                    'secondary': secondary,
                 }, status=status.HTTP_200_OK)
             else:
                 # All employees summary
@@ -372,32 +407,34 @@ class EmployeeProgressView(APIView):
                 days_back = int(request.query_params.get('days', 30))
                 start_date = timezone.now() - timedelta(days=days_back)
                 
+                # Latest snapshot in the window and the one before it (at any age) for every
+                # employee, in a single query
+                previous = LeetCodeAnalysisHistory.objects.filter(
+                    company=request.user,
+                    employee_identifier=OuterRef('employee_identifier'),
+                    analyzed_at__lt=OuterRef('analyzed_at')
+                ).order_by('-analyzed_at')
+                snapshots = with_employee_columns(latest_snapshots(request.user, since=start_date), request.user).annotate(
+                    previous_total_solved=Coalesce(Subquery(previous.values('total_solved')[:1]), 0),
+                    previous_score=Coalesce(Subquery(previous.values('problem_solving_score')[:1]), 0),
+                ).order_by('employee_name', 'employee_identifier')
+                
                 summary = []
-                for employee in employees:
-                    latest = LeetCodeAnalysisHistory.objects.filter(
-                        company=request.user,
-                        employee_identifier=employee.leetcode_username,
-                        analyzed_at__gte=start_date
-                    ).order_by('-analyzed_at').first()
-                    
-                    previous = LeetCodeAnalysisHistory.objects.filter(
-                        company=request.user,
-                        employee_identifier=employee.leetcode_username,
-                        analyzed_at__lt=latest.analyzed_at if latest else timezone.now()
-                    ).order_by('-analyzed_at').first() if latest else None
-                    
-                    if latest:
-                        summary.append({
-                            'employee_id': str(employee.id),
-                            'employee_name': employee.name,
-                            'leetcode_username': employee.leetcode_username,
-                            'team': employee.team,
-                            'latest_total_solved': latest.total_solved,
-                            'latest_score': latest.problem_solving_score,
-                            'total_solved_change': latest.total_solved - (previous.total_solved if previous else 0),
-                            'score_change': latest.problem_solving_score - (previous.problem_solving_score if previous else 0),
-                            'last_analyzed': latest.analyzed_at.isoformat(),
-                        })
+                for latest in snapshots.values(
+                    'employee_pk', 'employee_name', 'employee_team', 'employee_identifier',
+                    'total_solved', 'problem_solving_score', 'analyzed_at', 'previous_total_solved', 'previous_score',
+                ):
+                    summary.append({
+                        'employee_id': str(latest['employee_pk']),
+                        'employee_name': latest['employee_name'],
+                        'leetcode_username': latest['employee_identifier'],
+                        'team': latest['employee_team'],
+                        'latest_total_solved': latest['total_solved'],
+                        'latest_score': latest['problem_solving_score'],
+                        'total_solved_change': latest['total_solved'] - latest['previous_total_solved'],
+                        'score_change': latest['problem_solving_score'] - latest['previous_score'],
+                        'last_analyzed': latest['analyzed_at'].isoformat(),
+                    })
                 
                 return Response({
                     'summary': summary,
@@ -435,98 +472,74 @@ class KPIDashboardView(APIView):
                     'message': 'No employees found. Add employees to start tracking KPIs.'
                 }, status=status.HTTP_200_OK)
             
-            # Get latest stats for all employees
-            latest_stats = []
-            for employee in employees:
-                latest = LeetCodeAnalysisHistory.objects.filter(
-                    company=request.user,
-                    employee_identifier=employee.leetcode_username,
-                    analyzed_at__gte=start_date
-                ).order_by('-analyzed_at').first()
-                
-                if latest:
-                    latest_stats.append({
-                        'employee_id': str(employee.id),
-                        'employee_name': employee.name,
-                        'team': employee.team,
-                        'total_solved': latest.total_solved,
-                        'easy_solved': latest.easy_solved,
-                        'medium_solved': latest.medium_solved,
-                        'hard_solved': latest.hard_solved,
-                        'problem_solving_score': latest.problem_solving_score,
-                        'ranking': latest.ranking,
-                        'acceptance_rate': latest.acceptance_rate,
-                        'current_streak': latest.current_streak,
-                        'analyzed_at': latest.analyzed_at,
-                    })
+            # Each employee's latest snapshot, if it falls in the period
+            latest_stats = with_employee_columns(latest_snapshots(request.user, since=start_date), request.user)
+            
+            # Growth analysis (compare with the latest snapshot of the previous period)
+            previous_start = start_date - timedelta(days=days_back)
+            previous = LeetCodeAnalysisHistory.objects.filter(
+                company=request.user,
+                employee_identifier=OuterRef('employee_identifier'),
+                analyzed_at__gte=previous_start,
+                analyzed_at__lt=start_date
+            ).order_by('-analyzed_at')
+            latest_stats = latest_stats.annotate(
+                previous_total_solved=Subquery(previous.values('total_solved')[:1]),
+                previous_score=Subquery(previous.values('problem_solving_score')[:1]),
+            )
+            
+            # Calculate aggregated KPIs; Avg skips employees without a previous snapshot
+            overview = latest_stats.aggregate(
+                employees_with_data=Count('id'),
+                total_solved_avg=Avg('total_solved'),
+                score_avg=Avg('problem_solving_score'),
+                acceptance_rate_avg=Avg('acceptance_rate'),
+                streak_avg=Avg('current_streak'),
+                employees_with_growth_data=Count('id', filter=Q(previous_total_solved__isnull=False)),
+                total_solved_growth=Avg(F('total_solved') - F('previous_total_solved')),
+                score_growth=Avg(F('problem_solving_score') - F('previous_score')),
+            )
             
-            if not latest_stats:
+            if not overview['employees_with_data']:
                 return Response({
                     'employee_count': employee_count,
                     'message': 'No analysis data found for the selected period.'
                 }, status=status.HTTP_200_OK)
             
-            # Calculate aggregated KPIs
-            total_solved_avg = sum(s['total_solved'] for s in latest_stats) / len(latest_stats)
-            score_avg = sum(s['problem_solving_score'] for s in latest_stats) / len(latest_stats)
-            acceptance_rate_avg = sum(s['acceptance_rate'] for s in latest_stats) / len(latest_stats)
-            streak_avg = sum(s['current_streak'] for s in latest_stats) / len(latest_stats)
-            
             # Team breakdown
-            teams = {}
-            for stat in latest_stats:
-                team = stat['team'] or 'Unassigned'
-                if team not in teams:
-                    teams[team] = {
-                        'employee_count': 0,
-                        'total_solved_sum': 0,
-                        'score_sum': 0,
-                        'members': []
-                    }
-                teams[team]['employee_count'] += 1
-                teams[team]['total_solved_sum'] += stat['total_solved']
-                teams[team]['score_sum'] += stat['problem_solving_score']
-                teams[team]['members'].append(stat['employee_name'])
-            
-            # Calculate team averages
-            team_metrics = []
-            for team_name, team_data in teams.items():
-                team_metrics.append({
-                    'team': team_name,
-                    'employee_count': team_data['employee_count'],
-                    'avg_total_solved': team_data['total_solved_sum'] / team_data['employee_count'],
-                    'avg_score': team_data['score_sum'] / team_data['employee_count'],
-                    'members': team_data['members'],
-                })
+            latest_stats = latest_stats.annotate(
+                team_name=Coalesce(NullIf(F('employee_team'), Value('')), Value('Unassigned'))
+            )
+            team_members = {}
+            for team_name, employee_name in latest_stats.order_by('team_name', 'employee_name').values_list('team_name', 'employee_name'):
+                team_members.setdefault(team_name, []).append(employee_name)
+            
+            team_metrics = [
+                {
+                    'team': team['team_name'],
+                    'employee_count': team['employee_count'],
+                    'avg_total_solved': team['avg_total_solved'],
+                    'avg_score': team['avg_score'],
+                    'members': team_members.get(team['team_name'], []),
+                }
+                for team in latest_stats.order_by('team_name').values('team_name').annotate(
+                    employee_count=Count('id'),
+                    avg_total_solved=Avg('total_solved'),
+                    avg_score=Avg('problem_solving_score'),
+                )
+            ]
             
             # Top performers
-            top_solvers = sorted(latest_stats, key=lambda x: x['total_solved'], reverse=True)[:5]
-            top_scores = sorted(latest_stats, key=lambda x: x['problem_solving_score'], reverse=True)[:5]
-            most_consistent = sorted(latest_stats, key=lambda x: x['current_streak'], reverse=True)[:5]
-            
-            # Growth analysis (compare with previous period)
-            previous_start = start_date - timedelta(days=days_back)
-            growth_data = []
-            for stat in latest_stats:
-                employee = employees.get(id=stat['employee_id'])
-                previous = LeetCodeAnalysisHistory.objects.filter(
-                    company=request.user,
-                    employee_identifier=employee.leetcode_username,
-                    analyzed_at__gte=previous_start,
-                    analyzed_at__lt=start_date
-                ).order_by('-analyzed_at').first()
-                
-                if previous:
-                    growth_data.append({
-                        'employee_name': stat['employee_name'],
-                        'total_solved_growth': stat['total_solved'] - previous.total_solved,
-                        'score_growth': stat['problem_solving_score'] - previous.problem_solving_score,
-                    })
+            top_columns = ('employee_name', 'employee_team', 'total_solved', 'problem_solving_score', 'current_streak')
+            top_solvers = latest_stats.order_by('-total_solved', 'employee_name').values(*top_columns)[:5]
+            top_scores = latest_stats.order_by('-problem_solving_score', 'employee_name').values(*top_columns)[:5]
+            most_consistent = latest_stats.order_by('-current_streak', 'employee_name').values(*top_columns)[:5]
             
+            growth_count = overview['employees_with_growth_data']
             avg_growth = {
-                'total_solved_growth': sum(g['total_solved_growth'] for g in growth_data) / len(growth_data) if growth_data else 0,
-                'score_growth': sum(g['score_growth'] for g in growth_data) / len(growth_data) if growth_data else 0,
-            } if growth_data else None
+                'total_solved_growth': overview['total_solved_growth'],
+                'score_growth': overview['score_growth'],
+            } if growth_count else None
             
             return Response({
                 'period': {
@@ -536,11 +549,11 @@ class KPIDashboardView(APIView):
                 },
                 'overview': {
                     'total_employees': employee_count,
-                    'employees_with_data': len(latest_stats),
-                    'avg_total_solved': round(total_solved_avg, 1),
-                    'avg_problem_solving_score': round(score_avg, 1),
-                    'avg_acceptance_rate': round(acceptance_rate_avg, 1),
-                    'avg_current_streak': round(streak_avg, 1),
+                    'employees_with_data': overview['employees_with_data'],
+                    'avg_total_solved': round(overview['total_solved_avg'], 1),
+                    'avg_problem_solving_score': round(overview['score_avg'], 1),
+                    'avg_acceptance_rate': round(overview['acceptance_rate_avg'], 1),
+                    'avg_current_streak': round(overview['streak_avg'], 1),
                 },
                 'team_metrics': team_metrics,
                 'top_performers': {
@@ -548,7 +561,7 @@ class KPIDashboardView(APIView):
                         {
                             'name': s['employee_name'],
                             'total_solved': s['total_solved'],
-                            'team': s['team'],
+                            'team': s['employee_team'],
                         }
                         for s in top_solvers
                     ],
@@ -556,7 +569,7 @@ class KPIDashboardView(APIView):
                         {
                             'name': s['employee_name'],
                             'score': s['problem_solving_score'],
-                            'team': s['team'],
+                            'team': s['employee_team'],
                         }
                         for s in top_scores
                     ],
@@ -564,15 +577,15 @@ class KPIDashboardView(APIView):
                         {
                             'name': s['employee_name'],
                             'streak': s['current_streak'],
-                            'team': s['team'],
+                            'team': s['employee_team'],
                         }
                         for s in most_consistent
                     ],
                 },
                 'growth_analysis': {
                     'avg_growth': avg_growth,
-                    'employees_with_growth_data': len(growth_data),
-                } if growth_data else None,
+                    'employees_with_growth_data': growth_count,
+                } if growth_count else None,
             }, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Error fetching KPI dashboard: {str(e)}", exc_info=True)
@@ -585,6 +598,9 @@ class KPIDashboardView(APIView):
 class SyncEmployeeView(APIView):
     """
     Manually sync an employee's LeetCode profile and save to history.
+
+    With `stale_while_revalidate`, the latest snapshot is returned immediately along with its age,
+    and a background refresh is started if it is older than the freshness window.
     """
     permission_classes = [IsAuthenticated]
 
@@ -598,10 +614,76 @@ class SyncEmployeeView(APIView):
                 )
             
             employee = Employee.objects.get(id=employee_id, company=request.user)
+            target_role = request.data.get('target_role', 'Mid-Level')
+            
+            # Serve the stored snapshot and revalidate it off the request path
+            stale_while_revalidate = str(request.data.get('stale_while_revalidate', '')).lower() in ('1', 'true', 'yes')
+            if stale_while_revalidate:
+                latest = employee_sync_service.latest_snapshot(employee)
+                if latest:
+                    fresh = employee_sync_service.is_fresh(latest)
+                    refresh_status = 'not_needed' if fresh else employee_sync_service.refresh_in_background(employee, target_role)
+                    return Response({
+                        'message': 'Returned latest snapshot',
+                        'history_id': str(latest.id),
+                        'stats': {
+                            'total_solved': latest.total_solved,
+                            'problem_solving_score': latest.problem_solving_score,
+                        },
+                        'analyzed_at': latest.analyzed_at,
+                        'snapshot_age_seconds': employee_sync_service.snapshot_age_seconds(latest),
+                        'is_stale': not fresh,
+                        'refresh_status': refresh_status,
+                        'ai_recommendations_status': (latest.analysis_data or {}).get('ai_recommendations_status'),
+                    }, status=status.HTTP_200_OK)
+                # No snapshot yet - fall through to a regular sync
+            
+            # Fail fast while LeetCode is being rate limited / erroring
+            if not LeetCodeService.upstream_available():
+                return Response(
+                    {
+                        "error": "LeetCode is temporarily unavailable. Please try again shortly.",
+                        "upstream": LeetCodeService.upstream_status(),
+                    },
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
             
             # Fetch stats
-            target_role = request.data.get('target_role', 'Mid-Level')
-            stats_result = LeetCodeService.get_user_stats(employee.leetcode_username, target_role)
+            # AI recommendations are attached in the background unless the caller asks to wait
+            wait_for_ai = str(request.data.get('wait_for_ai', '')).lower() in ('1', 'true', 'yes')
+            force_refresh = str(request.data.get('force_refresh', '')).lower() in ('1', 'true', 'yes')
+            incremental = str(request.data.get('incremental', '')).lower() in ('1', 'true', 'yes')
+            with deadline():
+                if incremental:
+                    # Probe the solved/submission totals first; skip the full fetch if nothing moved
+                    latest = employee_sync_service.latest_snapshot(employee)
+                    probe = LeetCodeService.get_user_stats(
+                        employee.leetcode_username, fetch_profile='standard', force_refresh=force_refresh
+                    )
+                    if not employee_sync_service.has_new_activity(latest, probe):
+                        employee_sync_service.mark_synced(employee)
+                        return Response({
+                            'message': 'No new activity since the last snapshot',
+                            'changed': False,
+                            'history_id': str(latest.id),
+                            'stats': {
+                                'total_solved': latest.total_solved,
+                                'problem_solving_score': latest.problem_solving_score,
+                            },
+                            'last_synced': employee.last_synced,
+                        }, status=status.HTTP_200_OK)
+                
+                stats_result = LeetCodeService.get_user_stats(
+                    employee.leetcode_username, target_role, wait_for_ai=wait_for_ai, force_refresh=force_refresh
+                )
+            
+            # Out of time: hand the sync over to the background and report it as pending
+            if stats_result and stats_result.get('pending'):
+                return Response({
+                    'message': 'Sync is still running in the background',
+                    'status': 'pending',
+                    'refresh_status': employee_sync_service.refresh_in_background(employee, target_role),
+                }, status=status.HTTP_202_ACCEPTED)
             
             if not stats_result or 'error' in stats_result:
                 error_msg = stats_result.get('error', 'Failed to fetch stats') if stats_result else 'Failed to fetch stats'
@@ -610,71 +692,20 @@ class SyncEmployeeView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Create analysis history record
-            history = LeetCodeAnalysisHistory.objects.create(
-                company=request.user,
-                employee_identifier=employee.leetcode_username,
-                leetcode_username=employee.leetcode_username,
-                leetcode_url=employee.leetcode_url,
-                total_solved=stats_result.get('total_solved', 0),
-                easy_solved=stats_result.get('easy_solved', 0),
-                medium_solved=stats_result.get('medium_solved', 0),
-                hard_solved=stats_result.get('hard_solved', 0),
-                problem_solving_score=stats_result.get('problem_solving_score', 0),
-                ranking=stats_result.get('ranking', 0),
-                acceptance_rate=stats_result.get('acceptance_rate', 0),
-                current_streak=stats_result.get('current_streak', 0),
-                max_streak=stats_result.get('max_streak', 0),
-                activity_status=stats_result.get('activity_status', 'Unknown'),
-                full_stats=stats_result,
-                analysis_data=stats_result.get('analysis', {}),
-            )
-            
-            # Update employee last_synced
-            employee.last_synced = timezone.now()
-            if employee.auto_sync_enabled:
-                if employee.sync_frequency == 'daily':
-                    employee.next_sync = timezone.now() + timedelta(days=1)
-                elif employee.sync_frequency == 'weekly':
-                    employee.next_sync = timezone.now() + timedelta(weeks=1)
-                elif employee.sync_frequency == 'monthly':
-                    employee.next_sync = timezone.now() + timedelta(days=30)
-            employee.save()
-            
-            # Update goals
-            goals = EmployeeGoal.objects.filter(employee=employee, is_active=True)
-            for goal in goals:
-                if goal.metric_type == 'total_solved':
-                    goal.current_value = stats_result.get('total_solved', 0)
-                elif goal.metric_type == 'easy_solved':
-                    goal.current_value = stats_result.get('easy_solved', 0)
-                elif goal.metric_type == 'medium_solved':
-                    goal.current_value = stats_result.get('medium_solved', 0)
-                elif goal.metric_type == 'hard_solved':
-                    goal.current_value = stats_result.get('hard_solved', 0)
-                elif goal.metric_type == 'problem_solving_score':
-                    goal.current_value = stats_result.get('problem_solving_score', 0)
-                elif goal.metric_type == 'acceptance_rate':
-                    goal.current_value = stats_result.get('acceptance_rate', 0)
-                elif goal.metric_type == 'current_streak':
-                    goal.current_value = stats_result.get('current_streak', 0)
-                elif goal.metric_type == 'ranking':
-                    goal.current_value = stats_result.get('ranking', 0)
-                
-                # Check if goal achieved
-                if goal.is_achieved and not goal.achieved_at:
-                    goal.achieved_at = timezone.now()
-                
-                goal.save()
+            # Save the snapshot and update the employee's schedule and goals
+            history, goals_updated, _ = employee_sync_service.record_snapshot(employee, stats_result)
+            history.refresh_from_db(fields=['analysis_data'])
             
             return Response({
                 'message': 'Employee synced successfully',
+                'changed': True,
                 'history_id': str(history.id),
                 'stats': {
                     'total_solved': history.total_solved,
                     'problem_solving_score': history.problem_solving_score,
                 },
-                'goals_updated': goals.count(),
+                'goals_updated': goals_updated,
+                'ai_recommendations_status': history.analysis_data.get('ai_recommendations_status'),
             }, status=status.HTTP_200_OK)
         except Employee.DoesNotExist:
             return Response(